@@ -1,4 +0,0 @@
-# app/prompts/__init__.py
-from .food_analysis import get_system_prompt
-
-__all__ = ['get_system_prompt']
\ No newline at end of file
@@ -4,15 +4,20 @@ import logging
 import asyncio
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from app.handlers import router
+from app.handlers import create_router
 from app.locales.base import localization_manager
 from app.database import Database
 from app.services import UserService
+from app.services.analysis_cache import analysis_cache
+from app.services.usage_ledger import usage_ledger
 
 # Импорты для middleware
 from app.middlewares.limit_middleware import LimitMiddleware
+from app.middlewares.album_middleware import AlbumMiddleware
 
 def setup_logging():
     """Настройка логирования"""
@@ -29,6 +34,30 @@ def setup_localization():
     localization_manager.default_lang = default_lang
     logging.getLogger(__name__).info(f"Локализация установлена: {default_lang}")
 
+def create_bot(token: str) -> Bot:
+    """Создает бота; TELEGRAM_API_URL направляет его на другой сервер Bot API (например, мок из tests/mocks)"""
+    api_url = os.getenv('TELEGRAM_API_URL')
+    if api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_url.rstrip('/')))
+        return Bot(token=token, session=session)
+    return Bot(token=token)
+
+def create_dispatcher() -> Dispatcher:
+    """Создает диспетчер со всеми роутерами (используется и в benchmarks).
+    
+    Каждый вызов собирает свое дерево роутеров и свои middleware,
+    поэтому диспетчеров можно создать сколько угодно.
+    """
+    dp = Dispatcher(storage=MemoryStorage())
+    
+    # ===== MIDDLEWARE ТОЛЬКО ДЛЯ ФОТО РОУТЕРА =====
+    # Альбом собирается до проверки лимита - одно списание на весь альбом
+    router = create_router(photo_middlewares=[AlbumMiddleware(), LimitMiddleware()])
+    
+    # ===== РЕГИСТРИРУЕМ ВСЕ РОУТЕРЫ =====
+    dp.include_router(router)
+    return dp
+
 async def main():
     """Основная функция для запуска бота"""
     # Загружаем переменные окружения
@@ -55,6 +84,11 @@ async def main():
         logger.info("✅ База данных инициализирована")
         
         user_service = UserService(database)
+        # Второй уровень кэша анализов - общая таблица в БД
+        analysis_cache.database = database
+        # Журнал расхода токенов пишется в БД пачками
+        usage_ledger.database = database
+        usage_ledger.start()
         logger.info("✅ Сервисы инициализированы")
         
     except Exception as e:
@@ -63,24 +97,12 @@ async def main():
     
     # Инициализация бота и диспетчера
     try:
-        bot = Bot(token=bot_token)
+        bot = create_bot(bot_token)
         bot.user_service = user_service
         logger.info("Бот инициализирован")
         
-        storage = MemoryStorage()
-        
-        # Создаем диспетчер
-        dp = Dispatcher(storage=storage)
-        logger.info("Диспетчер инициализирован")
-        
-        # ===== РЕГИСТРИРУЕМ MIDDLEWARE ТОЛЬКО ДЛЯ ФОТО РОУТЕРА =====
-        from app.handlers.photo_handler import router as photo_router
-        photo_router.message.middleware(LimitMiddleware())
-        logger.info("✅ Middleware лимитов подключен к фото-роутеру")
-        
-        # ===== РЕГИСТРИРУЕМ ВСЕ РОУТЕРЫ =====
-        dp.include_router(router)
-        logger.info("✅ Все роутеры зарегистрированы")
+        dp = create_dispatcher()
+        logger.info("✅ Диспетчер инициализирован, роутеры зарегистрированы")
 
         # ДОБАВЬ ЭТУ ПРОВЕРКУ ПЕРЕД запуском polling
         from app.handlers.admin_handlers import ADMIN_IDS
@@ -98,6 +120,7 @@ async def main():
         logger.error(f"Ошибка при запуске бота: {e}")
         raise
     finally:
+        await usage_ledger.close()
         if 'bot' in locals():
             await bot.session.close()
             logger.info("Сессия бота закрыта")
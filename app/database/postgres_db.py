@@ -3,6 +3,7 @@ from typing import Optional, Dict, Any, List
 import asyncpg
 import os
 import logging
+from app.services.usage_ledger import USAGE_COLUMNS, GROUP_BY_FIELDS
 
 logger = logging.getLogger(__name__)
 
@@ -100,7 +101,44 @@ class Database:
                         expires_at TIMESTAMP WITH TIME ZONE
                     )
                 ''')
-                logger.info("✅ Таблицы users и promo_codes созданы/проверены")
+
+                # Общий кэш результатов анализа для всех экземпляров бота
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS analysis_cache (
+                        cache_key VARCHAR(64) PRIMARY KEY,
+                        analysis_type VARCHAR(20) NOT NULL,
+                        content TEXT NOT NULL,
+                        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                        expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+                    )
+                ''')
+
+                # Журнал расхода токенов: только добавление, агрегаты считаются запросами
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS usage_ledger (
+                        id BIGSERIAL PRIMARY KEY,
+                        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                        user_id BIGINT,
+                        analysis_type VARCHAR(20) NOT NULL,
+                        turn SMALLINT NOT NULL,
+                        model VARCHAR(50) NOT NULL,
+                        tier VARCHAR(20) NOT NULL,
+                        prompt_tokens INTEGER NOT NULL,
+                        completion_tokens INTEGER NOT NULL,
+                        cached_tokens INTEGER NOT NULL DEFAULT 0,
+                        image_tokens INTEGER NOT NULL DEFAULT 0,
+                        latency_ms INTEGER NOT NULL,
+                        cost NUMERIC(12, 6) NOT NULL
+                    )
+                ''')
+                await conn.execute(
+                    'CREATE INDEX IF NOT EXISTS usage_ledger_created_at_idx ON usage_ledger (created_at)'
+                )
+                # Для удаления истекших записей кэша анализов
+                await conn.execute(
+                    'CREATE INDEX IF NOT EXISTS analysis_cache_expires_at_idx ON analysis_cache (expires_at)'
+                )
+                logger.info("✅ Таблицы users, promo_codes, analysis_cache и usage_ledger созданы/проверены")
         except Exception as e:
             logger.error(f"❌ Ошибка создания таблиц: {e}")
             raise
@@ -152,4 +190,73 @@ class Database:
         """Удалить все промокоды (для тестирования)"""
         pool = await self.get_pool()
         async with pool.acquire() as conn:
-            await conn.execute('DELETE FROM promo_codes')
\ No newline at end of file
+            await conn.execute('DELETE FROM promo_codes')
+
+    # МЕТОДЫ ДЛЯ КЭША АНАЛИЗОВ
+
+    async def get_cached_analysis(self, cache_key: str) -> Optional[dict]:
+        """Получить неистекший результат анализа по ключу"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT content, expires_at FROM analysis_cache
+                WHERE cache_key = $1 AND expires_at > NOW()
+            ''', cache_key)
+            return dict(row) if row else None
+
+    async def save_cached_analysis(self, cache_key: str, analysis_type: str, content: str, ttl_seconds: int):
+        """Сохранить результат анализа в общий кэш"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO analysis_cache (cache_key, analysis_type, content, expires_at)
+                VALUES ($1, $2, $3, NOW() + make_interval(secs => $4))
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    content = EXCLUDED.content,
+                    created_at = NOW(),
+                    expires_at = EXCLUDED.expires_at
+            ''', cache_key, analysis_type, content, float(ttl_seconds))
+
+    async def purge_analysis_cache(self) -> int:
+        """Удалить все записи кэша анализов"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute('DELETE FROM analysis_cache')
+            return int(result.split()[-1])
+
+    async def purge_expired_analysis_cache(self) -> int:
+        """Удалить истекшие записи кэша анализов"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute('DELETE FROM analysis_cache WHERE expires_at < NOW()')
+            return int(result.split()[-1])
+
+    # МЕТОДЫ ДЛЯ ЖУРНАЛА РАСХОДА
+
+    async def insert_usage_records(self, records: List[tuple]):
+        """Добавить пачку записей журнала расхода одним COPY"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            await conn.copy_records_to_table('usage_ledger', records=records, columns=list(USAGE_COLUMNS))
+
+    async def get_usage_summary(self, group_by: str, since) -> List[dict]:
+        """Расход с момента since в разрезе group_by (поле из GROUP_BY_FIELDS)"""
+        if group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"Неизвестный разрез: {group_by}")
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f'''
+                SELECT {group_by} AS key,
+                       COUNT(*) AS requests,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(completion_tokens) AS completion_tokens,
+                       SUM(cached_tokens) AS cached_tokens,
+                       SUM(image_tokens) AS image_tokens,
+                       SUM(cost)::float AS cost,
+                       AVG(latency_ms)::float AS avg_latency_ms
+                FROM usage_ledger
+                WHERE created_at >= $1
+                GROUP BY {group_by}
+                ORDER BY cost DESC
+            ''', since)
+            return [dict(row) for row in rows]
@@ -1,17 +1,38 @@
 # app/handlers/__init__.py
 from aiogram import Router
 
-router = Router()
-
 from .promo_handlers import router as promo_router
 from .admin_handlers import router as admin_router
 from .photo_handler import router as photo_router  
 from .basic_commands import router as basic_router
 
-# Промокоды ДОЛЖНЫ БЫТЬ ПЕРВЫМИ
-router.include_router(promo_router)
-router.include_router(admin_router)
-router.include_router(photo_router)
-router.include_router(basic_router)
 
-__all__ = ['router']
\ No newline at end of file
+def copy_router(source: Router) -> Router:
+    """Новый Router с теми же обработчиками, что зарегистрированы на source.
+    
+    Роутеры модулей служат только шаблоном: в диспетчер попадают копии,
+    поэтому дерево можно собирать для любого числа диспетчеров.
+    """
+    router = Router(name=source.name)
+    for name, observer in source.observers.items():
+        router.observers[name].handlers.extend(observer.handlers)
+    return router
+
+
+def create_router(photo_middlewares: list = ()) -> Router:
+    """Собирает свежее дерево роутеров; photo_middlewares подключаются к фото-роутеру"""
+    router = Router()
+    
+    photo = copy_router(photo_router)
+    for middleware in photo_middlewares:
+        photo.message.middleware(middleware)
+    
+    # Промокоды ДОЛЖНЫ БЫТЬ ПЕРВЫМИ
+    router.include_router(copy_router(promo_router))
+    router.include_router(copy_router(admin_router))
+    router.include_router(photo)
+    router.include_router(copy_router(basic_router))
+    return router
+
+
+__all__ = ['create_router', 'copy_router']
@@ -4,6 +4,17 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from app.services.user_service import UserService
 from app.services.promo_service import PromoService
+from app.services.analysis_cache import analysis_cache
+from app.services.photo_hash import near_duplicate_index
+from app.services.rate_limiter import rate_limiters
+from app.services.resilience import openai_breaker
+from app.services.model_router import model_router
+from app.services.refinement_engine import refinement_engine
+from app.services.usage_ledger import usage_ledger, GROUP_BY_FIELDS
+from app.services.speculative_prefetch import speculative_prefetcher
+from app.services.photo_spool import photo_spool
+from app.services.photo_size_selector import photo_size_selector
+from app.services.telegram_files import telegram_files
 from app.core.i18n import get_localization
 from app.keyboards.admin_keyboards import get_admin_panel_keyboard
 import os
@@ -205,6 +216,158 @@ async def cmd_activate_promo(message: Message):
     except Exception as e:
         await message.answer(f"❌ Ошибка: {e}")
 
+@router.message(Command("cache_stats"))
+@admin_required
+async def cmd_cache_stats(message: Message):
+    """Статистика кэша анализов"""
+    try:
+        i18n = get_localization()
+        stats = analysis_cache.get_stats()
+        phash_stats = near_duplicate_index.get_stats()
+        spool_stats = photo_spool.get_stats()
+        size_stats = photo_size_selector.get_stats(photo_spool.seconds_per_byte())
+        file_stats = telegram_files.get_stats()
+        await message.answer(i18n.get_text(
+            'admin_cache_stats',
+            entries=stats['entries'],
+            memory_hits=stats['memory_hits'],
+            db_hits=stats['db_hits'],
+            misses=stats['misses'],
+            hit_rate=f"{stats['hit_rate']:.0%}",
+            phash_entries=phash_stats['entries'],
+            phash_lookups=phash_stats['lookups'],
+            phash_saved=phash_stats['saved_calls'],
+            photos_selected=size_stats['selected'],
+            photos_downsized=size_stats['downsized'],
+            photo_downloads=spool_stats['downloads'],
+            downloaded_mb=f"{spool_stats['download_bytes'] / 1024 / 1024:.1f}",
+            saved_mb=f"{size_stats['saved_bytes'] / 1024 / 1024:.1f}",
+            saved_seconds=f"{size_stats['saved_seconds']:.1f}",
+            spool_hits=spool_stats['memory_hits'] + spool_stats['disk_hits'],
+            path_hits=file_stats['path_hits'],
+            path_misses=file_stats['path_misses']
+        ))
+        
+    except Exception as e:
+        await message.answer(f"❌ Ошибка: {e}")
+
+@router.message(Command("cache_purge"))
+@admin_required
+async def cmd_cache_purge(message: Message):
+    """Очистка кэша анализов: /cache_purge"""
+    try:
+        i18n = get_localization()
+        removed = await analysis_cache.purge()
+        near_duplicate_index.clear()
+        await message.answer(i18n.get_text('admin_cache_purged', count=removed))
+        
+    except Exception as e:
+        await message.answer(f"❌ Ошибка: {e}")
+
+@router.message(Command("gpt_status"))
+@admin_required
+async def cmd_gpt_status(message: Message):
+    """Состояние подключения к OpenAI: предохранитель, лимиты и модели"""
+    try:
+        i18n = get_localization()
+        breaker = openai_breaker.get_state()
+        limits = "\n".join(
+            i18n.get_text(
+                'admin_gpt_limits_line',
+                model=model,
+                requests_available=stats['requests_available'],
+                rpm_limit=int(stats['rpm_limit']),
+                tokens_available=stats['tokens_available'],
+                tpm_limit=int(stats['tpm_limit']),
+                throttled=stats['throttled_by_api']
+            )
+            for model, stats in rate_limiters.get_stats().items()
+        ) or i18n.get_text('admin_gpt_limits_empty')
+        speculative = speculative_prefetcher.get_stats()
+        models = "\n".join(
+            i18n.get_text(
+                'admin_gpt_model_line',
+                tier=tier,
+                model=stats['model'],
+                requests=stats['requests'],
+                escalated=stats['escalated'],
+                avg_latency=f"{stats['avg_latency']:.1f}",
+                p95_latency=f"{stats['p95_latency']:.1f}",
+                cost=f"{stats['cost']:.4f}",
+                prompt_cache=f"{stats['prompt_cache_hit_rate']:.0%}"
+            )
+            for tier, stats in model_router.get_stats().items()
+        )
+        await message.answer(i18n.get_text(
+            'admin_gpt_status',
+            state=breaker['state'],
+            consecutive_failures=breaker['consecutive_failures'],
+            retry_in=f"{breaker['retry_in']:.0f}",
+            failures=breaker['failures'],
+            rejected=breaker['rejected'],
+            last_error=breaker['last_error'] or "-",
+            limits=limits,
+            models=models,
+            local_refinements=refinement_engine.stats['handled'],
+            speculative=i18n.get_text(
+                'admin_gpt_speculative',
+                analyses=speculative['analyses'],
+                hits=speculative['hits'],
+                wasted=speculative['wasted'],
+                hit_rate=f"{speculative['hit_rate']:.0%}",
+                waste_ratio=f"{speculative['waste_ratio']:.0%}"
+            ) if speculative['enabled'] else i18n.get_text('admin_gpt_speculative_off')
+        ))
+        
+    except Exception as e:
+        await message.answer(f"❌ Ошибка: {e}")
+
+@router.message(Command("usage"))
+@admin_required
+async def cmd_usage(message: Message):
+    """Расход токенов и стоимость: /usage [дней] [analysis_type|model|user_id|turn]"""
+    try:
+        i18n = get_localization()
+        args = message.text.split()[1:]
+        days = int(args[0]) if args else 1
+        group_by = args[1] if len(args) > 1 else "analysis_type"
+        if days <= 0 or group_by not in GROUP_BY_FIELDS:
+            await message.answer(i18n.get_text('admin_usage_usage', fields=", ".join(GROUP_BY_FIELDS)))
+            return
+        
+        rows = await usage_ledger.summary(group_by, days)
+        if not rows:
+            await message.answer(i18n.get_text('admin_usage_empty', days=days))
+            return
+        
+        lines = "\n".join(
+            i18n.get_text(
+                'admin_usage_line',
+                key=row['key'],
+                requests=row['requests'],
+                prompt_tokens=row['prompt_tokens'],
+                completion_tokens=row['completion_tokens'],
+                cached_tokens=row['cached_tokens'],
+                image_tokens=row['image_tokens'],
+                avg_latency=f"{row['avg_latency_ms'] / 1000:.1f}",
+                cost=f"{row['cost']:.4f}"
+            )
+            for row in rows[:20]
+        )
+        await message.answer(i18n.get_text(
+            'admin_usage',
+            days=days,
+            group_by=group_by,
+            lines=lines,
+            requests=sum(row['requests'] for row in rows),
+            cost=f"{sum(row['cost'] for row in rows):.4f}"
+        ))
+        
+    except ValueError:
+        await message.answer(get_localization().get_text('admin_usage_usage', fields=", ".join(GROUP_BY_FIELDS)))
+    except Exception as e:
+        await message.answer(f"❌ Ошибка: {e}")
+
 # ===== ИНТЕРАКТИВНАЯ АДМИН-ПАНЕЛЬ =====
 
 @router.message(Command("superadmin"))
@@ -5,9 +5,15 @@ from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from app.services.gpt_analyzer import GPTAnalyzer
+from app.services.speculative_prefetch import speculative_prefetcher
+from app.services.photo_spool import photo_spool
+from app.services.photo_size_selector import photo_size_selector
+from app.services.document_images import document_image_loader, is_image_document, is_supported_image
 from app.core.i18n import get_localization
 from app.keyboards.main_menu import get_main_menu_keyboard
 from app.keyboards.analysis_menu import get_analysis_menu_keyboard
+from app.utils.progressive_edit import ProgressiveMessageEditor
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +21,7 @@ logger = logging.getLogger(__name__)
 # УБИРАЕМ циклический импорт
 router = Router()
 gpt_analyzer = GPTAnalyzer()
+speculative_prefetcher.analyzer = gpt_analyzer
 
 class PhotoAnalysis(StatesGroup):
     waiting_for_photo = State()
@@ -37,9 +44,46 @@ async def cmd_analyze(message: Message, state: FSMContext):
     await state.set_state(PhotoAnalysis.waiting_for_photo)
 
 # ===== ЗАГРУЗКА ФОТО =====
+# Вид фото в состоянии: обычное фото или картинка, отправленная файлом
+PHOTO = "photo"
+DOCUMENT = "document"
+
+def load_photo(bot, file_id: str, file_unique_id: str, kind: str = PHOTO):
+    """Байты фото из photo_spool; фото-документы скачиваются с уменьшением"""
+    download = document_image_loader.download if kind == DOCUMENT else None
+    return photo_spool.load(bot, file_id, file_unique_id, download)
+
+async def start_photo_session(message: Message, state: FSMContext, subscription_type: str, photos: list, caption: str = None):
+    """Запоминает фото ([file_id, file_unique_id, вид]) и предлагает выбрать анализ"""
+    i18n = get_localization()
+    user_id = message.from_user.id
+    
+    # Пока пользователь выбирает кнопку - готовим фото и, возможно, анализ
+    loaders = [
+        (lambda photo=photo: load_photo(message.bot, *photo), photo[1])
+        for photo in photos
+    ]
+    if len(loaders) == 1:
+        speculative_prefetcher.on_photo(user_id, *loaders[0], caption, subscription_type)
+    else:
+        speculative_prefetcher.on_album(user_id, loaders)
+    
+    # В состоянии только ссылки на фото, байты - в photo_spool
+    await state.update_data(
+        photos=photos,
+        subscription_type=subscription_type,
+        user_messages=[caption] if caption else []
+    )
+    
+    await message.answer(
+        i18n.get_text("photo_received_options"),
+        reply_markup=get_analysis_menu_keyboard()
+    )
+    await state.set_state(PhotoAnalysis.active_session)
+
 @router.message(PhotoAnalysis.waiting_for_photo, F.photo)
-async def handle_photo_with_caption(message: Message, state: FSMContext):
-    """Обрабатывает загрузку фото с подписью или без"""
+async def handle_photo_with_caption(message: Message, state: FSMContext, subscription_type: str = None, album: list = None):
+    """Обрабатывает загрузку фото (или альбома из AlbumMiddleware) с подписью или без"""
     try:
         i18n = get_localization()
         
@@ -47,22 +91,17 @@ async def handle_photo_with_caption(message: Message, state: FSMContext):
         # Завершаем предыдущую сессию GPT
         gpt_analyzer.end_session(user_id)
         
-        photo = message.photo[-1]
-        file = await message.bot.get_file(photo.file_id)
-        image_file = await message.bot.download_file(file.file_path)
-        
-        caption = message.caption
-        
-        await state.update_data(
-            image_file=image_file,
-            user_messages=[caption] if caption else []
-        )
+        # Альбом - одно блюдо с нескольких ракурсов, анализируется одним запросом
+        album_messages = album or [message]
+        # Самый маленький вариант, который модель увидит в полном разрешении
+        photos = [photo_size_selector.select(item.photo, subscription_type) for item in album_messages]
+        caption = next((item.caption for item in album_messages if item.caption), None)
         
-        await message.answer(
-            i18n.get_text("photo_received_options"),
-            reply_markup=get_analysis_menu_keyboard()
+        await start_photo_session(
+            message, state, subscription_type,
+            [[photo.file_id, photo.file_unique_id, PHOTO] for photo in photos],
+            caption
         )
-        await state.set_state(PhotoAnalysis.active_session)
         
     except Exception as e:
         logger.error(f"Ошибка загрузки фото: {e}")
@@ -127,6 +166,7 @@ async def handle_new_photo(message: Message, state: FSMContext):
     user_id = message.from_user.id
     # Завершаем сессию GPT
     gpt_analyzer.end_session(user_id)
+    speculative_prefetcher.resolve(user_id)
     
     await message.answer(
         i18n.get_text("send_photo_for_analysis"),
@@ -141,6 +181,7 @@ async def handle_menu(message: Message, state: FSMContext):
     user_id = message.from_user.id
     # Завершаем сессию GPT
     gpt_analyzer.end_session(user_id)
+    speculative_prefetcher.resolve(user_id)
     
     await message.answer(
         i18n.get_text("cancel_success"),
@@ -150,7 +191,7 @@ async def handle_menu(message: Message, state: FSMContext):
 
 # ===== ОБРАБОТКА ФОТО БЕЗ КОМАНДЫ =====
 @router.message(F.photo)
-async def handle_photo_direct(message: Message, state: FSMContext):
+async def handle_photo_direct(message: Message, state: FSMContext, subscription_type: str = None, album: list = None):
     """Обрабатывает фото отправленное без команды"""
     user_id = message.from_user.id
     
@@ -161,7 +202,37 @@ async def handle_photo_direct(message: Message, state: FSMContext):
     await state.set_state(PhotoAnalysis.waiting_for_photo)
     
     # Обрабатываем фото
-    await handle_photo_with_caption(message, state)
+    await handle_photo_with_caption(message, state, subscription_type, album)
+
+# ===== ФОТО, ОТПРАВЛЕННОЕ ФАЙЛОМ =====
+@router.message(F.document.mime_type.startswith("image/"))
+async def handle_image_document(message: Message, state: FSMContext, subscription_type: str = None):
+    """Картинка, отправленная документом: анализируется так же, как фото"""
+    i18n = get_localization()
+    
+    # Лимит за такие файлы не списывается - LimitMiddleware их пропускает
+    if not is_supported_image(message.document):
+        await message.answer(i18n.get_text("document_unsupported_format"))
+        return
+    if not is_image_document(message):
+        await message.answer(i18n.get_text("document_too_large"))
+        return
+    
+    gpt_analyzer.end_session(message.from_user.id)
+    try:
+        document = message.document
+        await start_photo_session(
+            message, state, subscription_type,
+            [[document.file_id, document.file_unique_id, DOCUMENT]],
+            message.caption
+        )
+    except Exception as e:
+        logger.error(f"Ошибка загрузки фото-документа: {e}")
+        await message.answer(
+            i18n.get_text("analysis_error"),
+            reply_markup=get_main_menu_keyboard()
+        )
+        await state.clear()
 
 # ===== ТЕКСТ БЕЗ СЕССИИ =====
 @router.message(
@@ -200,10 +271,10 @@ async def process_analysis_request(message: Message, state: FSMContext, analysis
         i18n = get_localization()
         user_data = await state.get_data()
         
-        image_file = user_data.get('image_file')
+        photos = user_data.get('photos')
         user_messages = user_data.get('user_messages', [])
         
-        if not image_file:
+        if not photos:
             await message.answer(
                 i18n.get_text('photo_not_found'),
                 reply_markup=get_main_menu_keyboard()
@@ -217,13 +288,30 @@ async def process_analysis_request(message: Message, state: FSMContext, analysis
             print(f"🔍 DEBUG: Объединенные сообщения: {combined_message}")
         
         wait_msg = await message.answer(i18n.get_text("analyzing_image"))
+        editor = ProgressiveMessageEditor(wait_msg)
+        
+        # Фото нужно только первому запросу, дальше оно уже в сессии
+        image_file = None
+        file_unique_id = [photo[1] for photo in photos]
+        if not gpt_analyzer.has_active_session(message.from_user.id):
+            image_file = list(await asyncio.gather(*(load_photo(message.bot, *photo) for photo in photos)))
+        if len(photos) == 1:
+            image_file = image_file[0] if image_file else None
+            file_unique_id = file_unique_id[0]
         
+        speculative_prefetcher.record_choice(message.from_user.id, analysis_type)
         analysis_result = await gpt_analyzer.analyze_food_image(
             user_id=message.from_user.id,
             image_file=image_file,
             analysis_type=analysis_type,
-            user_message=combined_message
+            user_message=combined_message,
+            file_unique_id=file_unique_id,
+            on_partial=editor.update,
+            subscription_type=user_data.get('subscription_type')
         )
+        # Дальше сообщение правим только здесь: финальным текстом или ошибкой
+        await editor.close()
+        speculative_prefetcher.resolve(message.from_user.id)
         
         if analysis_result is None:
             await wait_msg.edit_text(i18n.get_text("analysis_failed"))
@@ -243,12 +331,24 @@ async def process_analysis_request(message: Message, state: FSMContext, analysis
                 )
                 await state.clear()
                 return
+            elif analysis_result.get("error") == "cancelled":
+                # Пользователь уже перешел к новому фото или в меню - состояние не трогаем
+                await wait_msg.edit_text(i18n.get_text("analysis_cancelled"))
+                return
+            elif analysis_result.get("error") in ("rate_limited", "service_unavailable", "timeout"):
+                # Фото и уточнения остаются в состоянии - можно просто повторить
+                await wait_msg.edit_text(i18n.get_text(f"analysis_{analysis_result['error']}"))
+                await message.answer(
+                    i18n.get_text("try_again"),
+                    reply_markup=get_analysis_menu_keyboard()
+                )
+                return
             else:
                 await wait_msg.edit_text(i18n.get_text("analysis_failed"))
                 await state.clear()
                 return
         
-        await wait_msg.edit_text(analysis_result["analysis"])
+        await editor.finish(analysis_result["analysis"])
         await state.set_state(PhotoAnalysis.analysis_done)
         await state.update_data(user_messages=[])
         
@@ -273,6 +373,7 @@ async def process_refinement_request(message: Message, state: FSMContext, user_m
         i18n = get_localization()
         
         wait_msg = await message.answer(i18n.get_text("analyzing_image"))
+        editor = ProgressiveMessageEditor(wait_msg)
         
         analysis_type = "nutrition"
         
@@ -280,8 +381,10 @@ async def process_refinement_request(message: Message, state: FSMContext, user_m
             user_id=message.from_user.id,
             image_file=None,
             analysis_type=analysis_type,
-            user_message=user_message
+            user_message=user_message,
+            on_partial=editor.update
         )
+        await editor.close()
         
         if analysis_result is None:
             await wait_msg.edit_text(i18n.get_text("analysis_failed"))
@@ -296,12 +399,24 @@ async def process_refinement_request(message: Message, state: FSMContext, user_m
                 )
                 await state.clear()
                 return
+            elif analysis_result.get("error") == "cancelled":
+                # Пользователь уже перешел к новому фото или в меню - состояние не трогаем
+                await wait_msg.edit_text(i18n.get_text("analysis_cancelled"))
+                return
+            elif analysis_result.get("error") in ("rate_limited", "service_unavailable", "timeout"):
+                # Фото и уточнения остаются в состоянии - можно просто повторить
+                await wait_msg.edit_text(i18n.get_text(f"analysis_{analysis_result['error']}"))
+                await message.answer(
+                    i18n.get_text("try_again"),
+                    reply_markup=get_analysis_menu_keyboard()
+                )
+                return
             else:
                 await wait_msg.edit_text(i18n.get_text("analysis_failed"))
                 await state.clear()
                 return
         
-        await wait_msg.edit_text(analysis_result["analysis"])
+        await editor.finish(analysis_result["analysis"])
         
         messages_left = analysis_result.get("messages_left", 5)
         if messages_left > 0:
@@ -62,11 +62,39 @@ class RussianLocalization(BaseLocalization):
             'session_expired': "⏰ Сессия истекла. Начните заново.",
             'analysis_failed': "❌ Не удалось проанализировать изображение. Попробуйте другое фото.",
             'analysis_error': "⚠️ Произошла ошибка при анализе. Попробуйте позже.",
+            'analysis_rate_limited': "⏳ Сейчас очень много запросов. Повторите через минуту - повтор по этому фото не расходует лимит еще раз.",
+            'analysis_service_unavailable': "🔌 Сервис анализа временно недоступен. Повторите чуть позже - повтор по этому фото не расходует лимит еще раз.",
+            'analysis_timeout': "⌛ Анализ занял слишком много времени. Повторите - повтор по этому фото не расходует лимит еще раз.",
+            'analysis_cancelled': "🚫 Анализ отменен",
             'refinement_hint': "💡 Я учел ваши замечания! Вы можете нажать '📊 Калорийность' или '👨‍🍳 Рецепт' для оценки блюда",
             'photo_first_then_text': "📸 Для анализа еды сначала отправьте фото, а затем можете написать уточнение текстом.\n\nНажмите '📸 Анализировать еду' чтобы начать.",
             'photo_not_found': "❌ Ошибка: фото не найдено",
+            'document_too_large': "❌ Файл больше 20 МБ - отправьте фото поменьше или обычным фото",
+            'document_unsupported_format': "❌ Этот формат не поддерживается - отправьте JPEG, PNG или WebP либо обычным фото",
             'try_again': "Попробуйте еще раз",
 
+            # ===== РЕЗУЛЬТАТ АНАЛИЗА КАЛОРИЙНОСТИ =====
+            'nutrition_total': "🔥 {kcal} Ккал\n🍗 Б: {protein}г  🥑 Ж: {fat}г  🍚 У: {carbs}г",
+            'nutrition_dish': (
+                "🍽️ {name}\n"
+                "- 🔥 Калории: {kcal} ккал\n"
+                "- ⚖️ Вес: {weight}г{weight_note}\n"
+                "- 🍗 Белки: {protein}г\n"
+                "- 🥑 Жиры: {fat}г\n"
+                "- 🍚 Углеводы: {carbs}г"
+            ),
+            'nutrition_drink': (
+                "🍹 {name}\n"
+                "- 🔥 Калории: {kcal} ккал\n"
+                "- ⚖️ Объем: {weight}мл{weight_note}\n"
+                "- 🍗 Белки: {protein}г\n"
+                "- 🥑 Жиры: {fat}г\n"
+                "- 🍚 Углеводы: {carbs}г"
+            ),
+            'nutrition_question': "⁉️ {question}",
+            'nutrition_not_recognized': "❌ Не могу определить блюдо. Пожалуйста, опишите что изображено на фото.",
+            'nutrition_off_topic': "Я могу помочь только с анализом блюд на фото. Пожалуйста, задайте вопросы о питательной ценности еды.",
+
             # ===== ОБРАБОТКА СООБЩЕНИЙ =====
             'unknown_text': "❓ Я понимаю только команды и фотографии.\n\nИспользуйте /help для списка команд.",
             'document_received': "📄 Я получил файл, но для анализа нужна фотография.\n\nОтправьте фото через 'Фото' в Telegram.",
@@ -216,6 +244,53 @@ class RussianLocalization(BaseLocalization):
             'admin_promo_activated': "✅ Промокод {code} активирован для пользователя {user_id}",
             'admin_invalid_promo': "❌ Неверный или уже использованный промокод",
             'admin_no_promos': "📭 Нет промокодов",
+            'admin_cache_stats': (
+                "🗄 Кэш анализов\n\n"
+                "Записей в памяти: {entries}\n"
+                "Попаданий (память): {memory_hits}\n"
+                "Попаданий (БД): {db_hits}\n"
+                "Промахов: {misses}\n"
+                "Hit rate: {hit_rate}\n\n"
+                "♻️ Похожие фото\n"
+                "Хэшей в индексе: {phash_entries}\n"
+                "Проверок: {phash_lookups}\n"
+                "Сэкономлено запросов: {phash_saved}\n\n"
+                "📷 Загрузка фото\n"
+                "Выбрано уменьшенных вариантов: {photos_downsized} из {photos_selected}\n"
+                "Скачиваний: {photo_downloads}, {downloaded_mb} МБ\n"
+                "Сэкономлено: {saved_mb} МБ, ~{saved_seconds} с\n"
+                "Повторных чтений без скачивания: {spool_hits}\n"
+                "Пути getFile из кэша: {path_hits}, запросов: {path_misses}"
+            ),
+            'admin_cache_purged': "🧹 Кэш анализов очищен, удалено записей: {count}",
+            'admin_gpt_status': (
+                "🤖 OpenAI\n\n"
+                "Предохранитель: {state}\n"
+                "Ошибок подряд: {consecutive_failures}\n"
+                "Повторная проверка через: {retry_in} сек\n"
+                "Всего ошибок: {failures}\n"
+                "Отклонено без запроса: {rejected}\n"
+                "Последняя ошибка: {last_error}\n\n"
+                "⏳ Лимиты\n"
+                "{limits}\n\n"
+                "🧠 Модели\n"
+                "{models}\n\n"
+                "🧮 Уточнений посчитано без GPT: {local_refinements}\n"
+                "🔮 {speculative}"
+            ),
+            'admin_gpt_limits_line': "{model}: запросов {requests_available}/{rpm_limit}, токенов {tokens_available}/{tpm_limit}, ответов 429: {throttled}",
+            'admin_gpt_limits_empty': "Запросов еще не было",
+            'admin_gpt_model_line': "{tier} ({model}): запросов {requests}, эскалаций {escalated}, {avg_latency}/{p95_latency} сек (ср./p95), кэш промта {prompt_cache}, ${cost}",
+            'admin_gpt_speculative': "Упреждающих анализов: {analyses}, пригодилось {hits}, впустую {wasted} (hit rate {hit_rate}, за последнее время впустую {waste_ratio})",
+            'admin_gpt_speculative_off': "Упреждающий анализ выключен (SPECULATIVE_PREFETCH=1)",
+            'admin_usage': (
+                "💰 Расход OpenAI за {days} дн. по {group_by}\n\n"
+                "{lines}\n\n"
+                "Всего запросов: {requests}, стоимость: ${cost}"
+            ),
+            'admin_usage_line': "{key}: запросов {requests}, токенов {prompt_tokens}+{completion_tokens} (кэш {cached_tokens}, фото {image_tokens}), {avg_latency} сек, ${cost}",
+            'admin_usage_empty': "📭 Нет вызовов OpenAI за {days} дн.",
+            'admin_usage_usage': "❌ Использование: /usage [дней] [разрез]\nРазрезы: {fields}",
             
             # ===== ОБЩИЕ СООБЩЕНИЯ =====
             'feature_development': "🛠 Эта функция находится в разработке",
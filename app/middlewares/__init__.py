@@ -1,3 +1,4 @@
 from .limit_middleware import LimitMiddleware
+from .album_middleware import AlbumMiddleware
 
-__all__ = ['LimitMiddleware']
\ No newline at end of file
+__all__ = ['LimitMiddleware', 'AlbumMiddleware']
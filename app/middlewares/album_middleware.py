@@ -0,0 +1,55 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+from typing import Callable, Dict, Any, Awaitable, List
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """Собирает фото одного альбома (media group) в одно событие.
+
+    Telegram присылает альбом отдельными сообщениями с общим media_group_id.
+    Первое сообщение ждет остальные (окно продлевается с каждым новым фото),
+    затем обработчик вызывается один раз с data['album'] - списком сообщений
+    по порядку. Остальные сообщения альбома дальше не проходят, поэтому
+    LimitMiddleware (подключается после этого) списывает лимит один раз.
+    """
+
+    def __init__(self):
+        self.collect_window = float(os.getenv('ALBUM_COLLECT_WINDOW', '0.6'))
+        self.max_photos = int(os.getenv('ALBUM_MAX_PHOTOS', '5'))
+        self._albums: Dict[tuple, List[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not event.media_group_id or not event.photo:
+            return await handler(event, data)
+
+        key = (event.chat.id, event.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            # Фото уже собирается обработчиком первого сообщения альбома
+            album.append(event)
+            return
+
+        album = self._albums[key] = [event]
+        try:
+            collected = 0
+            while collected != len(album):
+                collected = len(album)
+                await asyncio.sleep(self.collect_window)
+        finally:
+            del self._albums[key]
+
+        album.sort(key=lambda message: message.message_id)
+        if len(album) > self.max_photos:
+            logger.info(f"Альбом из {len(album)} фото, анализируются первые {self.max_photos}")
+        data['album'] = album[:self.max_photos]
+        return await handler(album[0], data)
@@ -3,6 +3,7 @@ from aiogram.types import Message
 from typing import Callable, Dict, Any, Awaitable
 from app.services.user_service import UserService
 from app.core.i18n import get_localization
+from app.services.document_images import is_image_document
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,8 +16,8 @@ class LimitMiddleware(BaseMiddleware):
         event: Message,
         data: Dict[str, Any]
     ) -> Any:
-        # Пропускаем все сообщения без фото
-        if not event.photo:
+        # Пропускаем все сообщения без фото (фото-документы считаются как фото)
+        if not event.photo and not is_image_document(event):
             return await handler(event, data)
 
         try:
@@ -55,6 +56,8 @@ class LimitMiddleware(BaseMiddleware):
                 await event.answer(i18n.get_text('daily_limit_exceeded'))
                 return
             
+            # Подписка нужна для выбора модели анализа
+            data['subscription_type'] = user.subscription_type
             return await handler(event, data)
             
         except Exception as e:
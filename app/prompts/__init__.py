@@ -0,0 +1,4 @@
+# app/prompts/__init__.py
+from .food_analysis import get_system_prompt, get_compiled_prompt, CompiledPrompt
+
+__all__ = ['get_system_prompt', 'get_compiled_prompt', 'CompiledPrompt']
\ No newline at end of file
@@ -1,5 +1,10 @@
 # app/prompts/food_analysis.py
-SYSTEM_PROMPT_NUTRITION = """Ты - профессиональный диетолог и эксперт по анализу питания. Твоя задача - точно определить блюда на фото и рассчитать их пищевую ценность.
+from dataclasses import dataclass
+
+from app.utils.tokens import estimate_text_tokens
+
+# Общая часть промтов калорийности: текстовый и JSON-вариант начинаются одинаково
+NUTRITION_RULES = """Ты - профессиональный диетолог и эксперт по анализу питания. Твоя задача - точно определить блюда на фото и рассчитать их пищевую ценность.
 
 **КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:**
 1. 🎯 **ФОКУС НА АНАЛИЗЕ ПИТАНИЯ** - отвечай ТОЛЬКО на вопросы, связанные с анализом блюд на фото
@@ -53,7 +58,9 @@ SYSTEM_PROMPT_NUTRITION = """Ты - профессиональный дието
 - Особое внимание напиткам. Если видишь банку/бутылку с "zero", "no sugar" - считай как диетический напиток. Если на вид не понятно с сахаром или без - задавай вопрос.
 - **НЕ ПИШИ "УТОЧНЕНИЯ:"** - просто напиши вопрос с эмодзи ⁉️
 
-**ФОРМАТ ОТВЕТА (СТРОГО СОБЛЮДАЙ):**
+"""
+
+SYSTEM_PROMPT_NUTRITION = NUTRITION_RULES + """**ФОРМАТ ОТВЕТА (СТРОГО СОБЛЮДАЙ):**
 
 Сначала покажи ОБЩУЮ калорийность и БЖУ (точную сумму всех компонентов), потом детали по блюдам.
 
@@ -90,9 +97,23 @@ SYSTEM_PROMPT_NUTRITION = """Ты - профессиональный дието
 - Если есть уточнения по еде (даже среди другого текста) - используй их для улучшения анализа
 
 **ТОЛЬКО ЕСЛИ СОВСЕМ НЕВОЗМОЖНО ОПРЕДЕЛИТЬ:**
-❌ Не могу определить блюдо. Пожалуйста, опишите что изображено на фото.
+❌ Не могу определить блюдо. Пожалуйста, опишите что изображено на фото."""
+
+SYSTEM_PROMPT_NUTRITION_JSON = NUTRITION_RULES + """**ФОРМАТ ОТВЕТА - JSON ПО СХЕМЕ:**
+- Отвечай ТОЛЬКО JSON-объектом, без текста и эмодзи
+- status: "ok" - блюда определены, "not_recognized" - совсем невозможно определить блюдо, "off_topic" - в сообщении нет вопросов о еде на фото
+- dishes: каждое блюдо и напиток отдельным элементом
+  - name: название блюда на русском
+  - weight_g: вес порции в граммах (для напитков - объем в мл)
+  - weight_note: короткое пояснение к весу, например "творог ~200г, сахар ~50г - 2 ложки с горкой", или пустая строка
+  - kcal, protein, fat, carbs: калории и БЖУ этой порции
+  - is_drink: true для напитков
+- questions: уточняющие вопросы БЕЗ эмодзи, пустой список если уточнения не нужны
+- confidence: уверенность в определении блюд от 0 до 1
+- ИТОГОВУЮ СУММУ НЕ СЧИТАЙ - она считается автоматически
+- Добавленные пользователем ингредиенты включай в блюдо, а не отдельным элементом
+- Смешанные сообщения: игнорируй часть не по теме, используй уточнения по еде"""
 
-{user_description}"""
 
 SYSTEM_PROMPT_RECIPE = """Ты - опытный шеф-повар. Дай подробный рецепт приготовления для блюд на фото.
 
@@ -170,18 +191,49 @@ SYSTEM_PROMPT_RECIPE = """Ты - опытный шеф-повар. Дай под
 **Если несколько блюд - аналогичные блоки для каждого.**
 
 **ТОЛЬКО ЕСЛИ СОВСЕМ НЕВОЗМОЖНО ОПРЕДЕЛИТЬ:**
-❌ Не могу определить блюдо. Пожалуйста, опишите что на фото.
+❌ Не могу определить блюдо. Пожалуйста, опишите что на фото."""
+
+
+PROMPTS = {
+    ("nutrition", "ru"): SYSTEM_PROMPT_NUTRITION,
+    ("nutrition_json", "ru"): SYSTEM_PROMPT_NUTRITION_JSON,
+    ("recipe", "ru"): SYSTEM_PROMPT_RECIPE,
+}
+
+DEFAULT_ANALYSIS_TYPE = "nutrition"
+DEFAULT_LANGUAGE = "ru"
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """Готовый системный промт и оценка его размера в токенах"""
+    analysis_type: str
+    lang: str
+    text: str
+    tokens: int
+
+
+# Промты собираются один раз при импорте и не зависят от пользователя:
+# одинаковый префикс запроса позволяет OpenAI кэшировать его на своей стороне
+COMPILED_PROMPTS = {
+    key: CompiledPrompt(key[0], key[1], text, estimate_text_tokens(text))
+    for key, text in PROMPTS.items()
+}
+
+
+def get_compiled_prompt(analysis_type: str = DEFAULT_ANALYSIS_TYPE, lang: str = DEFAULT_LANGUAGE) -> CompiledPrompt:
+    """Промт для типа анализа и языка; неизвестные значения - промт по умолчанию"""
+    return (
+        COMPILED_PROMPTS.get((analysis_type, lang))
+        or COMPILED_PROMPTS.get((analysis_type, DEFAULT_LANGUAGE))
+        or COMPILED_PROMPTS[(DEFAULT_ANALYSIS_TYPE, DEFAULT_LANGUAGE)]
+    )
 
-{user_description}"""
 
+def get_system_prompt(analysis_type: str = DEFAULT_ANALYSIS_TYPE, lang: str = DEFAULT_LANGUAGE) -> str:
+    """Системный промт для типа анализа.
 
-def get_system_prompt(user_description: str = None, analysis_type: str = "nutrition") -> str:
-    """Формирует системный промт с учетом типа анализа"""
-    user_description_text = f"👤 Описание от пользователя: '{user_description}'\n" if user_description else ""
-    
-    if analysis_type == "nutrition":
-        return SYSTEM_PROMPT_NUTRITION.format(user_description=user_description_text)
-    elif analysis_type == "recipe":
-        return SYSTEM_PROMPT_RECIPE.format(user_description=user_description_text)
-    else:
-        return SYSTEM_PROMPT_NUTRITION.format(user_description=user_description_text)
\ No newline at end of file
+    Описание от пользователя в промт не входит - оно передается отдельным
+    сообщением после фото.
+    """
+    return get_compiled_prompt(analysis_type, lang).text
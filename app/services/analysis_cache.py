@@ -0,0 +1,151 @@
+# app/services/analysis_cache.py
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, List
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """Двухуровневый кэш результатов анализа.
+
+    Первый уровень - LRU в памяти процесса с TTL, второй - таблица
+    analysis_cache в Postgres, общая для всех экземпляров бота.
+    Ключ: file_unique_id фото + тип анализа + нормализованный текст пользователя
+    + цепочка моделей маршрута (ответ сильной модели не отдается на быстром
+    маршруте и наоборот). Истекшие записи остаются в памяти до вытеснения
+    и отдаются через get_stale, если OpenAI недоступен; из БД они удаляются
+    при записи, не чаще раза в purge_interval секунд.
+    """
+
+    def __init__(self, database=None):
+        self.database = database
+        self.max_entries = int(os.getenv('ANALYSIS_CACHE_SIZE', '1000'))
+        self.ttl = int(os.getenv('ANALYSIS_CACHE_TTL', '86400'))
+        self.purge_interval = float(os.getenv('ANALYSIS_CACHE_PURGE_INTERVAL', '3600'))
+        self._next_purge_at = 0.0
+        self._entries: OrderedDict = OrderedDict()
+        self.stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "stores": 0,
+            "expired_purged": 0
+        }
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Нормализация подписи/уточнения: регистр, пробелы, ё"""
+        if not text:
+            return ""
+        text = text.lower().replace('ё', 'е')
+        return re.sub(r'\s+', ' ', text).strip()
+
+    @classmethod
+    def make_text_key(cls, user_texts: List[str] = None) -> str:
+        """Нормализованные тексты пользователя в сессии одной строкой"""
+        return "\n".join(
+            cls.normalize_text(text) for text in (user_texts or []) if cls.normalize_text(text)
+        )
+
+    @staticmethod
+    def route_key(tiers: list) -> str:
+        """Цепочка моделей маршрута (список ModelTier) одной строкой"""
+        return ">".join(tier.model for tier in tiers or [])
+
+    @classmethod
+    def make_key(cls, file_unique_id: str, analysis_type: str, user_texts: List[str] = None, route: str = "") -> str:
+        """Ключ кэша для фото, типа анализа, всех текстов пользователя в сессии и маршрута (route_key)"""
+        raw_key = f"{file_unique_id}|{analysis_type}|{cls.make_text_key(user_texts)}|{route}"
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+    async def get(self, cache_key: str) -> Optional[str]:
+        """Ищет результат сначала в памяти, затем в БД"""
+        entry = self._entries.get(cache_key)
+        if entry:
+            expires_at, content = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(cache_key)
+                self.stats["memory_hits"] += 1
+                return content
+
+        if self.database:
+            try:
+                row = await self.database.get_cached_analysis(cache_key)
+                if row:
+                    self._remember(cache_key, row['content'], row['expires_at'].timestamp())
+                    self.stats["db_hits"] += 1
+                    return row['content']
+            except Exception as e:
+                logger.error(f"Ошибка чтения кэша анализа из БД: {e}")
+
+        self.stats["misses"] += 1
+        return None
+
+    def get_stale(self, cache_key: str) -> Optional[str]:
+        """Результат из памяти даже с истекшим TTL - запасной вариант, когда OpenAI недоступен"""
+        entry = self._entries.get(cache_key)
+        if not entry:
+            return None
+        self.stats["stale_hits"] += 1
+        return entry[1]
+
+    async def set(self, cache_key: str, analysis_type: str, content: str):
+        """Сохраняет результат на обоих уровнях"""
+        self._remember(cache_key, content, time.time() + self.ttl)
+        self.stats["stores"] += 1
+
+        if self.database:
+            try:
+                await self.database.save_cached_analysis(cache_key, analysis_type, content, self.ttl)
+            except Exception as e:
+                logger.error(f"Ошибка записи кэша анализа в БД: {e}")
+            await self._purge_expired()
+
+    async def _purge_expired(self):
+        """Удаляет истекшие записи из БД - при чтении они только отфильтровываются"""
+        now = time.monotonic()
+        if now < self._next_purge_at:
+            return
+        self._next_purge_at = now + self.purge_interval
+        try:
+            self.stats["expired_purged"] += await self.database.purge_expired_analysis_cache()
+        except Exception as e:
+            logger.error(f"Ошибка удаления истекших записей кэша анализа: {e}")
+
+    async def purge(self) -> int:
+        """Очищает кэш в памяти и общую таблицу. Возвращает число удаленных записей"""
+        removed = len(self._entries)
+        self._entries.clear()
+
+        if self.database:
+            removed_db = await self.database.purge_analysis_cache()
+            removed = max(removed, removed_db)
+
+        logger.info(f"🧹 Кэш анализов очищен, удалено записей: {removed}")
+        return removed
+
+    def get_stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        lookups = self.stats["memory_hits"] + self.stats["db_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["db_hits"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+    def _remember(self, cache_key: str, content: str, expires_at: float):
+        self._entries[cache_key] = (expires_at, content)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Глобальный экземпляр (БД подключается при запуске бота)
+analysis_cache = AnalysisCache()
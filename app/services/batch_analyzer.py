@@ -0,0 +1,359 @@
+# app/services/batch_analyzer.py
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Awaitable, Callable, List, Optional
+
+from dotenv import load_dotenv
+
+from app.prompts.food_analysis import get_system_prompt
+from app.services.analysis_cache import analysis_cache
+from app.services.gpt_analyzer import build_first_turn_messages
+from app.services.image_preprocessor import image_preprocessor
+from app.services.model_router import model_router
+from app.services.nutrition import RESPONSE_FORMAT
+from app.services.photo_spool import PhotoSpool, photo_spool
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+@dataclass
+class BatchItem:
+    """Фото для пакетного анализа; file_unique_id - ключ кэша анализов, как в боте"""
+    image_path: str
+    file_unique_id: str
+    analysis_type: str = "nutrition"
+    user_inputs: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BatchResult:
+    """Результат одного запроса пакета"""
+    custom_id: str
+    analysis_type: str
+    cache_key: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+    usage: Optional[dict] = None
+
+
+def make_custom_id(analysis_type: str, cache_key: str) -> str:
+    return f"{analysis_type}:{cache_key}"
+
+
+def parse_custom_id(custom_id: str):
+    analysis_type, _, cache_key = custom_id.partition(":")
+    return analysis_type, cache_key
+
+
+def build_request(item: BatchItem, prompt_type: str = None, structured: bool = True) -> dict:
+    """Строка пакетного файла: тот же запрос, что и в боте для первого хода"""
+    prompt_type = prompt_type or ("nutrition_json" if structured and item.analysis_type == "nutrition" else item.analysis_type)
+    # Пакет отвечает за маршрут по умолчанию первым уровнем, без эскалации
+    tiers = model_router.route(item.analysis_type)
+    tier = tiers[0]
+
+    with open(item.image_path, "rb") as f:
+        prepared_image = image_preprocessor.prepare(f.read())
+
+    user_message = "\n".join(item.user_inputs) if item.user_inputs else None
+    body = {
+        "model": tier.model,
+        "max_tokens": tier.max_tokens,
+        "messages": build_first_turn_messages(
+            get_system_prompt(prompt_type),
+            prepared_image.to_base64(),
+            prepared_image.detail,
+            user_message
+        )
+    }
+    if prompt_type == "nutrition_json":
+        body["response_format"] = RESPONSE_FORMAT
+
+    cache_key = analysis_cache.make_key(item.file_unique_id, prompt_type, item.user_inputs, analysis_cache.route_key(tiers))
+    return {
+        "custom_id": make_custom_id(item.analysis_type, cache_key),
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": body
+    }
+
+
+def write_batch_file(items: List[BatchItem], path: str, prompt_type: str = None, structured: bool = True) -> int:
+    """Пишет JSONL-файл пакета; возвращает число запросов"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            try:
+                request = build_request(item, prompt_type, structured)
+            except Exception as e:
+                logger.error(f"Фото {item.image_path} пропущено: {e}")
+                continue
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def collect_items(spool_dir: str = None, analysis_type: str = "nutrition") -> List[BatchItem]:
+    """Все фото из хранилища бота (PHOTO_SPOOL_DIR по умолчанию).
+
+    Файлы фото там названы по sha256, а file_unique_id берется из ручек -
+    ключи кэша совпадают с теми, что бот ищет при анализе.
+    """
+    spool = PhotoSpool(spool_dir) if spool_dir else photo_spool
+    return [
+        BatchItem(str(path), handle, analysis_type)
+        for handle, path in spool.stored_photos()
+    ]
+
+
+class BatchAnalyzer:
+    """Пакетный анализ через OpenAI Batch API: вдвое дешевле, ответ до 24 часов.
+
+    client - AsyncOpenAI или LocalBatchClient с тем же интерфейсом files/batches.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def submit(self, path: str, description: str = None) -> str:
+        """Загружает файл пакета и создает пакет; возвращает его id"""
+        with open(path, "rb") as f:
+            input_file = await self.client.files.create(file=(Path(path).name, f.read()), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+            metadata={"description": description or Path(path).name}
+        )
+        logger.info(f"Пакет {batch.id} отправлен ({path})")
+        return batch.id
+
+    async def poll(self, batch_id: str, interval: float = 30, timeout: float = None):
+        """Ждет завершения пакета и возвращает его"""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in FINAL_STATUSES:
+                return batch
+            if deadline and time.monotonic() > deadline:
+                raise TimeoutError(f"Пакет {batch_id} не завершен: {batch.status}")
+            logger.info(f"Пакет {batch_id}: {batch.status}")
+            await asyncio.sleep(interval)
+
+    async def ingest(self, batch, store: bool = True) -> List[BatchResult]:
+        """Разбирает результаты пакета; store - сохранить ответы в кэш анализов"""
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if line.strip():
+                    results.append(self._parse_output_line(json.loads(line)))
+
+        if store:
+            for result in results:
+                if result.content:
+                    await analysis_cache.set(result.cache_key, result.analysis_type, result.content)
+        return results
+
+    @staticmethod
+    def _parse_output_line(data: dict) -> BatchResult:
+        analysis_type, cache_key = parse_custom_id(data["custom_id"])
+        result = BatchResult(data["custom_id"], analysis_type, cache_key)
+        response = data.get("response") or {}
+        if data.get("error"):
+            result.error = data["error"].get("message") or str(data["error"])
+        elif response.get("status_code") != 200:
+            body_error = (response.get("body") or {}).get("error") or {}
+            result.error = body_error.get("message") or f"HTTP {response.get('status_code')}"
+        else:
+            body = response["body"]
+            result.content = body["choices"][0]["message"]["content"]
+            result.usage = body.get("usage")
+        return result
+
+    async def run(self, path: str, interval: float = 30, timeout: float = None, store: bool = True) -> List[BatchResult]:
+        """Отправка, ожидание и разбор результатов одним вызовом"""
+        batch = await self.poll(await self.submit(path), interval, timeout)
+        return await self.ingest(batch, store)
+
+
+Responder = Callable[[dict], Awaitable[dict]]
+
+
+class LocalBatchClient:
+    """Локальная замена Batch API с тем же форматом файлов.
+
+    Каждая строка пакета передается в responder (тело запроса -> тело ответа
+    chat completion), результат пишется в выходной JSONL как у OpenAI.
+    По умолчанию responder вызывает обычный chat completions, поэтому
+    подходит и для офлайн-тестов, и для прогона через мок-сервер.
+    """
+
+    def __init__(self, responder: Responder = None, storage_dir: str = None):
+        self.responder = responder or self._openai_responder
+        self.storage_dir = Path(storage_dir or tempfile.mkdtemp(prefix="foodlens_batch_"))
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self._batches = {}
+        self._tasks = {}
+        # Один клиент OpenAI на все строки пакетов, закрывается после обработки
+        self._client = None
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    async def _openai_responder(self, body: dict) -> dict:
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                base_url=os.getenv('OPENAI_BASE_URL') or None
+            )
+        response = await self._client.chat.completions.create(**body)
+        return response.model_dump()
+
+    async def close(self):
+        """Закрывает клиент OpenAI (пул соединений)"""
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.close()
+
+    async def _create_file(self, file, purpose: str):
+        name, data = file
+        file_id = f"file-{uuid.uuid4().hex}"
+        (self.storage_dir / file_id).write_bytes(data)
+        return SimpleNamespace(id=file_id, filename=name, purpose=purpose, bytes=len(data))
+
+    async def _file_content(self, file_id: str):
+        data = (self.storage_dir / file_id).read_bytes()
+        return SimpleNamespace(content=data, text=data.decode("utf-8"))
+
+    async def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str, metadata: dict = None):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        self._batches[batch_id] = SimpleNamespace(
+            id=batch_id,
+            status="validating",
+            input_file_id=input_file_id,
+            endpoint=endpoint,
+            completion_window=completion_window,
+            metadata=metadata,
+            output_file_id=None,
+            error_file_id=None,
+            request_counts=SimpleNamespace(total=0, completed=0, failed=0)
+        )
+        self._tasks[batch_id] = asyncio.create_task(self._process(batch_id))
+        return self._batches[batch_id]
+
+    async def _retrieve_batch(self, batch_id: str):
+        return self._batches[batch_id]
+
+    async def _process(self, batch_id: str):
+        batch = self._batches[batch_id]
+        lines = (self.storage_dir / batch.input_file_id).read_text(encoding="utf-8").splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        batch.request_counts.total = len(requests)
+        batch.status = "in_progress"
+
+        output, errors = io.StringIO(), io.StringIO()
+        try:
+            for request in requests:
+                line = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"], "error": None}
+                try:
+                    body = await self.responder(request["body"])
+                    line["response"] = {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body}
+                    output.write(json.dumps(line, ensure_ascii=False) + "\n")
+                    batch.request_counts.completed += 1
+                except Exception as e:
+                    line["response"] = None
+                    line["error"] = {"code": type(e).__name__, "message": str(e)}
+                    errors.write(json.dumps(line, ensure_ascii=False) + "\n")
+                    batch.request_counts.failed += 1
+        finally:
+            # Клиент закрываем, когда других пакетов в обработке нет
+            if not any(task is not asyncio.current_task() and not task.done() for task in self._tasks.values()):
+                await self.close()
+
+        for attr, buffer in (("output_file_id", output), ("error_file_id", errors)):
+            if buffer.getvalue():
+                stored = await self._create_file((f"{batch_id}_{attr}.jsonl", buffer.getvalue().encode("utf-8")), "batch_output")
+                setattr(batch, attr, stored.id)
+        batch.status = "completed"
+
+
+async def _main(args):
+    if args.command in ("ingest", "run") and not args.no_store and os.getenv('DATABASE_URL'):
+        # Ответы сохраняются в общий кэш анализов бота
+        from app.database import Database
+        database = Database(os.getenv('DATABASE_URL'))
+        await database.init_db()
+        analysis_cache.database = database
+
+    if args.command in ("write", "run"):
+        items = collect_items(args.photos, args.analysis_type)
+        count = write_batch_file(items, args.out, args.prompt_type, not args.text)
+        print(f"📝 Запросов в пакете: {count} -> {args.out}")
+        if args.command == "write":
+            return
+
+    if args.local:
+        client = LocalBatchClient()
+    else:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    analyzer = BatchAnalyzer(client)
+
+    try:
+        if args.command == "submit":
+            print(f"📤 Пакет отправлен: {await analyzer.submit(args.out)}")
+            return
+
+        if args.command == "run":
+            results = await analyzer.run(args.out, args.interval, args.timeout, store=not args.no_store)
+        else:
+            batch = await analyzer.poll(args.batch_id, args.interval, args.timeout)
+            print(f"📦 Пакет {batch.id}: {batch.status}")
+            if args.command == "poll":
+                return
+            results = await analyzer.ingest(batch, store=not args.no_store)
+    finally:
+        await client.close()
+
+    failed = sum(1 for result in results if result.error)
+    print(f"✅ Результатов: {len(results) - failed}, ошибок: {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетный анализ фото через OpenAI Batch API")
+    parser.add_argument("command", choices=["write", "submit", "poll", "ingest", "run"])
+    parser.add_argument("--photos", help="каталог хранилища фото бота (write, run), по умолчанию PHOTO_SPOOL_DIR")
+    parser.add_argument("--out", default="batch_requests.jsonl", help="файл пакета")
+    parser.add_argument("--batch-id", help="id пакета (poll, ingest)")
+    parser.add_argument("--analysis-type", default="nutrition", choices=["nutrition", "recipe"])
+    parser.add_argument("--prompt-type", help="вариант промта, например nutrition или nutrition_json")
+    parser.add_argument("--text", action="store_true", help="текстовый ответ вместо JSON по схеме")
+    parser.add_argument("--interval", type=float, default=30, help="период опроса, сек")
+    parser.add_argument("--timeout", type=float, help="максимальное ожидание, сек")
+    parser.add_argument("--no-store", action="store_true", help="не сохранять ответы в кэш анализов")
+    parser.add_argument("--local", action="store_true", help="локальная замена Batch API (только для run)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# app/services/context_compactor.py
+import logging
+import os
+import re
+
+from app.services.nutrition import NutritionResult
+from app.utils.tokens import estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Краткое содержание предыдущего ответа:\n"
+IMAGE_DROPPED_TEXT = "[Фото уже проанализировано в предыдущих ответах]"
+
+# Строки ответа, которые стоит сохранить в резюме: итоги, названия блюд, вес
+SUMMARY_LINE_PATTERN = re.compile(r'ккал|вес|рецепт|порций|время|⁉️', re.IGNORECASE)
+
+
+def summarize_answer(text: str, max_chars: int = 600) -> str:
+    """Компактное резюме ответа ассистента.
+
+    Оставляет итоговые цифры, заголовки блюд и вопросы-уточнения,
+    отбрасывает подробные пункты (шаги рецепта, Б/Ж/У по каждому блюду).
+    Структурированный ответ сохраняет цифры, но теряет вопросы и пояснения.
+    """
+    structured = NutritionResult.parse(text)
+    if structured:
+        return SUMMARY_PREFIX + structured.to_json(compact=True)
+
+    kept = []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        is_list_item = line.startswith("-") or re.match(r'^\d+\.', line)
+        if SUMMARY_LINE_PATTERN.search(line) or (not is_list_item and len(line) <= 80):
+            kept.append(line.lstrip("- "))
+
+    summary = "\n".join(kept)
+    if len(summary) > max_chars:
+        summary = summary[:max_chars].rsplit("\n", 1)[0]
+    return SUMMARY_PREFIX + summary
+
+
+class ContextCompactor:
+    """Собирает компактный контекст для уточняющих запросов.
+
+    Полная история остается в сессии, а в OpenAI уходит урезанная версия:
+    - после первого ответа фото заменяется уменьшенной копией (или убирается);
+    - все ответы ассистента, кроме последнего, заменяются кратким резюме;
+    - если диалог не помещается в бюджет токенов, выбрасываются самые старые ходы.
+    """
+
+    def __init__(self):
+        # low - уменьшенная копия фото, drop - только текст, keep - без изменений
+        self.image_policy = os.getenv('CONTEXT_IMAGE_POLICY', 'low').lower()
+        # Бюджет на диалог без учета системного промта
+        self.token_budget = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+        self.summary_max_chars = int(os.getenv('CONTEXT_SUMMARY_MAX_CHARS', '600'))
+
+    def build_request(self, session: dict) -> list:
+        """Список сообщений для очередного запроса к OpenAI"""
+        messages = session["messages"]
+        assistant_indexes = [i for i, message in enumerate(messages) if message["role"] == "assistant"]
+        if not assistant_indexes:
+            return list(messages)
+
+        last_assistant = assistant_indexes[-1]
+        first_assistant = assistant_indexes[0]
+        image_tokens = session.get("image_tokens")
+
+        compacted = []
+        for index, message in enumerate(messages):
+            if index < first_assistant and self._has_image(message):
+                message = self._compact_image_message(message, session)
+            elif message["role"] == "assistant" and index != last_assistant:
+                message = {
+                    "role": "assistant",
+                    "content": summarize_answer(message["content"], self.summary_max_chars)
+                }
+            compacted.append(message)
+
+        # Первый ход (системный промт, фото, подпись) и последняя пара не выбрасываются
+        head = compacted[:first_assistant]
+        middle = compacted[first_assistant:last_assistant]
+        tail = compacted[last_assistant:]
+
+        def dialog_tokens():
+            return sum(
+                estimate_message_tokens(message, image_tokens)
+                for message in head[1:] + middle + tail
+            )
+
+        dropped = 0
+        while middle and dialog_tokens() > self.token_budget:
+            # Выбрасываем самый старый ответ вместе с запросами пользователя после него
+            middle.pop(0)
+            while middle and middle[0]["role"] == "user":
+                middle.pop(0)
+            dropped += 1
+
+        if dropped:
+            logger.debug(f"Контекст сокращен: выброшено старых ходов - {dropped}")
+        return head + middle + tail
+
+    def compact_session_images(self, session: dict):
+        """Заменяет фото первого хода в самой сессии, чтобы не держать полноразмерную копию"""
+        if self.image_policy == "keep":
+            return
+        messages = session["messages"]
+        for index, message in enumerate(messages):
+            if message["role"] == "assistant":
+                break
+            if self._has_image(message):
+                messages[index] = self._compact_image_message(message, session)
+        # Уменьшенная копия теперь в сообщениях сессии
+        session.pop("low_detail_base64", None)
+
+    @staticmethod
+    def _has_image(message: dict) -> bool:
+        content = message.get("content")
+        return isinstance(content, list) and any(part.get("type") == "image_url" for part in content)
+
+    def _compact_image_message(self, message: dict, session: dict) -> dict:
+        if self.image_policy == "keep":
+            return message
+
+        # У альбома уменьшенные копии - списком в порядке фото
+        low_detail_images = session.get("low_detail_base64")
+        if not isinstance(low_detail_images, list):
+            low_detail_images = [low_detail_images]
+        image_index = 0
+        parts = []
+        for part in message["content"]:
+            if part.get("type") != "image_url":
+                parts.append(part)
+                continue
+            low_detail_base64 = low_detail_images[image_index] if image_index < len(low_detail_images) else None
+            image_index += 1
+            if self.image_policy == "low" and low_detail_base64:
+                parts.append({
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{low_detail_base64}", "detail": "low"}
+                })
+            elif self.image_policy == "low" and part["image_url"].get("detail") == "low":
+                parts.append(part)
+            else:
+                parts.append({"type": "text", "text": IMAGE_DROPPED_TEXT})
+        return {"role": message["role"], "content": parts}
+
+
+# Глобальный экземпляр
+context_compactor = ContextCompactor()
@@ -0,0 +1,107 @@
+# app/services/document_images.py
+import asyncio
+import io
+import logging
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+from app.services.image_preprocessor import fit_to_tile_grid
+from app.services.telegram_files import telegram_files
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+# Больше Bot API скачать не дает
+MAX_DOCUMENT_SIZE = 20 * MB
+ORIENTATION_TAG = 0x0112
+# Форматы, которые декодирует Pillow без плагинов (HEIC, SVG и т.п. - нет)
+SUPPORTED_MIME_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp"}
+SUPPORTED_FORMATS = ["JPEG", "PNG", "WEBP"]
+
+
+def is_supported_image(document) -> bool:
+    """Картинка в формате, который бот умеет декодировать"""
+    return (document.mime_type or "").lower() in SUPPORTED_MIME_TYPES
+
+
+def is_image_document(message) -> bool:
+    """Фото, отправленное файлом, которое бот может скачать и декодировать"""
+    document = message.document
+    return bool(
+        document
+        and is_supported_image(document)
+        and (document.file_size or 0) <= MAX_DOCUMENT_SIZE
+    )
+
+
+class DocumentImageLoader:
+    """Загрузка фото, отправленных файлом (до 20 МБ, в полном разрешении).
+
+    Файл скачивается потоком в SpooledTemporaryFile: небольшой остается
+    в памяти, большой уходит на диск. Затем картинка уменьшается до размера,
+    который увидит модель: JPEG декодируется сразу в уменьшенном масштабе
+    (draft), остальное - через reduce. Дальше уходит обычный JPEG, как
+    у фото, поэтому память не зависит от размера исходного файла.
+    """
+
+    def __init__(self):
+        self.spool_memory = int(float(os.getenv('DOCUMENT_SPOOL_MEMORY_MB', '1')) * MB)
+        # Предел для форматов без draft: их приходится декодировать целиком
+        self.max_pixels = int(float(os.getenv('DOCUMENT_MAX_MEGAPIXELS', '40')) * 1_000_000)
+        self.jpeg_quality = int(os.getenv('DOCUMENT_JPEG_QUALITY', '90'))
+        self.stats = {
+            "documents": 0,
+            "downloaded_bytes": 0,
+            "output_bytes": 0,
+            "rejected": 0
+        }
+
+    async def download(self, bot, file_id: str) -> bytes:
+        """Скачивает документ и возвращает уменьшенный JPEG"""
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_memory) as spool:
+            await telegram_files.download(bot, file_id, destination=spool, seek=False)
+            self.stats["downloaded_bytes"] += spool.tell()
+            spool.seek(0)
+            data = await asyncio.to_thread(self.downscale, spool)
+        self.stats["documents"] += 1
+        self.stats["output_bytes"] += len(data)
+        return data
+
+    def downscale(self, file) -> bytes:
+        """Уменьшает картинку из файлового объекта до сетки тайлов модели"""
+        image = Image.open(file, formats=SUPPORTED_FORMATS)
+        draft_size = fit_to_tile_grid(*image.size)
+        # Итоговый размер - после поворота: на 90/270 градусов стороны меняются местами
+        target_size = draft_size
+        if image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            target_size = draft_size[::-1]
+
+        # JPEG декодируется сразу в 1/2, 1/4 или 1/8 масштаба
+        image.draft("RGB", draft_size)
+        if image.format != "JPEG" and image.width * image.height > self.max_pixels:
+            self.stats["rejected"] += 1
+            raise ValueError(f"Слишком большое изображение: {image.width}x{image.height}")
+
+        # Поворот - до смены режима: при переводе в RGB пропадает EXIF
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        # reducing_gap: сначала целочисленное reduce, затем точный LANCZOS
+        if image.size != target_size:
+            image = image.resize(target_size, Image.LANCZOS, reducing_gap=3.0)
+
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=self.jpeg_quality)
+        return output.getvalue()
+
+    def get_stats(self) -> dict:
+        return dict(self.stats)
+
+
+# Глобальный экземпляр
+document_image_loader = DocumentImageLoader()
@@ -1,91 +1,222 @@
 # app/services/gpt_analyzer.py
-import base64
+import asyncio
 import logging
 import time
-from openai import OpenAI
+from collections import OrderedDict
+from openai import AsyncOpenAI, RateLimitError
 import os
 from dotenv import load_dotenv
 from app.prompts.food_analysis import get_system_prompt
+from app.services.image_preprocessor import image_preprocessor
+from app.services.analysis_cache import analysis_cache
+from app.services.photo_hash import near_duplicate_index
+from app.services.context_compactor import context_compactor
+from app.services.single_flight import SingleFlight
+from app.services.rate_limiter import rate_limiters, RateLimitWaitTimeout
+from app.services.resilience import openai_breaker, call_with_retry, is_retryable_error, CircuitOpenError
+from app.services.model_router import model_router, ModelTier
+from app.services.nutrition import NutritionResult, RESPONSE_FORMAT, render_answer
+from app.services.refinement_engine import refinement_engine
+from app.services.usage_ledger import usage_ledger
+from app.core.i18n import get_localization
+from app.utils.tokens import estimate_messages_tokens, estimate_image_tokens
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGES = 5
+
+
+def build_first_turn_messages(system_prompt: str, base64_image, detail: str, user_message: str = None) -> list:
+    """Сообщения первого запроса: системный промт, фото и подпись пользователя.
+    
+    base64_image - одно фото или список фото альбома (одно блюдо с разных ракурсов).
+    """
+    base64_images = base64_image if isinstance(base64_image, list) else [base64_image]
+    intro = "Проанализируй это фото еды:"
+    if len(base64_images) > 1:
+        intro = f"Проанализируй еду на этих фото - это один прием пищи с разных ракурсов (фото: {len(base64_images)}):"
+    messages = [
+        {
+            "role": "system", 
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": intro}] + [
+                {
+                    "type": "image_url", 
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{image}",
+                        "detail": detail
+                    }
+                }
+                for image in base64_images
+            ]
+        }
+    ]
+    
+    # Если есть user_message (подпись) - добавляем ее
+    if user_message:
+        messages.append({
+            "role": "user",
+            "content": f"Дополнительная информация от пользователя:\n{user_message}"
+        })
+    return messages
+
 class GPTAnalyzer:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        # Асинхронный клиент: запрос к OpenAI не блокирует event loop бота
+        # Повторы выполняет call_with_retry, встроенные повторы клиента отключены
+        self.client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            # Локальный мок-сервер для нагрузочных тестов (tests/mocks)
+            base_url=os.getenv('OPENAI_BASE_URL') or None,
+            timeout=float(os.getenv('OPENAI_TIMEOUT', '60')),
+            max_retries=0
+        )
+        # Ограничение одновременных запросов к OpenAI
+        self.max_concurrent_requests = int(os.getenv('OPENAI_MAX_CONCURRENCY', '10'))
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        self.in_flight_requests = 0
+        # Потоковая генерация для постепенного показа ответа
+        self.streaming_enabled = os.getenv('OPENAI_STREAMING', '1') == '1'
+        # Калорийность в виде JSON по схеме, текст сообщения собирается локально
+        self.structured_output = os.getenv('NUTRITION_STRUCTURED_OUTPUT', '1') == '1'
+        # Общий бюджет времени на анализ: загрузка, повторы, эскалация
+        self.analysis_deadline = float(os.getenv('ANALYSIS_DEADLINE', '90'))
         self.user_sessions = {}
+        self._single_flight = SingleFlight()
+        # Выполняющиеся анализы пользователей - отменяются вместе с сессией
+        self._tasks = {}
+        # Упреждающая работа до нажатия кнопки (app/services/speculative_prefetch.py):
+        # предобработка фото по file_unique_id и анализы по ключу кэша
+        self._prepared: OrderedDict = OrderedDict()
+        self._speculative = {}
     
-    async def analyze_food_image(self, user_id: int, image_file, analysis_type: str = "nutrition", user_message: str = None) -> dict:
+    async def analyze_food_image(self, user_id: int, image_file, analysis_type: str = "nutrition", user_message: str = None, file_unique_id: str = None, on_partial=None, subscription_type: str = None) -> dict:
+        """Анализ фото или продолжение сессии.
+
+        on_partial - необязательный async-callback, получает накопленный текст
+        ответа по мере генерации (потоковый режим).
+        subscription_type - подписка пользователя, от нее зависит выбор модели;
+        запоминается в сессии для последующих уточнений.
+        Одинаковые одновременные запросы (двойное нажатие кнопки, повторная
+        отправка текста) выполняются один раз, результат получают все.
+        Анализ выполняется отдельной задачей не дольше analysis_deadline
+        и отменяется через end_session ({"error": "cancelled"}).
+        """
+        flight_key = (user_id, analysis_type, user_message or "")
+        task = asyncio.ensure_future(self._single_flight.do(
+            flight_key,
+            lambda: self._analyze_food_image(user_id, image_file, analysis_type, user_message, file_unique_id, on_partial, subscription_type)
+        ))
+        tasks = self._tasks.setdefault(user_id, set())
+        tasks.add(task)
+        try:
+            return await asyncio.wait_for(task, timeout=self.analysis_deadline)
+        except asyncio.TimeoutError:
+            logger.warning(f"Анализ user_id {user_id} не уложился в {self.analysis_deadline} сек")
+            return {"error": "timeout"}
+        except asyncio.CancelledError:
+            # Отменили сам обработчик - пробрасываем, отменили анализ - сообщаем
+            if asyncio.current_task().cancelling():
+                raise
+            logger.info(f"Анализ user_id {user_id} отменен")
+            return {"error": "cancelled"}
+        finally:
+            tasks.discard(task)
+            if not tasks and self._tasks.get(user_id) is tasks:
+                del self._tasks[user_id]
+    
+    def cancel_analyses(self, user_id: int) -> int:
+        """Отменяет выполняющиеся анализы пользователя; возвращает их число"""
+        tasks = self._tasks.pop(user_id, set())
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+    
+    async def _analyze_food_image(self, user_id: int, image_file, analysis_type: str, user_message: str, file_unique_id: str, on_partial, subscription_type: str) -> dict:
+        session = None
+        new_session = False
+        cache_key = None
         try:
             print(f"🔍 DEBUG: Начало анализа, user_id: {user_id}")
             print(f"🔍 DEBUG: analysis_type: {analysis_type}")
             print(f"🔍 DEBUG: user_message: {user_message}")
             
-            MAX_MESSAGES = 5
-            
             # Если это первый запрос с фото - создаем сессию
             if image_file and user_id not in self.user_sessions:
                 print("🔍 DEBUG: Первый запрос с фото")
                 
+                # Альбом - список фото и их file_unique_id, анализируется одним запросом
+                album = isinstance(image_file, list)
+                image_files = image_file if album else [image_file]
+                image_ids = file_unique_id if album and file_unique_id else [file_unique_id] * len(image_files)
                 try:
-                    if hasattr(image_file, 'getvalue'):  # Если это BytesIO
-                        image_data = image_file.getvalue()
-                    else:  # Если это обычный файл
-                        image_file.seek(0)
-                        image_data = image_file.read()
-                    
-                    print(f"🔍 DEBUG: Размер фото: {len(image_data)} байт")
-                    
-                    if len(image_data) == 0:
-                        print("❌ DEBUG: Файл пустой!")
-                        return None
+                    prepared_images = []
+                    for image, image_id in zip(image_files, image_ids):
+                        if isinstance(image, bytes):  # Байты из хранилища фото
+                            image_data = image
+                        elif hasattr(image, 'getvalue'):  # Если это BytesIO
+                            image_data = image.getvalue()
+                        else:  # Если это обычный файл
+                            image.seek(0)
+                            image_data = image.read()
+                        
+                        print(f"🔍 DEBUG: Размер фото: {len(image_data)} байт")
                         
-                    base64_image = base64.b64encode(image_data).decode('utf-8')
-                    print(f"🔍 DEBUG: Base64 успешно создан, размер: {len(base64_image)} символов")
+                        if len(image_data) == 0:
+                            print("❌ DEBUG: Файл пустой!")
+                            return None
+                        
+                        # Поворот, уменьшение до сетки тайлов и пережатие - в пуле потоков
+                        prepared_images.append(self._prepare_image(image_id, image_data=image_data, take=True))
+                    prepared_images = await asyncio.gather(*prepared_images)
+                    base64_images = [prepared_image.to_base64() for prepared_image in prepared_images]
+                    # У альбома один detail на все фото - по самому требовательному
+                    detail = "high" if any(prepared_image.detail == "high" for prepared_image in prepared_images) else prepared_images[0].detail
+                    print(f"🔍 DEBUG: Base64 успешно создан, фото: {len(base64_images)}, размер: {sum(map(len, base64_images))} символов, detail: {detail}")
                     
                 except Exception as e:
                     print(f"❌ DEBUG: Ошибка чтения файла: {e}")
                     return None
                 
-                # Формируем системный промт для первого запроса
-                system_prompt = get_system_prompt(user_message, analysis_type)
-                
-                messages = [
-                    {
-                        "role": "system", 
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Проанализируй это фото еды:"},
-                            {
-                                "type": "image_url", 
-                                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                            }
-                        ]
-                    }
-                ]
+                # Системный промт одинаков для всех пользователей, подпись идет отдельным сообщением
+                system_prompt = get_system_prompt(self._prompt_type(analysis_type))
                 
-                # Если есть user_message (подпись) - добавляем ее
-                if user_message:
-                    messages.append({
-                        "role": "user",
-                        "content": f"Дополнительная информация от пользователя:\n{user_message}"
-                    })
+                messages = build_first_turn_messages(system_prompt, base64_images if album else base64_images[0], detail, user_message)
                 
+                new_session = True
                 self.user_sessions[user_id] = {
                     "messages": messages,
                     "last_activity": time.time(),
                     "messages_count": 1,
-                    "base64_image": base64_image,  # Сохраняем фото для будущих запросов
-                    "current_analysis_type": analysis_type
+                    "image_detail": detail,
+                    "image_tokens": max(prepared_image.estimated_tokens for prepared_image in prepared_images),
+                    "low_detail_base64": [prepared_image.low_detail_base64() for prepared_image in prepared_images] if album else prepared_images[0].low_detail_base64(),
+                    "current_analysis_type": analysis_type,
+                    # Ключ кэша альбома - все фото по порядку
+                    "file_unique_id": ("+".join(image_ids) if all(image_ids) else None) if album else file_unique_id,
+                    # Похожие фото ищутся только для одиночных снимков
+                    "image_hash": None if album else prepared_images[0].image_hash,
+                    "subscription_type": subscription_type,
+                    "user_inputs": [user_message] if user_message else [],
+                    # Готовые ответы по (тип анализа, число уточнений)
+                    "memo": {}
                 }
                 
             elif user_id in self.user_sessions:
                 # Продолжение существующей сессии
                 session = self.user_sessions[user_id]
                 
+                # Повторное нажатие кнопки без новой информации - тот же ответ без запроса
+                memoized_response = None if user_message else session["memo"].get(self._memo_key(session, analysis_type))
+                if memoized_response:
+                    print("🔍 DEBUG: Повторный запрос, ответ из сессии")
+                    session["last_activity"] = time.time()
+                    return self._build_result(session, analysis_type, memoized_response)
+                
                 if session["messages_count"] >= MAX_MESSAGES:
                     return {"error": "message_limit_reached"}
                 
@@ -94,14 +225,17 @@ class GPTAnalyzer:
                     print(f"🔍 DEBUG: Смена типа анализа с {session['current_analysis_type']} на {analysis_type}")
                     
                     # Обновляем системный промт
-                    system_prompt = get_system_prompt(None, analysis_type)
+                    system_prompt = get_system_prompt(self._prompt_type(analysis_type))
                     session["messages"][0]["content"] = system_prompt
                     session["current_analysis_type"] = analysis_type
                 
                 # Добавляем пользовательское сообщение или запрос на анализ
                 if user_message:
                     session["messages"].append({"role": "user", "content": user_message})
+                    session["user_inputs"].append(user_message)
                     session["messages_count"] += 1
+                    # Новая информация - сохраненные ответы больше не подходят
+                    session["memo"] = {}
                 else:
                     # Если просто нажали кнопку - добавляем запрос на анализ
                     analysis_request = {
@@ -115,31 +249,378 @@ class GPTAnalyzer:
             else:
                 return {"error": "session_not_found"}
             
-            self.user_sessions[user_id]["last_activity"] = time.time()
+            session = self.user_sessions[user_id]
+            session["last_activity"] = time.time()
             
-            print("🔍 DEBUG: Отправляем запрос в OpenAI...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=self.user_sessions[user_id]["messages"],
-                max_tokens=1200
-            )
+            # Тот же фото + тот же тип анализа + те же уточнения = тот же ответ
+            # Текстовые и структурированные ответы кэшируются раздельно
+            prompt_type = self._prompt_type(analysis_type)
+            # Ответы разных моделей кэшируются раздельно
+            tiers = model_router.route(analysis_type, session.get("subscription_type"))
+            route_key = analysis_cache.route_key(tiers)
+            gpt_response = None
+            if session.get("file_unique_id"):
+                cache_key = analysis_cache.make_key(session["file_unique_id"], prompt_type, session["user_inputs"], route_key)
+                gpt_response = await self._take_speculative(cache_key) or await analysis_cache.get(cache_key)
+                if gpt_response:
+                    print("🔍 DEBUG: Результат найден в кэше анализов")
             
-            gpt_response = response.choices[0].message.content
-            self.user_sessions[user_id]["messages"].append({"role": "assistant", "content": gpt_response})
+            # Почти то же фото (пересняли, обрезали) с теми же уточнениями
+            text_key = analysis_cache.make_text_key(session["user_inputs"])
+            if gpt_response is None:
+                gpt_response = near_duplicate_index.find(session.get("image_hash"), f"{prompt_type}|{route_key}", text_key)
+                if gpt_response and cache_key:
+                    await analysis_cache.set(cache_key, analysis_type, gpt_response)
             
-            messages_left = MAX_MESSAGES - self.user_sessions[user_id]["messages_count"]
+            # Простые добавки ("ложка сахара") пересчитываются без запроса к OpenAI
+            if gpt_response is None and user_message and prompt_type == "nutrition_json":
+                local_result = refinement_engine.apply(self._last_structured_result(session), user_message)
+                if local_result:
+                    print("🔍 DEBUG: Уточнение посчитано локально")
+                    gpt_response = local_result.to_json()
             
-            print(f"🔍 DEBUG: Анализ завершен успешно! Сообщений осталось: {messages_left}")
+            if gpt_response is None:
+                self._check_session(user_id, session)
+                print("🔍 DEBUG: Отправляем запрос в OpenAI...")
+                # Компактный контекст - новая копия, поэтому изменения сессии во время ожидания не мешают
+                gpt_response = await self._request_analysis(
+                    context_compactor.build_request(session),
+                    on_partial,
+                    tiers,
+                    RESPONSE_FORMAT if prompt_type != analysis_type else None,
+                    {
+                        "user_id": user_id,
+                        "analysis_type": analysis_type,
+                        "turn": session["messages_count"],
+                        "image_tokens": session.get("image_tokens")
+                    }
+                )
+                if cache_key and gpt_response:
+                    await analysis_cache.set(cache_key, analysis_type, gpt_response)
+                if gpt_response:
+                    near_duplicate_index.add(session.get("image_hash"), f"{prompt_type}|{route_key}", text_key, gpt_response)
             
-            return {
-                "analysis": gpt_response,
-                "analysis_type": analysis_type,
-                "messages_left": messages_left
-            }
+            # Пока ждали ответ, сессию могли завершить или начать новую
+            self._check_session(user_id, session)
+            return self._complete_turn(session, analysis_type, gpt_response)
+        
+        except asyncio.CancelledError:
+            # Ход не состоялся: сообщение сессии не тратится
+            self._rollback_turn(user_id, session, new_session)
+            raise
+            
+        except (RateLimitWaitTimeout, RateLimitError) as e:
+            # 429 уже учтен лимитером модели в _stream_completion/_create_completion
+            logger.warning(f"Лимит запросов OpenAI: {e}")
+            # Ход не состоялся - пользователь сможет повторить его без потери сообщения
+            self._rollback_turn(user_id, session, new_session)
+            return {"error": "rate_limited"}
             
         except Exception as e:
-            logger.error(f"Ошибка анализа: {e}", exc_info=True)
+            if not isinstance(e, CircuitOpenError) and not is_retryable_error(e):
+                logger.error(f"Ошибка анализа: {e}", exc_info=True)
+                return None
+            
+            logger.warning(f"OpenAI недоступен: {e}")
+            # Запасной вариант - ранее сохраненный результат, даже если он устарел
+            stale_response = analysis_cache.get_stale(cache_key) if cache_key else None
+            if stale_response:
+                print("🔍 DEBUG: OpenAI недоступен, отдаем результат из кэша")
+                return self._complete_turn(session, analysis_type, stale_response, memoize=False)
+            
+            self._rollback_turn(user_id, session, new_session)
+            return {"error": "service_unavailable"}
+    
+    def prefetch_image(self, load_image, file_unique_id: str):
+        """Заранее загружает и предобрабатывает фото, результат берет первый запрос.
+        
+        load_image - async-функция без аргументов, возвращает байты фото.
+        """
+        if not file_unique_id or file_unique_id in self._prepared:
+            return
+        
+        async def prepare():
+            return await image_preprocessor.prepare_async(await load_image())
+        
+        self._prepared[file_unique_id] = asyncio.ensure_future(prepare())
+        while len(self._prepared) > self.max_concurrent_requests * 5:
+            self._prepared.popitem(last=False)[1].cancel()
+    
+    async def _prepare_image(self, file_unique_id: str = None, image_data: bytes = None, load_image=None, take: bool = False):
+        """Предобработанное фото: заранее подготовленное или новое из image_data/load_image"""
+        task = None
+        if file_unique_id:
+            task = self._prepared.pop(file_unique_id, None) if take else self._prepared.get(file_unique_id)
+        if task is not None and not task.cancelled():
+            try:
+                return await asyncio.shield(task)
+            except Exception as e:
+                logger.warning(f"Ошибка упреждающей предобработки: {e}")
+        if image_data is None:
+            image_data = await load_image()
+        return await image_preprocessor.prepare_async(image_data)
+    
+    def speculate(self, user_id: int, load_image, analysis_type: str, user_message: str = None, file_unique_id: str = None, subscription_type: str = None) -> str:
+        """Запускает анализ до нажатия кнопки; возвращает ключ кэша результата.
+        
+        Сессия не создается: ответ кладется в кэш анализов, и первый ход
+        с тем же фото и подписью берет его оттуда (или дожидается).
+        """
+        route_key = analysis_cache.route_key(model_router.route(analysis_type, subscription_type))
+        cache_key = analysis_cache.make_key(file_unique_id, self._prompt_type(analysis_type), [user_message] if user_message else [], route_key)
+        if cache_key not in self._speculative:
+            self._speculative[cache_key] = {
+                "task": asyncio.ensure_future(self._speculative_analysis(
+                    user_id, load_image, analysis_type, user_message, file_unique_id, subscription_type, cache_key
+                )),
+                "used": False,
+                "started": time.time()
+            }
+        return cache_key
+    
+    async def _speculative_analysis(self, user_id: int, load_image, analysis_type: str, user_message: str, file_unique_id: str, subscription_type: str, cache_key: str):
+        cached_response = await analysis_cache.get(cache_key)
+        if cached_response:
+            return cached_response
+        
+        prepared_image = await self._prepare_image(file_unique_id, load_image=load_image)
+        prompt_type = self._prompt_type(analysis_type)
+        tiers = model_router.route(analysis_type, subscription_type)
+        messages = build_first_turn_messages(get_system_prompt(prompt_type), prepared_image.to_base64(), prepared_image.detail, user_message)
+        try:
+            gpt_response = await asyncio.wait_for(self._request_analysis(
+                messages,
+                None,
+                tiers,
+                RESPONSE_FORMAT if prompt_type != analysis_type else None,
+                # Ход 0 - упреждающий запрос, в журнале расхода виден отдельно
+                {"user_id": user_id, "analysis_type": analysis_type, "turn": 0, "image_tokens": prepared_image.estimated_tokens}
+            ), timeout=self.analysis_deadline)
+        except Exception as e:
+            # Не вышло заранее - анализ выполнится обычным путем по кнопке
+            logger.info(f"Упреждающий анализ не выполнен: {e}")
+            return None
+        
+        if gpt_response:
+            await analysis_cache.set(cache_key, analysis_type, gpt_response)
+            near_duplicate_index.add(prepared_image.image_hash, f"{prompt_type}|{analysis_cache.route_key(tiers)}", analysis_cache.make_text_key([user_message]), gpt_response)
+        return gpt_response
+    
+    async def _take_speculative(self, cache_key: str):
+        """Результат упреждающего анализа (дожидается выполняющегося)"""
+        entry = self._speculative.get(cache_key)
+        if entry is None:
             return None
+        task = entry["task"]
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except Exception as e:
+            logger.warning(f"Ошибка упреждающего анализа: {e}")
+            return None
+        # Пустой или неудачный упреждающий анализ не пригодился - он впустую
+        if result:
+            entry["used"] = True
+        return result
+    
+    def finish_speculation(self, cache_key: str) -> bool:
+        """Убирает упреждающий анализ; True, если его результат пригодился"""
+        entry = self._speculative.pop(cache_key, None)
+        if entry is None:
+            return False
+        if not entry["used"]:
+            # Не дождались нажатия - незавершенный запрос больше не нужен
+            entry["task"].cancel()
+        return entry["used"]
+    
+    def speculative_in_flight(self) -> int:
+        return sum(1 for entry in self._speculative.values() if not entry["task"].done())
+    
+    def _check_session(self, user_id: int, session: dict):
+        """Отменяет ход, если его сессия уже не текущая у пользователя"""
+        if self.user_sessions.get(user_id) is not session:
+            raise asyncio.CancelledError()
+    
+    def _prompt_type(self, analysis_type: str) -> str:
+        """Вариант системного промта для типа анализа"""
+        if self.structured_output and analysis_type == "nutrition":
+            return "nutrition_json"
+        return analysis_type
+    
+    @staticmethod
+    def _last_structured_result(session: dict):
+        """Последний структурированный ответ ассистента в сессии"""
+        for message in reversed(session["messages"]):
+            if message["role"] == "assistant":
+                return NutritionResult.parse(message["content"])
+        return None
+    
+    @staticmethod
+    def _memo_key(session: dict, analysis_type: str) -> tuple:
+        """Ключ ответа в сессии: тип анализа и состояние уточнений"""
+        return analysis_type, len(session["user_inputs"])
+    
+    def _complete_turn(self, session: dict, analysis_type: str, gpt_response: str, memoize: bool = True) -> dict:
+        """Записывает ответ в сессию и формирует результат.
+        
+        В сессии и кэше хранится ответ модели как есть (JSON или текст),
+        пользователю уходит текст, собранный через локализацию.
+        Устаревший ответ из кэша (memoize=False) не запоминается для повторов.
+        """
+        session["messages"].append({"role": "assistant", "content": gpt_response})
+        # Полноразмерное фото нужно только первому запросу - дальше в сессии уменьшенная копия
+        context_compactor.compact_session_images(session)
+        if memoize:
+            session["memo"][self._memo_key(session, analysis_type)] = gpt_response
+        
+        print(f"🔍 DEBUG: Анализ завершен успешно! Сообщений осталось: {MAX_MESSAGES - session['messages_count']}")
+        return self._build_result(session, analysis_type, gpt_response)
+    
+    @staticmethod
+    def _build_result(session: dict, analysis_type: str, gpt_response: str) -> dict:
+        """Результат для обработчика: текст ответа, разобранный JSON и остаток сообщений"""
+        messages_left = MAX_MESSAGES - session["messages_count"]
+        return {
+            "analysis": render_answer(gpt_response, get_localization()),
+            "analysis_type": analysis_type,
+            "nutrition": NutritionResult.parse(gpt_response),
+            "messages_left": messages_left
+        }
+    
+    def _rollback_turn(self, user_id: int, session: dict, new_session: bool):
+        """Откатывает незавершенный ход сессии"""
+        if session is None:
+            return
+        if new_session:
+            if self.user_sessions.get(user_id) is session:
+                del self.user_sessions[user_id]
+            return
+        
+        if session["messages"] and session["messages"][-1]["role"] == "user":
+            content = session["messages"].pop()["content"]
+            session["messages_count"] -= 1
+            if session["user_inputs"] and session["user_inputs"][-1] == content:
+                session["user_inputs"].pop()
+    
+    async def _request_analysis(self, messages: list, on_partial=None, tiers: list = None, response_format: dict = None, usage_context: dict = None) -> str:
+        """Текст ответа модели: потоком, если есть получатель промежуточного текста.
+        
+        Временные ошибки повторяются с задержкой, при частых ошибках
+        предохранитель сразу отказывает без обращения к OpenAI.
+        Неуверенный ответ переспрашивается у следующего уровня модели из tiers.
+        Ответ по JSON-схеме (response_format) запрашивается без потока.
+        usage_context - пользователь, тип анализа и ход сессии для журнала расхода.
+        on_partial вызывается, пока занят слот OpenAI, поэтому не должен ждать
+        Telegram: ProgressiveMessageEditor.update только запоминает текст.
+        """
+        tiers = tiers or model_router.route("default")
+        
+        async def attempt(tier: ModelTier) -> str:
+            if on_partial and self.streaming_enabled and not response_format:
+                text = ""
+                async for delta in self._stream_completion(messages, tier, usage_context):
+                    text += delta
+                    await on_partial(text)
+                return text
+            
+            response = await self._create_completion(messages, tier, response_format, usage_context)
+            return response.choices[0].message.content
+        
+        for index, tier in enumerate(tiers):
+            text = await call_with_retry(lambda: attempt(tier), openai_breaker)
+            if index == len(tiers) - 1 or not model_router.needs_escalation(text):
+                return text
+            model_router.record_escalation(tier)
+            logger.info(f"Неуверенный ответ {tier.model}, переспрашиваем {tiers[index + 1].model}")
+    
+    async def _stream_completion(self, messages: list, tier: ModelTier, usage_context: dict = None):
+        """Потоковый запрос к OpenAI: отдает фрагменты текста по мере генерации"""
+        estimated_tokens = estimate_messages_tokens(messages) + tier.max_tokens
+        limiter = rate_limiters.for_model(tier.model)
+        await limiter.acquire(estimated_tokens)
+        
+        async with self._semaphore:
+            self.in_flight_requests += 1
+            started_at = time.monotonic()
+            try:
+                try:
+                    raw_response = await self.client.chat.completions.with_raw_response.create(
+                        model=tier.model,
+                        messages=messages,
+                        max_tokens=tier.max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                except RateLimitError as e:
+                    limiter.penalize(e.response.headers)
+                    raise
+                limiter.update_from_headers(raw_response.headers)
+                
+                async for chunk in raw_response.parse():
+                    if chunk.usage:
+                        limiter.settle(estimated_tokens, chunk.usage.total_tokens)
+                        self._record_usage(tier, started_at, chunk.usage, messages, usage_context)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                self.in_flight_requests -= 1
+    
+    async def _create_completion(self, messages: list, tier: ModelTier, response_format: dict = None, usage_context: dict = None):
+        """Запрос к OpenAI с ограничением частоты и числа одновременных вызовов"""
+        estimated_tokens = estimate_messages_tokens(messages) + tier.max_tokens
+        limiter = rate_limiters.for_model(tier.model)
+        await limiter.acquire(estimated_tokens)
+        
+        async with self._semaphore:
+            self.in_flight_requests += 1
+            started_at = time.monotonic()
+            try:
+                try:
+                    raw_response = await self.client.chat.completions.with_raw_response.create(
+                        model=tier.model,
+                        messages=messages,
+                        max_tokens=tier.max_tokens,
+                        **({"response_format": response_format} if response_format else {})
+                    )
+                except RateLimitError as e:
+                    limiter.penalize(e.response.headers)
+                    raise
+                limiter.update_from_headers(raw_response.headers)
+                
+                response = raw_response.parse()
+                if response.usage:
+                    limiter.settle(estimated_tokens, response.usage.total_tokens)
+                    self._record_usage(tier, started_at, response.usage, messages, usage_context)
+                return response
+            finally:
+                self.in_flight_requests -= 1
+    
+    def _record_usage(self, tier: ModelTier, started_at: float, usage, messages: list = None, usage_context: dict = None):
+        """Задержка, токены и стоимость вызова в статистику уровня модели и журнал расхода"""
+        details = getattr(usage, "prompt_tokens_details", None)
+        latency = time.monotonic() - started_at
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        cost = model_router.record(tier, latency, prompt_tokens, completion_tokens, cached_tokens)
+        
+        usage_context = usage_context or {}
+        usage_ledger.record(
+            user_id=usage_context.get("user_id"),
+            analysis_type=usage_context.get("analysis_type", "unknown"),
+            turn=usage_context.get("turn", 0),
+            model=tier.model,
+            tier=tier.name,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            image_tokens=estimate_image_tokens(messages or [], usage_context.get("image_tokens")),
+            latency=latency,
+            cost=cost
+        )
     
     def cleanup_sessions(self):
         current_time = time.time()
@@ -149,12 +630,22 @@ class GPTAnalyzer:
         ]
         for user_id in expired_users:
             del self.user_sessions[user_id]
+        
+        # Упреждающие анализы, которые так никто и не забрал
+        expired_keys = [
+            cache_key for cache_key, entry in self._speculative.items()
+            if current_time - entry["started"] > 3600
+        ]
+        for cache_key in expired_keys:
+            self.finish_speculation(cache_key)
     
     def has_active_session(self, user_id: int) -> bool:
         return user_id in self.user_sessions
     
     def end_session(self, user_id: int):
-        """Завершает сессию анализа для пользователя"""
+        """Завершает сессию анализа для пользователя и отменяет ее запросы"""
+        if self.cancel_analyses(user_id):
+            print(f"🔍 DEBUG: Отменены выполняющиеся анализы user_id: {user_id}")
         if user_id in self.user_sessions:
             del self.user_sessions[user_id]
             print(f"🔍 DEBUG: Сессия завершена для user_id: {user_id}")
\ No newline at end of file
@@ -0,0 +1,172 @@
+# app/services/image_preprocessor.py
+import asyncio
+import base64
+import io
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.services.photo_hash import dhash
+
+logger = logging.getLogger(__name__)
+
+# Параметры сетки тайлов vision-модели (detail=high):
+# картинка вписывается в 2048x2048, затем короткая сторона приводится к 768,
+# и каждый тайл 512x512 стоит 170 токенов + 85 базовых
+TILE_SIZE = 512
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+BASE_TOKENS = 85
+TILE_TOKENS = 170
+
+
+@dataclass
+class PreparedImage:
+    """Изображение, подготовленное к отправке в OpenAI"""
+    data: bytes
+    width: int
+    height: int
+    detail: str
+    estimated_tokens: int
+    original_size: int
+    image_hash: Optional[int] = None
+    # Уменьшенная копия для уточняющих запросов (detail=low)
+    low_detail_data: Optional[bytes] = None
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode('utf-8')
+
+    def low_detail_base64(self) -> Optional[str]:
+        if self.low_detail_data is None:
+            return None
+        return base64.b64encode(self.low_detail_data).decode('utf-8')
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    """Оценка стоимости изображения в токенах"""
+    if detail == "low":
+        return BASE_TOKENS
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return BASE_TOKENS + TILE_TOKENS * tiles
+
+
+def fit_to_tile_grid(width: int, height: int, snap_tolerance: float = 0.15) -> tuple:
+    """Размер, который модель реально увидит при detail=high.
+
+    Если сторона чуть вылезает за границу тайла (не больше snap_tolerance
+    от размера тайла), уменьшаем картинку до границы - это экономит целый
+    ряд тайлов почти без потери качества.
+    """
+    scale = min(1.0, MAX_LONG_SIDE / max(width, height), MAX_SHORT_SIDE / min(width, height))
+    new_width, new_height = width * scale, height * scale
+
+    # Из возможных подгонок берем самую слабую - она все равно убирает ряд тайлов
+    snaps = [
+        (side - side % TILE_SIZE) / side
+        for side in (new_width, new_height)
+        if side > TILE_SIZE and 0 < side % TILE_SIZE <= TILE_SIZE * snap_tolerance
+    ]
+    snap = max(snaps) if snaps else 1.0
+
+    return max(1, round(new_width * snap)), max(1, round(new_height * snap))
+
+
+class ImagePreprocessor:
+    """Подготовка фото перед base64: поворот, уменьшение, пережатие, без EXIF"""
+
+    def __init__(self):
+        self.detail_mode = os.getenv('IMAGE_DETAIL', 'auto').lower()
+        self.jpeg_quality = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+        self.snap_tolerance = float(os.getenv('IMAGE_TILE_SNAP_TOLERANCE', '0.15'))
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('IMAGE_WORKERS', '2')),
+            thread_name_prefix="image-preprocessor"
+        )
+
+    def choose_detail(self, width: int, height: int) -> str:
+        """Выбирает detail для конкретного изображения"""
+        if self.detail_mode in ("low", "high"):
+            return self.detail_mode
+        # Маленькая картинка целиком помещается в один тайл low-режима
+        if max(width, height) <= TILE_SIZE:
+            return "low"
+        return "high"
+
+    def prepare(self, image_data: bytes) -> PreparedImage:
+        """Синхронная подготовка изображения (выполняется в пуле потоков)"""
+        try:
+            image = Image.open(io.BytesIO(image_data))
+            image = ImageOps.exif_transpose(image)
+        except (UnidentifiedImageError, OSError) as e:
+            logger.warning(f"Не удалось обработать изображение, отправляем как есть: {e}")
+            return PreparedImage(
+                data=image_data,
+                width=0,
+                height=0,
+                detail="auto",
+                estimated_tokens=0,
+                original_size=len(image_data)
+            )
+
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        # Перцептивный хэш считаем по исходному кадру, до уменьшения
+        image_hash = dhash(image)
+
+        detail = self.choose_detail(*image.size)
+        if detail == "low":
+            image.thumbnail((TILE_SIZE, TILE_SIZE), Image.LANCZOS)
+        else:
+            target_size = fit_to_tile_grid(*image.size, snap_tolerance=self.snap_tolerance)
+            if target_size != image.size:
+                image = image.resize(target_size, Image.LANCZOS)
+
+        output = io.BytesIO()
+        # Сохраняем без exif - метаданные (в т.ч. геолокация) не уходят в OpenAI
+        image.save(output, format="JPEG", quality=self.jpeg_quality, optimize=True)
+        data = output.getvalue()
+
+        low_detail_data = data if detail == "low" else self._make_low_detail(image)
+
+        return PreparedImage(
+            data=data,
+            width=image.width,
+            height=image.height,
+            detail=detail,
+            estimated_tokens=estimate_image_tokens(image.width, image.height, detail),
+            original_size=len(image_data),
+            image_hash=image_hash,
+            low_detail_data=low_detail_data
+        )
+
+    def _make_low_detail(self, image: Image.Image) -> bytes:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((TILE_SIZE, TILE_SIZE), Image.LANCZOS)
+        output = io.BytesIO()
+        thumbnail.save(output, format="JPEG", quality=self.jpeg_quality, optimize=True)
+        return output.getvalue()
+
+    async def prepare_async(self, image_data: bytes) -> PreparedImage:
+        """Подготовка изображения вне event loop"""
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(self._executor, self.prepare, image_data)
+        logger.debug(
+            f"Изображение подготовлено: {prepared.original_size} -> {len(prepared.data)} байт, "
+            f"{prepared.width}x{prepared.height}, detail={prepared.detail}, ~{prepared.estimated_tokens} токенов"
+        )
+        return prepared
+
+
+# Глобальный экземпляр
+image_preprocessor = ImagePreprocessor()
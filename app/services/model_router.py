@@ -0,0 +1,173 @@
+# app/services/model_router.py
+import json
+import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.services.nutrition import NutritionResult, STATUS_NOT_RECOGNIZED
+
+logger = logging.getLogger(__name__)
+
+# Ответ, после которого стоит спросить более сильную модель
+DEFAULT_ESCALATION_PATTERN = r'Не могу определить блюдо'
+
+
+@dataclass
+class ModelTier:
+    """Уровень модели: модель, лимит ответа и цены за 1M токенов в долларах"""
+    name: str
+    model: str
+    max_tokens: int = 1200
+    input_price: float = 0.0
+    output_price: float = 0.0
+    # Цена входных токенов из кэша префиксов OpenAI (None - половина input_price)
+    cached_input_price: Optional[float] = None
+
+    def cost(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        cached_price = self.cached_input_price if self.cached_input_price is not None else self.input_price / 2
+        return (
+            (prompt_tokens - cached_tokens) * self.input_price
+            + cached_tokens * cached_price
+            + completion_tokens * self.output_price
+        ) / 1_000_000
+
+
+DEFAULT_TIERS = {
+    "fast": ModelTier("fast", "gpt-4o-mini", 1200, 0.15, 0.60, 0.075),
+    "strong": ModelTier("strong", "gpt-4o", 1200, 2.50, 10.00, 1.25),
+}
+
+# Цепочки уровней: первый отвечает, следующие - для эскалации
+DEFAULT_ROUTES = {
+    "default": ["fast", "strong"],
+}
+
+
+class ModelRouter:
+    """Выбор модели по типу анализа и подписке с эскалацией неуверенных ответов.
+
+    Таблица маршрутов (MODEL_ROUTING, JSON) сопоставляет ключу цепочку
+    уровней. Ключи проверяются по порядку: "nutrition:premium_month",
+    "nutrition", "*:premium_month", "default". Уровни переопределяются
+    через MODEL_TIERS (JSON: {"fast": {"model": ..., "max_tokens": ...}}).
+    """
+
+    def __init__(self):
+        self.tiers = dict(DEFAULT_TIERS)
+        for name, params in self._load_json('MODEL_TIERS').items():
+            base = self.tiers.get(name)
+            fields = {
+                "model": base.model if base else None,
+                "max_tokens": base.max_tokens if base else 1200,
+                "input_price": base.input_price if base else 0.0,
+                "output_price": base.output_price if base else 0.0,
+                "cached_input_price": base.cached_input_price if base else None,
+                **params
+            }
+            if not fields["model"]:
+                logger.error(f"Уровень {name} пропущен: не указана модель")
+                continue
+            self.tiers[name] = ModelTier(name=name, **fields)
+
+        self.routes = dict(DEFAULT_ROUTES)
+        for key, chain in self._load_json('MODEL_ROUTING').items():
+            unknown = [name for name in chain if name not in self.tiers]
+            if unknown or not chain:
+                logger.error(f"Маршрут {key} пропущен: неизвестные уровни моделей {unknown}")
+                continue
+            self.routes[key] = chain
+
+        self.escalation_pattern = re.compile(
+            os.getenv('MODEL_ESCALATION_PATTERN', DEFAULT_ESCALATION_PATTERN), re.IGNORECASE
+        )
+        # Много вопросов-уточнений - модель не уверена в составе блюда (0 - не учитывать)
+        self.escalation_questions = int(os.getenv('MODEL_ESCALATION_QUESTIONS', '3'))
+        # Порог уверенности для структурированных ответов
+        self.escalation_confidence = float(os.getenv('MODEL_ESCALATION_CONFIDENCE', '0.5'))
+        self.stats = {name: self._empty_stats() for name in self.tiers}
+
+    @staticmethod
+    def _load_json(env_name: str) -> dict:
+        value = os.getenv(env_name)
+        if not value:
+            return {}
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError as e:
+            logger.error(f"Некорректный JSON в {env_name}: {e}")
+            return {}
+
+    @staticmethod
+    def _empty_stats() -> dict:
+        return {
+            "requests": 0,
+            "escalated": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "cost": 0.0,
+            "latencies": deque(maxlen=500)
+        }
+
+    def route(self, analysis_type: str, subscription_type: Optional[str] = None) -> List[ModelTier]:
+        """Цепочка уровней для запроса"""
+        subscription_type = subscription_type or "free"
+        for key in (f"{analysis_type}:{subscription_type}", analysis_type, f"*:{subscription_type}", "default"):
+            if key in self.routes:
+                return [self.tiers[name] for name in self.routes[key]]
+        return [self.tiers["fast"]]
+
+    def needs_escalation(self, text: Optional[str]) -> bool:
+        """Ответ неуверенный или блюдо не распознано"""
+        if not text:
+            return True
+        structured = NutritionResult.parse(text)
+        if structured:
+            return (
+                structured.status == STATUS_NOT_RECOGNIZED
+                or structured.confidence < self.escalation_confidence
+                or (bool(self.escalation_questions) and len(structured.questions) >= self.escalation_questions)
+            )
+        if self.escalation_pattern.search(text):
+            return True
+        return bool(self.escalation_questions) and text.count("⁉️") >= self.escalation_questions
+
+    def record(self, tier: ModelTier, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0) -> float:
+        """Учет вызова уровня; возвращает стоимость вызова"""
+        stats = self.stats.setdefault(tier.name, self._empty_stats())
+        cost = tier.cost(prompt_tokens, completion_tokens, cached_tokens)
+        stats["requests"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_tokens"] += cached_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["cost"] += cost
+        stats["latencies"].append(latency)
+        return cost
+
+    def record_escalation(self, tier: ModelTier):
+        self.stats.setdefault(tier.name, self._empty_stats())["escalated"] += 1
+
+    def get_stats(self) -> Dict[str, dict]:
+        result = {}
+        for name, stats in self.stats.items():
+            latencies = sorted(stats["latencies"])
+            result[name] = {
+                "model": self.tiers[name].model,
+                "requests": stats["requests"],
+                "escalated": stats["escalated"],
+                "prompt_tokens": stats["prompt_tokens"],
+                "cached_tokens": stats["cached_tokens"],
+                "prompt_cache_hit_rate": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0,
+                "completion_tokens": stats["completion_tokens"],
+                "cost": stats["cost"],
+                "avg_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+                "p95_latency": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+            }
+        return result
+
+
+# Глобальный экземпляр
+model_router = ModelRouter()
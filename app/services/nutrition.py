@@ -0,0 +1,166 @@
+# app/services/nutrition.py
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_NOT_RECOGNIZED = "not_recognized"
+STATUS_OFF_TOPIC = "off_topic"
+
+# JSON-схема ответа для response_format (strict: все поля обязательны)
+NUTRITION_SCHEMA = {
+    "name": "nutrition_analysis",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "required": ["status", "dishes", "questions", "confidence"],
+        "properties": {
+            "status": {"type": "string", "enum": [STATUS_OK, STATUS_NOT_RECOGNIZED, STATUS_OFF_TOPIC]},
+            "dishes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "additionalProperties": False,
+                    "required": ["name", "weight_g", "weight_note", "kcal", "protein", "fat", "carbs", "is_drink"],
+                    "properties": {
+                        "name": {"type": "string"},
+                        "weight_g": {"type": "number"},
+                        "weight_note": {"type": "string"},
+                        "kcal": {"type": "number"},
+                        "protein": {"type": "number"},
+                        "fat": {"type": "number"},
+                        "carbs": {"type": "number"},
+                        "is_drink": {"type": "boolean"}
+                    }
+                }
+            },
+            "questions": {"type": "array", "items": {"type": "string"}},
+            "confidence": {"type": "number"}
+        }
+    }
+}
+
+RESPONSE_FORMAT = {"type": "json_schema", "json_schema": NUTRITION_SCHEMA}
+
+
+@dataclass
+class Dish:
+    """Блюдо или напиток с пищевой ценностью порции на фото"""
+    name: str
+    weight_g: float = 0.0
+    kcal: float = 0.0
+    protein: float = 0.0
+    fat: float = 0.0
+    carbs: float = 0.0
+    is_drink: bool = False
+    weight_note: str = ""
+
+
+@dataclass
+class NutritionResult:
+    """Структурированный результат анализа калорийности"""
+    dishes: List[Dish] = field(default_factory=list)
+    questions: List[str] = field(default_factory=list)
+    status: str = STATUS_OK
+    confidence: float = 1.0
+
+    @property
+    def totals(self) -> Dish:
+        """Итог считается локально - модель в сумме не участвует"""
+        return Dish(
+            name="total",
+            weight_g=sum(dish.weight_g for dish in self.dishes),
+            kcal=sum(dish.kcal for dish in self.dishes),
+            protein=sum(dish.protein for dish in self.dishes),
+            fat=sum(dish.fat for dish in self.dishes),
+            carbs=sum(dish.carbs for dish in self.dishes)
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'NutritionResult':
+        dish_fields = Dish.__dataclass_fields__
+        return cls(
+            dishes=[
+                Dish(**{key: value for key, value in dish.items() if key in dish_fields})
+                for dish in data.get("dishes", [])
+            ],
+            questions=list(data.get("questions", [])),
+            status=data.get("status", STATUS_OK),
+            confidence=float(data.get("confidence", 1.0))
+        )
+
+    @classmethod
+    def parse(cls, text: Optional[str]) -> Optional['NutritionResult']:
+        """Разбор ответа модели; None - это не структурированный ответ"""
+        if not text or not text.lstrip().startswith("{"):
+            return None
+        try:
+            return cls.from_dict(json.loads(text))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Не удалось разобрать структурированный ответ: {e}")
+            return None
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "dishes": [asdict(dish) for dish in self.dishes],
+            "questions": list(self.questions),
+            "confidence": self.confidence
+        }
+
+    def to_json(self, compact: bool = False) -> str:
+        """JSON для истории диалога; compact - без вопросов и пояснений к весу"""
+        data = self.to_dict()
+        if compact:
+            data["questions"] = []
+            for dish in data["dishes"]:
+                dish["weight_note"] = ""
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def format_number(value: float) -> str:
+    return str(int(round(value)))
+
+
+def render_nutrition(result: NutritionResult, i18n) -> str:
+    """Текст сообщения пользователю по структурированному результату"""
+    if result.status == STATUS_OFF_TOPIC:
+        return i18n.get_text('nutrition_off_topic')
+    if result.status == STATUS_NOT_RECOGNIZED or not result.dishes:
+        return i18n.get_text('nutrition_not_recognized')
+
+    totals = result.totals
+    blocks = [i18n.get_text(
+        'nutrition_total',
+        kcal=format_number(totals.kcal),
+        protein=format_number(totals.protein),
+        fat=format_number(totals.fat),
+        carbs=format_number(totals.carbs)
+    )]
+    for dish in result.dishes:
+        blocks.append(i18n.get_text(
+            'nutrition_drink' if dish.is_drink else 'nutrition_dish',
+            name=dish.name,
+            kcal=format_number(dish.kcal),
+            weight=format_number(dish.weight_g),
+            weight_note=f" ({dish.weight_note})" if dish.weight_note else "",
+            protein=format_number(dish.protein),
+            fat=format_number(dish.fat),
+            carbs=format_number(dish.carbs)
+        ))
+
+    if result.questions:
+        blocks.append("\n".join(
+            i18n.get_text('nutrition_question', question=question) for question in result.questions
+        ))
+    return "\n\n".join(blocks)
+
+
+def render_answer(text: str, i18n) -> str:
+    """Ответ модели для пользователя: JSON отрисовывается, обычный текст - как есть"""
+    result = NutritionResult.parse(text)
+    return render_nutrition(result, i18n) if result else text
@@ -0,0 +1,147 @@
+# app/services/photo_hash.py
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional, List, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Разностный перцептивный хэш (dHash), 64 бита при hash_size=8.
+
+    Картинка сжимается до (hash_size + 1) x hash_size в оттенках серого,
+    каждый бит - "левый пиксель ярче правого". Устойчив к пережатию,
+    масштабированию и небольшой обрезке.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+
+class BKTree:
+    """BK-дерево для поиска хэшей в пределах расстояния Хэмминга"""
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, value: int, item):
+        node = [value, item, {}]
+        self.size += 1
+        if self._root is None:
+            self._root = node
+            return
+
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """Все элементы на расстоянии не больше max_distance"""
+        if self._root is None:
+            return []
+
+        results = []
+        candidates = [self._root]
+        while candidates:
+            node_value, item, children = candidates.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                results.append((distance, item))
+            # Неравенство треугольника: подходящие потомки лежат в этом диапазоне ребер
+            for edge in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(edge)
+                if child is not None:
+                    candidates.append(child)
+        return results
+
+
+class NearDuplicateIndex:
+    """Индекс почти одинаковых фото: переиспользует прошлый анализ"""
+
+    def __init__(self):
+        self.max_distance = int(os.getenv('PHASH_MAX_DISTANCE', '5'))
+        self.max_entries = int(os.getenv('PHASH_INDEX_SIZE', '5000'))
+        self.ttl = int(os.getenv('PHASH_TTL', '86400'))
+        self._tree = BKTree()
+        self._entries = deque()
+        self.stats = {
+            "lookups": 0,
+            "saved_calls": 0,
+            "stored": 0
+        }
+
+    def find(self, image_hash: int, analysis_type: str, text_key: str) -> Optional[str]:
+        """Ближайший сохраненный анализ того же типа с теми же уточнениями"""
+        if image_hash is None or self.max_distance < 0:
+            return None
+
+        self.stats["lookups"] += 1
+        now = time.time()
+        best = None
+        for distance, entry in self._tree.search(image_hash, self.max_distance):
+            entry_type, entry_text_key, content, created_at = entry
+            if entry_type != analysis_type or entry_text_key != text_key:
+                continue
+            if now - created_at > self.ttl:
+                continue
+            if best is None or distance < best[0]:
+                best = (distance, content)
+
+        if best is None:
+            return None
+
+        self.stats["saved_calls"] += 1
+        logger.info(f"♻️ Найдено похожее фото (расстояние {best[0]}), анализ переиспользован")
+        return best[1]
+
+    def add(self, image_hash: int, analysis_type: str, text_key: str, content: str):
+        if image_hash is None:
+            return
+
+        entry = (analysis_type, text_key, content, time.time())
+        self._entries.append((image_hash, entry))
+        self._tree.add(image_hash, entry)
+        self.stats["stored"] += 1
+
+        if len(self._entries) > self.max_entries:
+            self._rebuild()
+
+    def _rebuild(self):
+        """BK-дерево не умеет удалять - пересобираем из свежей части записей"""
+        keep = self.max_entries * 3 // 4
+        while len(self._entries) > keep:
+            self._entries.popleft()
+
+        self._tree = BKTree()
+        for image_hash, entry in self._entries:
+            self._tree.add(image_hash, entry)
+
+    def clear(self):
+        self._entries.clear()
+        self._tree = BKTree()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": self._tree.size}
+
+
+# Глобальный экземпляр
+near_duplicate_index = NearDuplicateIndex()
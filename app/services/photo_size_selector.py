@@ -0,0 +1,96 @@
+# app/services/photo_size_selector.py
+import logging
+import os
+from typing import Optional, Sequence
+
+from app.services.image_preprocessor import TILE_SIZE, fit_to_tile_grid
+
+logger = logging.getLogger(__name__)
+
+# Допустимое расхождение с целевым размером из-за округления сторон в Telegram
+SIZE_SLACK = 2
+
+
+class PhotoSizeSelector:
+    """Выбор варианта PhotoSize для скачивания.
+
+    Telegram присылает фото в нескольких размерах, а vision-модель все равно
+    уменьшает картинку: при detail=high до короткой стороны 768, при detail=low
+    до 512 по длинной. Берем самый маленький вариант, из которого получится
+    тот же размер, что и из самого большого. Для премиум-подписки и вариантов,
+    которые не являются чистым уменьшением оригинала, можно брать самый большой.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('PHOTO_SIZE_SELECTION', '1') == '1'
+        self.detail_mode = os.getenv('IMAGE_DETAIL', 'auto').lower()
+        self.snap_tolerance = float(os.getenv('IMAGE_TILE_SNAP_TOLERANCE', '0.15'))
+        self.premium_full_size = os.getenv('PHOTO_SIZE_PREMIUM_FULL', '0') == '1'
+        self.ambiguous_full_size = os.getenv('PHOTO_SIZE_AMBIGUOUS_FULL', '1') == '1'
+        # Расхождение пропорций, при котором вариант считается обрезанным, а не уменьшенным
+        self.max_aspect_drift = float(os.getenv('PHOTO_SIZE_MAX_ASPECT_DRIFT', '0.02'))
+        self.stats = {
+            "selected": 0,
+            "downsized": 0,
+            "full_size": 0,
+            "downloaded_bytes": 0,
+            "full_size_bytes": 0
+        }
+
+    def target_size(self, width: int, height: int) -> tuple:
+        """Размер, до которого модель уменьшит фото width x height"""
+        if self.detail_mode == "low":
+            scale = min(1.0, TILE_SIZE / max(width, height))
+            return max(1, round(width * scale)), max(1, round(height * scale))
+        return fit_to_tile_grid(width, height, snap_tolerance=self.snap_tolerance)
+
+    def _is_ambiguous(self, sizes: Sequence, largest) -> bool:
+        """Нет размеров или варианты обрезаны иначе, чем оригинал"""
+        if not largest.width or not largest.height:
+            return True
+        aspect = largest.width / largest.height
+        return any(
+            not size.width or not size.height
+            or abs(size.width / size.height - aspect) / aspect > self.max_aspect_drift
+            for size in sizes
+        )
+
+    def select(self, sizes: Sequence, subscription_type: Optional[str] = None):
+        """Самый маленький PhotoSize, который дает модели полное разрешение"""
+        largest = max(sizes, key=lambda size: size.width * size.height)
+        selected = largest
+
+        full_size = (
+            not self.enabled
+            or (self.premium_full_size and (subscription_type or "").startswith("premium"))
+            or (self.ambiguous_full_size and self._is_ambiguous(sizes, largest))
+        )
+        if not full_size:
+            target_width, target_height = self.target_size(largest.width, largest.height)
+            for size in sorted(sizes, key=lambda size: size.width * size.height):
+                width, height = self.target_size(size.width, size.height)
+                if width >= target_width - SIZE_SLACK and height >= target_height - SIZE_SLACK:
+                    selected = size
+                    break
+
+        self.record(selected, largest)
+        return selected
+
+    def record(self, selected, largest):
+        self.stats["selected"] += 1
+        self.stats["downsized" if selected is not largest else "full_size"] += 1
+        self.stats["downloaded_bytes"] += selected.file_size or 0
+        self.stats["full_size_bytes"] += largest.file_size or 0
+
+    def get_stats(self, seconds_per_byte: float = 0.0) -> dict:
+        """Статистика выбора; seconds_per_byte - средняя скорость скачивания для оценки экономии времени"""
+        saved_bytes = max(0, self.stats["full_size_bytes"] - self.stats["downloaded_bytes"])
+        return {
+            **self.stats,
+            "saved_bytes": saved_bytes,
+            "saved_seconds": saved_bytes * seconds_per_byte
+        }
+
+
+# Глобальный экземпляр
+photo_size_selector = PhotoSizeSelector()
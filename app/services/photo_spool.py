@@ -0,0 +1,250 @@
+# app/services/photo_spool.py
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.services.single_flight import SingleFlight
+from app.services.telegram_files import telegram_files
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class PhotoSpool:
+    """Хранилище загруженных фото вместо BytesIO в состоянии FSM.
+
+    Фото адресуются по содержимому (sha256): небольшой LRU в памяти
+    и каталог на диске, из которого старые и лишние файлы удаляются
+    по возрасту и общему размеру. В состоянии пользователя хранится
+    только file_id/file_unique_id, байты загружаются при анализе;
+    если файл уже вытеснен - скачиваются из Telegram заново.
+    Связь file_unique_id -> sha256 тоже пишется на диск (файл ручки:
+    sha256 и сама ручка), поэтому после перезапуска бота фото читаются
+    локально, без скачивания, а stored_photos перечисляет их по ручкам.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = Path(directory or os.getenv('PHOTO_SPOOL_DIR') or Path(tempfile.gettempdir()) / "foodlens_photos")
+        self.memory_limit = int(float(os.getenv('PHOTO_SPOOL_MEMORY_MB', '32')) * MB)
+        self.disk_limit = int(float(os.getenv('PHOTO_SPOOL_DISK_MB', '1024')) * MB)
+        self.max_age = int(os.getenv('PHOTO_SPOOL_TTL', '21600'))
+        # Очистка диска после каждых cleanup_every новых файлов
+        self.cleanup_every = int(os.getenv('PHOTO_SPOOL_CLEANUP_EVERY', '50'))
+        self.max_handles = 100000
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+        # file_unique_id -> sha256 содержимого
+        self._handles: OrderedDict = OrderedDict()
+        self._writes_since_cleanup = 0
+        self._loads = SingleFlight()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "downloads": 0,
+            "download_bytes": 0,
+            "download_seconds": 0.0,
+            "stored": 0,
+            "evicted": 0
+        }
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / "blobs" / digest[:2] / digest
+
+    def _handle_path(self, handle: str) -> Path:
+        # В имени файла - хэш ручки: у альбомов и документов она может быть любой строкой
+        return self.directory / "handles" / hashlib.sha1(handle.encode()).hexdigest()
+
+    def _link(self, handle: str, digest: str):
+        self._handles[handle] = digest
+        self._handles.move_to_end(handle)
+        while len(self._handles) > self.max_handles:
+            self._handles.popitem(last=False)
+
+    async def put(self, handle: str, data: bytes) -> str:
+        """Сохраняет фото; возвращает sha256 содержимого"""
+        digest = hashlib.sha256(data).hexdigest()
+        self._link(handle, digest)
+
+        self._remember(digest, data)
+        await asyncio.to_thread(self._write, self._handle_path(handle), f"{digest}\n{handle}".encode())
+        path = self._path(digest)
+        if not path.exists():
+            await asyncio.to_thread(self._write, path, data)
+            self.stats["stored"] += 1
+            self._writes_since_cleanup += 1
+            if self._writes_since_cleanup >= self.cleanup_every:
+                self._writes_since_cleanup = 0
+                await self.cleanup()
+        return digest
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Через уникальный временный файл: параллельный читатель не увидит
+        # недописанное фото, а одновременные записи не мешают друг другу
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_file.name, path)
+
+    def _remember(self, digest: str, data: bytes):
+        if len(data) > self.memory_limit:
+            return
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            return
+        self._memory[digest] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def get(self, handle: str) -> Optional[bytes]:
+        """Байты фото из памяти или с диска; None, если его уже нет"""
+        digest = self._handles.get(handle)
+        if digest is None:
+            # Ручка из прошлого запуска бота
+            digest = await asyncio.to_thread(self._read_link, self._handle_path(handle))
+            if digest is None:
+                self.stats["misses"] += 1
+                return None
+            self._link(handle, digest)
+
+        data = self._memory.get(digest)
+        if data is not None:
+            self._memory.move_to_end(digest)
+            self.stats["memory_hits"] += 1
+            return data
+
+        data = await asyncio.to_thread(self._read, self._path(digest))
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(digest, data)
+        return data
+
+    @classmethod
+    def _read_link(cls, path: Path) -> Optional[str]:
+        return cls._read_link_entry(path)[0]
+
+    @staticmethod
+    def _read_link_entry(path: Path) -> Tuple[Optional[str], Optional[str]]:
+        """(sha256, ручка) из файла ручки; в старых файлах ручки нет"""
+        try:
+            digest, _, handle = path.read_text().partition("\n")
+        except FileNotFoundError:
+            return None, None
+        return digest, handle or None
+
+    def stored_photos(self) -> List[Tuple[str, Path]]:
+        """Пары (ручка, путь к файлу фото) для всех фото на диске"""
+        photos = []
+        for link in sorted(self.directory.glob("handles/*")):
+            if link.suffix == ".tmp":
+                continue
+            digest, handle = self._read_link_entry(link)
+            if digest and handle and self._path(digest).exists():
+                photos.append((handle, self._path(digest)))
+        return photos
+
+    @staticmethod
+    def _read(path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+            # Прочитанный файл - свежий: при очистке удаляется последним
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    async def load(self, bot, file_id: str, handle: str, download=None) -> bytes:
+        """Фото по ручке; если его нет в хранилище - скачивает из Telegram.
+
+        download - необязательная async-функция (bot, file_id) -> bytes
+        вместо обычного скачивания (например, для фото-документов).
+        """
+        return await self._loads.do(handle, lambda: self._load(bot, file_id, handle, download or self._download))
+
+    @staticmethod
+    async def _download(bot, file_id: str) -> bytes:
+        return (await telegram_files.download(bot, file_id)).getvalue()
+
+    async def _load(self, bot, file_id: str, handle: str, download) -> bytes:
+        data = await self.get(handle)
+        if data is not None:
+            return data
+
+        started_at = time.monotonic()
+        data = await download(bot, file_id)
+        self.stats["downloads"] += 1
+        self.stats["download_bytes"] += len(data)
+        self.stats["download_seconds"] += time.monotonic() - started_at
+        await self.put(handle, data)
+        return data
+
+    async def cleanup(self) -> int:
+        """Удаляет с диска старые файлы и самые давние сверх лимита размера"""
+        removed = await asyncio.to_thread(self._cleanup)
+        self.stats["evicted"] += removed
+        if removed:
+            logger.debug(f"Из хранилища фото удалено файлов: {removed}")
+        return removed
+
+    def _cleanup(self) -> int:
+        if not self.directory.exists():
+            return 0
+        files = []
+        for path in self.directory.glob("blobs/*/*"):
+            # Недописанные файлы не трогаем
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if now - mtime <= self.max_age and total <= self.disk_limit:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+        # Ручки удаленных фото больше не нужны
+        if removed:
+            for link in self.directory.glob("handles/*"):
+                if link.suffix == ".tmp":
+                    continue
+                digest = self._read_link(link)
+                if digest and not self._path(digest).exists():
+                    link.unlink(missing_ok=True)
+        return removed
+
+    def seconds_per_byte(self) -> float:
+        """Средняя скорость скачивания из Telegram"""
+        if not self.stats["download_bytes"]:
+            return 0.0
+        return self.stats["download_seconds"] / self.stats["download_bytes"]
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "memory_entries": len(self._memory),
+            "memory_mb": self._memory_bytes / MB
+        }
+
+
+# Глобальный экземпляр
+photo_spool = PhotoSpool()
@@ -0,0 +1,198 @@
+# app/services/rate_limiter.py
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+DURATION_PART_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Длительность из заголовков OpenAI: "1s", "6m0s", "20ms", "1h2m3.5s" """
+    if not value:
+        return None
+    parts = DURATION_PART_PATTERN.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class RateLimitWaitTimeout(Exception):
+    """Ожидание квоты OpenAI заняло бы больше допустимого"""
+
+    def __init__(self, wait_seconds: float):
+        super().__init__(f"Нужно ждать квоту OpenAI {wait_seconds:.1f} сек")
+        self.wait_seconds = wait_seconds
+
+
+class TokenBucket:
+    """Ведро токенов, пополняемое равномерно за минуту"""
+
+    def __init__(self, limit_per_minute: float):
+        self.capacity = float(limit_per_minute)
+        self.tokens = float(limit_per_minute)
+        self.updated_at = time.monotonic()
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / 60.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """Через сколько секунд в ведре будет amount токенов"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]):
+        """Подстраиваемся под фактические лимиты и остаток, которые видит OpenAI"""
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+
+
+def limit_setting(name: str, model: Optional[str], default: str) -> str:
+    """Лимит модели: OPENAI_TPM_LIMIT_GPT_4O_MINI, иначе общий OPENAI_TPM_LIMIT"""
+    if model:
+        value = os.getenv(f"{name}_{re.sub(r'[^A-Z0-9]', '_', model.upper())}")
+        if value:
+            return value
+    return os.getenv(name, default)
+
+
+class OpenAIRateLimiter:
+    """Клиентский лимитер запросов (RPM) и токенов (TPM) перед OpenAI.
+
+    Начальные лимиты берутся из настроек и уточняются по заголовкам
+    x-ratelimit-* каждого ответа. Если квоты не хватает, запрос ждет,
+    а не получает 429; слишком долгое ожидание - RateLimitWaitTimeout.
+    """
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model
+        self.requests = TokenBucket(float(limit_setting('OPENAI_RPM_LIMIT', model, '500')))
+        self.tokens = TokenBucket(float(limit_setting('OPENAI_TPM_LIMIT', model, '200000')))
+        self.max_wait = float(os.getenv('OPENAI_RATE_LIMIT_MAX_WAIT', '10'))
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self.stats = {
+            "acquired": 0,
+            "waited": 0,
+            "wait_seconds": 0.0,
+            "rejected": 0,
+            "throttled_by_api": 0
+        }
+
+    async def acquire(self, estimated_tokens: int):
+        """Ждет квоту на один запрос с оценкой estimated_tokens"""
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        # Ожидающие встают в очередь по порядку прихода
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self._blocked_until - now,
+                    self.requests.time_until(1),
+                    self.tokens.time_until(estimated_tokens)
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(min(estimated_tokens, self.tokens.capacity))
+                    self.stats["acquired"] += 1
+                    return
+                if now + wait > deadline:
+                    self.stats["rejected"] += 1
+                    raise RateLimitWaitTimeout(wait)
+
+                if not waited:
+                    self.stats["waited"] += 1
+                    waited = True
+                self.stats["wait_seconds"] += wait
+                await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Поправка после ответа: списываем разницу между оценкой и фактом"""
+        if actual_tokens is None:
+            return
+        self.tokens.consume(actual_tokens - min(estimated_tokens, self.tokens.capacity))
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Синхронизация с заголовками x-ratelimit-* ответа OpenAI"""
+        def number(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        self.requests.sync(number('x-ratelimit-limit-requests'), number('x-ratelimit-remaining-requests'))
+        self.tokens.sync(number('x-ratelimit-limit-tokens'), number('x-ratelimit-remaining-tokens'))
+
+    def penalize(self, headers: Optional[Mapping[str, str]] = None):
+        """OpenAI все-таки ответил 429 - не отправляем запросы до сброса лимита"""
+        headers = headers or {}
+        retry_after = None
+        if headers.get('retry-after-ms'):
+            retry_after = parse_reset_duration(headers['retry-after-ms'] + "ms")
+        if retry_after is None:
+            retry_after = parse_reset_duration(headers.get('retry-after'))
+        if retry_after is None:
+            retry_after = max(
+                parse_reset_duration(headers.get('x-ratelimit-reset-requests')) or 0,
+                parse_reset_duration(headers.get('x-ratelimit-reset-tokens')) or 0
+            ) or 1.0
+
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        self.stats["throttled_by_api"] += 1
+        logger.warning(f"⏳ OpenAI вернул 429, пауза запросов {retry_after:.1f} сек")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "rpm_limit": self.requests.capacity,
+            "tpm_limit": self.tokens.capacity,
+            "requests_available": int(self.requests.tokens),
+            "tokens_available": int(self.tokens.tokens)
+        }
+
+
+class ModelRateLimiters:
+    """Лимитеры по моделям: у OpenAI RPM/TPM считаются для каждой модели отдельно,
+    поэтому заголовки и 429 одной модели не влияют на очередь другой"""
+
+    def __init__(self):
+        self._limiters: Dict[str, OpenAIRateLimiter] = {}
+
+    def for_model(self, model: str) -> OpenAIRateLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = OpenAIRateLimiter(model)
+        return limiter
+
+    def get_stats(self) -> Dict[str, dict]:
+        return {model: limiter.get_stats() for model, limiter in self._limiters.items()}
+
+
+# Глобальный экземпляр
+rate_limiters = ModelRateLimiters()
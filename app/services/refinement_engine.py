@@ -0,0 +1,227 @@
+# app/services/refinement_engine.py
+import copy
+import logging
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.services.nutrition import Dish, NutritionResult, STATUS_OK
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Ingredient:
+    """Ингредиент с пищевой ценностью на 100 г"""
+    name: str
+    kcal: float
+    protein: float
+    fat: float
+    carbs: float
+    liquid: bool = False
+    # Отдельная позиция-напиток, а не добавка к блюду
+    drink: bool = False
+    # Вес стакана, если отличается от 250 г
+    glass_g: float = 250
+
+
+# Бытовые мерки - середины диапазонов из таблицы в app/prompts/food_analysis.py:
+# (сыпучие, жидкие) граммы
+MEASURES = {
+    "tablespoon": (18, 22),
+    "tablespoon_heaped": (28, 32),
+    "teaspoon": (6, 8),
+    "teaspoon_heaped": (11, 11),
+    "pinch": (1.5, 1.5),
+    "glass": (250, 250),
+    "cup": (175, 175),
+    "spray": (2, 2),
+    "piece": (25, 25),
+    "slice": (7, 7),
+    "gram": (1, 1),
+    "ml": (1, 1),
+}
+
+MEASURE_PATTERNS = [
+    ("tablespoon", r'столов\w* ложк\w*|ложк\w* столов\w*|ст\.? ?л\.?'),
+    ("teaspoon", r'чайн\w* ложк\w*|ложечк\w*|ч\.? ?л\.?'),
+    ("tablespoon", r'ложк\w*'),
+    ("glass", r'стакан\w*'),
+    ("cup", r'чашк\w*|блюдц\w*'),
+    ("pinch", r'щепотк\w*|щепоть'),
+    ("spray", r'пшик\w*'),
+    ("piece", r'кусоч\w*|кус\w*|ломтик\w*|ломт\w*'),
+    ("slice", r'дольк\w*|долька'),
+    ("gram", r'г|гр|грамм\w*'),
+    ("ml", r'мл|миллилитр\w*'),
+]
+
+# Только формы самого ингредиента: "медовик" и "сырники" - это блюда, а не добавки
+INGREDIENTS = [
+    (r'сахар\w*', Ingredient("сахар", 387, 0, 0, 100)),
+    (r'мед(?:а|у|ом|е)?', Ingredient("мед", 304, 0.3, 0, 82, liquid=True)),
+    (r'сол[ьи]', Ingredient("соль", 0, 0, 0, 0)),
+    (r'сливочн\w* масл\w*|масл\w* сливочн\w*', Ingredient("сливочное масло", 748, 0.5, 82.5, 0.8)),
+    (r'(?:растительн|подсолнечн|оливков)\w* масл\w*|масл\w*', Ingredient("растительное масло", 899, 0, 99.9, 0, liquid=True)),
+    (r'майонез\w*', Ingredient("майонез", 680, 1, 75, 2.6, liquid=True)),
+    (r'кетчуп\w*', Ingredient("кетчуп", 93, 1.8, 0, 22, liquid=True)),
+    (r'сметан\w*', Ingredient("сметана", 206, 2.8, 20, 3.2, liquid=True)),
+    (r'сливк\w*', Ingredient("сливки", 206, 2.5, 20, 3.4, liquid=True)),
+    (r'сгущенк\w*', Ingredient("сгущенка", 320, 7.2, 8.5, 56, liquid=True)),
+    (r'варень\w*|джем\w*', Ingredient("варенье", 265, 0.3, 0.2, 70, liquid=True)),
+    (r'сыр(?:а|у|ом|е|ы|ов)?', Ingredient("сыр", 350, 25, 27, 0)),
+    (r'хлеб\w*', Ingredient("хлеб", 265, 9, 3.2, 49)),
+    (r'мук\w*', Ingredient("мука", 364, 10, 1, 76, glass_g=200)),
+    (r'орех\w*', Ingredient("орехи", 607, 20, 54, 21)),
+    (r'лимон\w*', Ingredient("лимон", 34, 0.9, 0.1, 3)),
+    (r'молок\w*', Ingredient("молоко", 52, 2.8, 2.5, 4.7, liquid=True, drink=True)),
+    (r'кефир\w*', Ingredient("кефир", 40, 3, 1, 4, liquid=True, drink=True)),
+    (r'сок\w*', Ingredient("сок", 45, 0.5, 0.1, 10, liquid=True, drink=True)),
+]
+
+BUTTER = INGREDIENTS[3][1]
+
+NUMBER_WORDS = {
+    "один": 1, "одна": 1, "одну": 1, "одно": 1,
+    "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5,
+    "пол": 0.5, "половина": 0.5, "половину": 0.5,
+    "полтора": 1.5, "полторы": 1.5,
+}
+
+# Слова-связки в начале уточнения: "добавь", "там еще", "плюс"...
+FILLER_PATTERN = re.compile(
+    r'^(?:(?:добав\w*|положи\w*|там|тут|еще|также|а|и|плюс|с|со|была|был|было|были)\s+)+'
+)
+SEPARATOR_PATTERN = re.compile(r'\s*(?:,|;|\s\+\s|\sи\s|\sплюс\s)\s*')
+QUANTITY_PATTERN = (
+    r'(?:(?P<number>\d+(?:[.,]\d+)?)|(?P<word>' + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r'))'
+)
+ITEM_PATTERN = re.compile(
+    r'^(?:' + QUANTITY_PATTERN + r'[\s-]*)?'
+    r'(?:(?P<measure>' + "|".join(f'(?:{pattern})' for _, pattern in MEASURE_PATTERNS) + r')(?:\.\s*|\s+))?'
+    r'(?P<ingredient>[а-я][а-я\s]*?)'
+    r'(?P<heaped>\s+с\s+горк\w*)?$'
+)
+
+
+class RefinementEngine:
+    """Локальный пересчет результата по простым уточнениям.
+
+    Разбирает уточнения вида "добавь ложку сахара", "там еще стакан молока",
+    "30г сыра" по таблице бытовых мерок и ингредиентов. Добавки входят
+    в основное блюдо, напитки становятся отдельной позицией. Если текст
+    разобрать целиком не удалось - возвращается None и уточнение уходит в GPT.
+    """
+
+    def __init__(self):
+        self.stats = {
+            "handled": 0,
+            "fallback": 0
+        }
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = (text or "").lower().replace("ё", "е").strip()
+        return re.sub(r'\s+', ' ', text.rstrip(".!"))
+
+    def parse(self, text: str) -> Optional[List[Tuple[Ingredient, float]]]:
+        """Список (ингредиент, граммы) или None, если текст не разобран целиком"""
+        text = FILLER_PATTERN.sub("", self.normalize(text))
+        if not text:
+            return None
+
+        items = []
+        for part in SEPARATOR_PATTERN.split(text):
+            part = FILLER_PATTERN.sub("", part.strip())
+            item = self._parse_item(part)
+            if item is None:
+                return None
+            items.append(item)
+        return items
+
+    def _parse_item(self, text: str) -> Optional[Tuple[Ingredient, float]]:
+        # "30г" - число слитно с единицей
+        text = re.sub(r'(\d)(г|гр|мл)\b', r'\1 \2', text)
+        # "полложки", "пол-стакана"
+        text = re.sub(r'^пол[\s-]?(?=ложк|стакан|чашк|чайн|столов)', 'пол ', text)
+        match = ITEM_PATTERN.match(text)
+        if not match:
+            return None
+
+        ingredient = self._find_ingredient(match.group("ingredient").strip())
+        measure = self._find_measure(match.group("measure"))
+        if ingredient is None or measure is None:
+            return None
+        if ingredient.name == "растительное масло" and measure == "piece":
+            ingredient = BUTTER
+
+        quantity = 1.0
+        if match.group("number"):
+            quantity = float(match.group("number").replace(",", "."))
+        elif match.group("word"):
+            quantity = NUMBER_WORDS[match.group("word")]
+        if quantity <= 0:
+            return None
+
+        if match.group("heaped") and measure in ("tablespoon", "teaspoon"):
+            measure += "_heaped"
+        if measure == "glass":
+            grams = ingredient.glass_g
+        else:
+            grams = MEASURES[measure][1 if ingredient.liquid else 0]
+        return ingredient, quantity * grams
+
+    @staticmethod
+    def _find_ingredient(text: str) -> Optional[Ingredient]:
+        for pattern, ingredient in INGREDIENTS:
+            if re.fullmatch(pattern, text):
+                return ingredient
+        return None
+
+    @staticmethod
+    def _find_measure(text: Optional[str]) -> Optional[str]:
+        if not text:
+            # Без мерки вес неизвестен - пусть считает GPT
+            return None
+        for measure, pattern in MEASURE_PATTERNS:
+            if re.fullmatch(pattern, text):
+                return measure
+        return None
+
+    def apply(self, previous: Optional[NutritionResult], text: str) -> Optional[NutritionResult]:
+        """Новый результат с учетом уточнения или None, если нужен GPT"""
+        if previous is None or previous.status != STATUS_OK or not previous.dishes:
+            return None
+
+        items = self.parse(text)
+        if not items:
+            self.stats["fallback"] += 1
+            return None
+
+        result = copy.deepcopy(previous)
+        foods = [dish for dish in result.dishes if not dish.is_drink] or result.dishes
+        main_dish = max(foods, key=lambda dish: dish.kcal)
+
+        for ingredient, grams in items:
+            factor = grams / 100
+            if ingredient.drink:
+                target = Dish(name=ingredient.name.capitalize(), is_drink=True)
+                result.dishes.append(target)
+            else:
+                target = main_dish
+                note = f"{ingredient.name} ~{grams:g}г"
+                target.weight_note = f"{target.weight_note}, {note}" if target.weight_note else note
+
+            target.weight_g += grams
+            target.kcal += ingredient.kcal * factor
+            target.protein += ingredient.protein * factor
+            target.fat += ingredient.fat * factor
+            target.carbs += ingredient.carbs * factor
+
+        self.stats["handled"] += 1
+        logger.debug(f"Уточнение посчитано локально: {text}")
+        return result
+
+
+# Глобальный экземпляр
+refinement_engine = RefinementEngine()
@@ -0,0 +1,152 @@
+# app/services/resilience.py
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Предохранитель разомкнут - внешний сервис считается недоступным"""
+
+
+class CircuitBreaker:
+    """Предохранитель для внешнего сервиса.
+
+    closed - запросы идут как обычно; после failure_threshold ошибок подряд
+    переходит в open и сразу отказывает; через recovery_timeout переходит
+    в half_open и пропускает один пробный запрос.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = None, recovery_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv('OPENAI_BREAKER_FAILURES', '5'))
+        self.recovery_timeout = recovery_timeout or float(os.getenv('OPENAI_BREAKER_RESET', '30'))
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._trial_in_progress = False
+        self.stats = {
+            "successes": 0,
+            "failures": 0,
+            "rejected": 0,
+            "opened": 0
+        }
+
+    def before_call(self):
+        """Проверка перед запросом: бросает CircuitOpenError, если звать нельзя"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(f"{self.name}: предохранитель разомкнут")
+            self.state = self.HALF_OPEN
+            self._trial_in_progress = False
+
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_progress:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(f"{self.name}: идет пробный запрос")
+            self._trial_in_progress = True
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        self.consecutive_failures = 0
+        self._trial_in_progress = False
+        if self.state != self.CLOSED:
+            logger.info(f"✅ {self.name}: сервис восстановился, предохранитель замкнут")
+        self.state = self.CLOSED
+
+    def record_ignored(self):
+        """Ошибка запроса, а не сервиса - на состояние предохранителя не влияет"""
+        self._trial_in_progress = False
+
+    def record_failure(self, error: Exception):
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self._trial_in_progress = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.stats["opened"] += 1
+                logger.error(f"🔌 {self.name}: предохранитель разомкнут после ошибки {self.last_error}")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def get_state(self) -> dict:
+        retry_in = 0.0
+        if self.state == self.OPEN:
+            retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in": retry_in,
+            "last_error": self.last_error
+        }
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Временные ошибки, после которых есть смысл повторить запрос"""
+    if isinstance(error, RateLimitError):
+        # Частотой запросов занимаются rate_limiters
+        return False
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 409)
+    return False
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+async def call_with_retry(
+    func: Callable[[], Awaitable[T]],
+    breaker: CircuitBreaker,
+    max_attempts: int = None,
+    base_delay: float = None,
+    max_delay: float = None
+) -> T:
+    """Вызов с повторами временных ошибок через предохранитель"""
+    max_attempts = max_attempts or int(os.getenv('OPENAI_MAX_ATTEMPTS', '3'))
+    base_delay = base_delay if base_delay is not None else float(os.getenv('OPENAI_RETRY_BASE_DELAY', '0.5'))
+    max_delay = max_delay if max_delay is not None else float(os.getenv('OPENAI_RETRY_MAX_DELAY', '8'))
+
+    for attempt in range(max_attempts):
+        breaker.before_call()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            breaker.record_ignored()
+            raise
+        except Exception as e:
+            if not is_retryable_error(e):
+                breaker.record_ignored()
+                raise
+            breaker.record_failure(e)
+            if attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning(f"Временная ошибка {breaker.name} ({e}), попытка {attempt + 2} через {delay:.2f} сек")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+# Глобальный экземпляр для OpenAI
+openai_breaker = CircuitBreaker("OpenAI")
@@ -0,0 +1,53 @@
+# app/services/single_flight.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Схлопывание одинаковых одновременных вызовов.
+
+    Первый вызов с ключом запускает общую задачу, все повторные вызовы
+    с тем же ключом, пришедшие до ее завершения, ждут и получают тот же
+    результат. Отмена (или дедлайн) одного ожидающего не задевает остальных:
+    общая задача отменяется, только когда ее больше никто не ждет.
+    """
+
+    def __init__(self):
+        # ключ -> {"task": общая задача, "waiters": число ожидающих}
+        self._calls: Dict[Hashable, dict] = {}
+        self.stats = {
+            "calls": 0,
+            "coalesced": 0
+        }
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is not None:
+            self.stats["coalesced"] += 1
+            logger.debug(f"Повторный запрос присоединен к выполняющемуся: {key}")
+        else:
+            call = {"task": asyncio.ensure_future(func()), "waiters": 0}
+            self._calls[key] = call
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+            self.stats["calls"] += 1
+
+        call["waiters"] += 1
+        try:
+            # shield: отмена ожидающего не должна отменять общий вызов
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if not call["waiters"] and not call["task"].done():
+                # Ушел последний ожидающий - результат больше никому не нужен
+                self._forget(key, call)
+                call["task"].cancel()
+
+    def _forget(self, key: Hashable, call: dict):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
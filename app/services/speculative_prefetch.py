@@ -0,0 +1,178 @@
+# app/services/speculative_prefetch.py
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from app.services.resilience import openai_breaker
+
+logger = logging.getLogger(__name__)
+
+# Отметка "фото отправлено, но анализ не запрошен"
+NO_CHOICE = "none"
+
+
+class SpeculativePrefetcher:
+    """Упреждающая подготовка анализа, пока пользователь выбирает кнопку.
+
+    При получении фото сразу запускается предобработка, а если пользователь
+    обычно выбирает калорийность - и сам анализ. Результат попадает в кэш
+    анализов, поэтому нажатие кнопки отдает его без ожидания; сессия и
+    сообщения пользователя при этом не тратятся. Лишние запросы ограничены:
+    по доле выбора у пользователя, числу одновременных упреждающих анализов
+    и доле впустую потраченных за последнее время. Фото, после которых кнопку
+    так и не нажали, через ttl считаются выбором NO_CHOICE, а их анализ -
+    потраченным впустую; история выбора хранится для max_users пользователей.
+    """
+
+    def __init__(self, analyzer=None):
+        self.analyzer = analyzer
+        self.enabled = os.getenv('SPECULATIVE_PREFETCH', '0') == '1'
+        # Только предобработка, без запроса к OpenAI
+        self.analysis_enabled = os.getenv('SPECULATIVE_ANALYSIS', '1') == '1'
+        self.analysis_type = "nutrition"
+        # Минимальная доля выбора калорийности, при которой анализ запускается заранее
+        self.min_rate = float(os.getenv('SPECULATIVE_MIN_RATE', '0.6'))
+        # Доля для пользователей без истории
+        self.default_rate = float(os.getenv('SPECULATIVE_DEFAULT_RATE', '0.7'))
+        self.min_history = int(os.getenv('SPECULATIVE_MIN_HISTORY', '3'))
+        self.max_in_flight = int(os.getenv('SPECULATIVE_MAX_IN_FLIGHT', '5'))
+        # Если за последние waste_window анализов впустую ушло больше этой доли - пауза
+        self.max_waste_ratio = float(os.getenv('SPECULATIVE_MAX_WASTE_RATIO', '0.5'))
+        self.waste_window = int(os.getenv('SPECULATIVE_WASTE_WINDOW', '50'))
+        # Сколько итогов нужно, чтобы доле впустую потраченных можно было верить
+        self.waste_min_samples = int(os.getenv('SPECULATIVE_WASTE_MIN_SAMPLES', '5'))
+        # Сколько ждать нажатия кнопки после фото
+        self.ttl = float(os.getenv('SPECULATIVE_TTL', '900'))
+        self.max_users = int(os.getenv('SPECULATIVE_MAX_USERS', '10000'))
+        self._choices: OrderedDict = OrderedDict()
+        # user_id -> время фото, после которого ждем нажатия
+        self._awaiting_choice: Dict[int, float] = {}
+        # user_id -> (ключ кэша упреждающего анализа, время запуска)
+        self._pending: Dict[int, tuple] = {}
+        self._next_expire_at = 0.0
+        self._outcomes: deque = deque(maxlen=self.waste_window)
+        self.stats = {
+            "photos": 0,
+            "preprocessed": 0,
+            "analyses": 0,
+            "skipped": 0,
+            "hits": 0,
+            "wasted": 0
+        }
+
+    def record_choice(self, user_id: int, choice: str):
+        """Первая кнопка после фото (или NO_CHOICE) - в историю пользователя"""
+        if self._awaiting_choice.pop(user_id, None) is None:
+            return
+        self._choices.setdefault(user_id, deque(maxlen=20)).append(choice)
+        self._choices.move_to_end(user_id)
+        while len(self._choices) > self.max_users:
+            self._choices.popitem(last=False)
+
+    def choice_rate(self, user_id: int, analysis_type: str = "nutrition") -> float:
+        """Доля фото, после которых пользователь выбрал analysis_type"""
+        history = self._choices.get(user_id)
+        if not history or len(history) < self.min_history:
+            return self.default_rate
+        return sum(1 for choice in history if choice == analysis_type) / len(history)
+
+    def waste_ratio(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _should_analyze(self, user_id: int) -> bool:
+        if not self.analysis_enabled or self.analyzer is None:
+            return False
+        if self.choice_rate(user_id, self.analysis_type) < self.min_rate:
+            return False
+        if self.analyzer.speculative_in_flight() >= self.max_in_flight:
+            return False
+        if len(self._outcomes) >= self.waste_min_samples and self.waste_ratio() > self.max_waste_ratio:
+            return False
+        # При сбоях OpenAI лишние запросы только мешают
+        return openai_breaker.state == openai_breaker.CLOSED
+
+    def on_photo(self, user_id: int, load_image, file_unique_id: str, caption: Optional[str] = None, subscription_type: Optional[str] = None):
+        """Фото получено: запускает загрузку, предобработку и, если стоит, анализ.
+        
+        load_image - async-функция без аргументов, возвращает байты фото.
+        """
+        if not self.enabled or self.analyzer is None:
+            return
+        self.expire()
+        self.resolve(user_id)
+        self.record_choice(user_id, NO_CHOICE)
+        self._awaiting_choice[user_id] = time.monotonic()
+        self.stats["photos"] += 1
+
+        self.analyzer.prefetch_image(load_image, file_unique_id)
+        self.stats["preprocessed"] += 1
+
+        if not self._should_analyze(user_id):
+            self.stats["skipped"] += 1
+            return
+        cache_key = self.analyzer.speculate(
+            user_id, load_image, self.analysis_type, caption, file_unique_id, subscription_type
+        )
+        self._pending[user_id] = (cache_key, time.monotonic())
+        self.stats["analyses"] += 1
+        logger.debug(f"Упреждающий анализ для user_id {user_id}")
+
+    def on_album(self, user_id: int, photos: list):
+        """Альбом получен: только предобработка, photos - пары (load_image, file_unique_id).
+        
+        Анализ нескольких фото дороже и выбирается реже, заранее его не запускаем.
+        """
+        if not self.enabled or self.analyzer is None:
+            return
+        self.expire()
+        self.resolve(user_id)
+        self.record_choice(user_id, NO_CHOICE)
+        self._awaiting_choice[user_id] = time.monotonic()
+        self.stats["photos"] += 1
+        
+        for load_image, file_unique_id in photos:
+            self.analyzer.prefetch_image(load_image, file_unique_id)
+        self.stats["preprocessed"] += 1
+        self.stats["skipped"] += 1
+
+    def resolve(self, user_id: int):
+        """Итог упреждающего анализа: пригодился или нет (незавершенный отменяется)"""
+        pending = self._pending.pop(user_id, None)
+        if pending is None or self.analyzer is None:
+            return
+        cache_key, _ = pending
+        used = self.analyzer.finish_speculation(cache_key)
+        self._outcomes.append(used)
+        self.stats["hits" if used else "wasted"] += 1
+
+    def expire(self, force: bool = False):
+        """Закрывает фото, после которых кнопку не нажали за ttl (не чаще раза в минуту)"""
+        now = time.monotonic()
+        if not force and now < self._next_expire_at:
+            return
+        self._next_expire_at = now + min(60.0, self.ttl)
+
+        deadline = now - self.ttl
+        for user_id in [user_id for user_id, (_, started) in self._pending.items() if started < deadline]:
+            self.resolve(user_id)
+        for user_id in [user_id for user_id, since in self._awaiting_choice.items() if since < deadline]:
+            self.record_choice(user_id, NO_CHOICE)
+
+    def get_stats(self) -> dict:
+        resolved = self.stats["hits"] + self.stats["wasted"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "hit_rate": self.stats["hits"] / resolved if resolved else 0.0,
+            "waste_ratio": self.waste_ratio(),
+            "pending": len(self._pending),
+            "tracked_users": len(self._choices)
+        }
+
+
+# Глобальный экземпляр (анализатор подключается в app/handlers/photo_handler.py)
+speculative_prefetcher = SpeculativePrefetcher()
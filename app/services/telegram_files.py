@@ -0,0 +1,83 @@
+# app/services/telegram_files.py
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from aiohttp import ClientResponseError
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramFiles:
+    """Скачивание файлов из Telegram с кэшем file_path и общим лимитом.
+
+    Путь из getFile действует не меньше часа, поэтому он запоминается
+    по file_id и повторное скачивание обходится без лишнего запроса.
+    Если путь уже устарел (ответ 400/404), он запрашивается заново.
+    Все скачивания бота идут через один семафор.
+    """
+
+    def __init__(self):
+        self.path_ttl = float(os.getenv('TELEGRAM_FILE_PATH_TTL', '3000'))
+        self.max_paths = int(os.getenv('TELEGRAM_FILE_PATH_CACHE_SIZE', '10000'))
+        self.max_concurrent_downloads = int(os.getenv('TELEGRAM_MAX_CONCURRENT_DOWNLOADS', '8'))
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+        # file_id -> (file_path, время истечения)
+        self._paths: OrderedDict = OrderedDict()
+        self.stats = {
+            "path_hits": 0,
+            "path_misses": 0,
+            "path_expired": 0,
+            "downloads": 0,
+            "waiting": 0
+        }
+
+    async def get_file_path(self, bot, file_id: str) -> str:
+        """file_path из кэша или через getFile"""
+        cached = self._paths.get(file_id)
+        if cached and cached[1] > time.monotonic():
+            self._paths.move_to_end(file_id)
+            self.stats["path_hits"] += 1
+            return cached[0]
+
+        self.stats["path_misses"] += 1
+        file = await bot.get_file(file_id)
+        self._paths[file_id] = (file.file_path, time.monotonic() + self.path_ttl)
+        self._paths.move_to_end(file_id)
+        while len(self._paths) > self.max_paths:
+            self._paths.popitem(last=False)
+        return file.file_path
+
+    async def download(self, bot, file_id: str, destination=None, seek: bool = True):
+        """Скачивает файл в destination (по умолчанию BytesIO) и возвращает его"""
+        if self._semaphore.locked():
+            self.stats["waiting"] += 1
+        async with self._semaphore:
+            file_path = await self.get_file_path(bot, file_id)
+            try:
+                result = await bot.download_file(file_path, destination=destination, seek=seek)
+            except ClientResponseError as e:
+                if e.status not in (400, 404):
+                    raise
+                # Путь устарел раньше срока - берем новый и пробуем еще раз
+                self.stats["path_expired"] += 1
+                self._paths.pop(file_id, None)
+                if destination is not None:
+                    destination.seek(0)
+                    destination.truncate()
+                file_path = await self.get_file_path(bot, file_id)
+                result = await bot.download_file(file_path, destination=destination, seek=seek)
+            self.stats["downloads"] += 1
+            return result
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "cached_paths": len(self._paths)
+        }
+
+
+# Глобальный экземпляр
+telegram_files = TelegramFiles()
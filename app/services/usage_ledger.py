@@ -0,0 +1,189 @@
+# app/services/usage_ledger.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, astuple, fields
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Разрезы для /usage; значения подставляются в GROUP BY, поэтому только из этого списка
+GROUP_BY_FIELDS = ("analysis_type", "model", "user_id", "turn")
+
+
+@dataclass
+class UsageRecord:
+    """Один вызов OpenAI: кто, что, сколько токенов и сколько стоил"""
+    created_at: datetime
+    user_id: Optional[int]
+    analysis_type: str
+    # Номер хода в сессии: 1 - первый анализ фото, дальше кнопки и уточнения
+    turn: int
+    model: str
+    tier: str
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    image_tokens: int
+    latency_ms: int
+    cost: float
+
+
+USAGE_COLUMNS = tuple(field.name for field in fields(UsageRecord))
+
+
+def summarize_records(records: List[UsageRecord], group_by: str) -> List[dict]:
+    """Агрегаты по разрезу - тот же результат, что и запрос к usage_ledger в БД"""
+    groups = {}
+    for record in records:
+        key = getattr(record, group_by)
+        row = groups.setdefault(key, {
+            "key": key, "requests": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "cached_tokens": 0, "image_tokens": 0, "cost": 0.0, "latency_ms": 0
+        })
+        row["requests"] += 1
+        row["prompt_tokens"] += record.prompt_tokens
+        row["completion_tokens"] += record.completion_tokens
+        row["cached_tokens"] += record.cached_tokens
+        row["image_tokens"] += record.image_tokens
+        row["cost"] += record.cost
+        row["latency_ms"] += record.latency_ms
+
+    rows = []
+    for row in groups.values():
+        row["avg_latency_ms"] = row.pop("latency_ms") / row["requests"]
+        rows.append(row)
+    return sorted(rows, key=lambda row: row["cost"], reverse=True)
+
+
+class UsageLedger:
+    """Журнал расхода токенов и стоимости по каждому вызову OpenAI.
+
+    Записи копятся в буфере и пишутся в таблицу usage_ledger пачками:
+    при заполнении пачки или раз в flush_interval секунд. Таблица только
+    пополняется. Без БД последние записи остаются в памяти процесса.
+    После неудачной записи фоновые попытки откладываются с растущей
+    паузой (от retry_backoff до max_backoff секунд).
+    """
+
+    def __init__(self, database=None):
+        self.database = database
+        self.batch_size = int(os.getenv('USAGE_LEDGER_BATCH_SIZE', '50'))
+        self.flush_interval = float(os.getenv('USAGE_LEDGER_FLUSH_INTERVAL', '10'))
+        # Предел буфера, если БД недоступна: старые записи вытесняются
+        self.max_buffer = int(os.getenv('USAGE_LEDGER_MAX_BUFFER', '10000'))
+        self._buffer: deque = deque(maxlen=self.max_buffer)
+        self.retry_backoff = float(os.getenv('USAGE_LEDGER_RETRY_BACKOFF', '5'))
+        self.max_backoff = float(os.getenv('USAGE_LEDGER_MAX_BACKOFF', '300'))
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._periodic_task = None
+        self.stats = {
+            "recorded": 0,
+            "flushed": 0,
+            "flush_errors": 0
+        }
+
+    def record(self, user_id: Optional[int], analysis_type: str, turn: int, model: str, tier: str,
+               prompt_tokens: int, completion_tokens: int, cached_tokens: int, image_tokens: int,
+               latency: float, cost: float):
+        """Добавляет вызов в буфер; пачка уходит в БД в фоне"""
+        self._buffer.append(UsageRecord(
+            created_at=datetime.now(timezone.utc),
+            user_id=user_id,
+            analysis_type=analysis_type,
+            turn=turn,
+            model=model,
+            tier=tier,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            image_tokens=image_tokens,
+            latency_ms=int(latency * 1000),
+            cost=cost
+        ))
+        self.stats["recorded"] += 1
+
+        if self.database and len(self._buffer) >= self.batch_size and not self._flushing() and not self._backing_off():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    def _flushing(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+
+    def _backing_off(self) -> bool:
+        return time.monotonic() < self._retry_at
+
+    async def flush(self) -> int:
+        """Пишет накопленные записи в БД; при ошибке они остаются в буфере"""
+        if not self.database:
+            return 0
+
+        async with self._flush_lock:
+            if not self._buffer:
+                return 0
+            # Новые записи во время записи идут в свежий буфер
+            batch, self._buffer = self._buffer, deque(maxlen=self.max_buffer)
+            try:
+                await self.database.insert_usage_records([astuple(record) for record in batch])
+            except Exception as e:
+                # Возвращаем пачку перед новыми записями; при переполнении теряются самые старые
+                batch.extend(self._buffer)
+                self._buffer = batch
+                self.stats["flush_errors"] += 1
+                self._backoff = min(self.max_backoff, self._backoff * 2 or self.retry_backoff)
+                self._retry_at = time.monotonic() + self._backoff
+                logger.error(f"Ошибка записи журнала расхода, следующая попытка через {self._backoff:.0f} сек: {e}")
+                return 0
+
+            self._backoff = 0.0
+            self._retry_at = 0.0
+            self.stats["flushed"] += len(batch)
+            return len(batch)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self._backing_off():
+                await self.flush()
+
+    def start(self):
+        """Запускает периодическую запись в БД"""
+        if self._periodic_task is None:
+            self._periodic_task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def close(self):
+        """Останавливает периодическую запись и сбрасывает остаток буфера"""
+        if self._periodic_task:
+            self._periodic_task.cancel()
+            try:
+                await self._periodic_task
+            except asyncio.CancelledError:
+                pass
+            self._periodic_task = None
+        await self.flush()
+
+    async def summary(self, group_by: str = "analysis_type", days: int = 1) -> List[dict]:
+        """Расход за последние days дней в разрезе group_by"""
+        if group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"Неизвестный разрез: {group_by}")
+
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        if self.database:
+            await self.flush()
+            return await self.database.get_usage_summary(group_by, since)
+        return summarize_records([record for record in self._buffer if record.created_at >= since], group_by)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "pending": len(self._buffer) if self.database else 0
+        }
+
+
+# Глобальный экземпляр
+usage_ledger = UsageLedger()
@@ -0,0 +1,102 @@
+# app/utils/progressive_edit.py
+import asyncio
+import logging
+import os
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины текста сообщения в Telegram
+MAX_MESSAGE_LENGTH = 4096
+TYPING_CURSOR = " ▌"
+
+
+class ProgressiveMessageEditor:
+    """Постепенно обновляет сообщение по мере генерации ответа.
+
+    update() только запоминает последний текст, правки делает отдельная
+    фоновая задача: поток ответа не ждет Telegram и не держит слот OpenAI.
+    Правки ограничены по частоте: Telegram допускает примерно одну правку
+    в секунду на чат, при превышении отвечает RetryAfter - тогда ждем
+    указанное время и пропускаем промежуточные правки. Ошибки промежуточных
+    правок только логируются, исключение может выбросить лишь finish().
+    """
+
+    def __init__(self, message: Message, min_interval: float = None, min_chars: int = None):
+        self.message = message
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+        self.min_chars = min_chars if min_chars is not None else int(os.getenv('STREAM_EDIT_MIN_CHARS', '40'))
+        self._last_text = ""
+        self._pending = ""
+        self._next_edit_at = time.monotonic() + self.min_interval
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closed = False
+        self.edits = 0
+
+    async def update(self, text: str):
+        """Запомнить промежуточный текст - правку сделает фоновая задача"""
+        if self._closed:
+            return
+        self._pending = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    async def close(self):
+        """Остановить промежуточные правки (перед финальным текстом или сообщением об ошибке)"""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def finish(self, text: str):
+        """Финальный текст ответа - его нельзя пропустить, поэтому при лимите ждем"""
+        await self.close()
+        try:
+            await self._edit(text[:MAX_MESSAGE_LENGTH], raise_retry=True)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self._edit(text[:MAX_MESSAGE_LENGTH])
+
+    async def _run(self):
+        """Фоновая задача: не чаще min_interval правит сообщение последним текстом"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            delay = self._next_edit_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            text = self._pending
+            if len(text) - len(self._last_text) < self.min_chars:
+                continue
+            try:
+                await self._edit(text[:MAX_MESSAGE_LENGTH - len(TYPING_CURSOR)] + TYPING_CURSOR)
+            except Exception as e:
+                # Сообщение удалено, сеть и т.п. - дальнейшие правки тоже бессмысленны
+                logger.warning(f"Промежуточная правка сообщения не удалась: {e}")
+                return
+            self._last_text = text
+            self._next_edit_at = max(self._next_edit_at, time.monotonic() + self.min_interval)
+
+    async def _edit(self, text: str, raise_retry: bool = False):
+        try:
+            await self.message.edit_text(text)
+            self.edits += 1
+        except TelegramRetryAfter as e:
+            if raise_retry:
+                raise
+            logger.warning(f"Telegram ограничил правки сообщений, пауза {e.retry_after} сек")
+            self._next_edit_at = time.monotonic() + e.retry_after
+        except TelegramBadRequest as e:
+            # "message is not modified" - текст не изменился, это не ошибка
+            if "not modified" not in str(e):
+                raise
@@ -0,0 +1,56 @@
+# app/utils/tokens.py
+import math
+
+# Токенизатор модели в зависимостях нет, поэтому считаем приблизительно:
+# для русского текста с эмодзи выходит около 3 символов на токен
+CHARS_PER_TOKEN = 3
+# Служебные токены на каждое сообщение в chat-формате
+MESSAGE_OVERHEAD_TOKENS = 4
+# Стоимость картинки, если оценка не передана
+DEFAULT_IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Приблизительное число токенов в тексте"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message: dict, image_tokens: int = None) -> int:
+    """Приблизительное число токенов одного сообщения chat-формата"""
+    content = message.get("content")
+    tokens = MESSAGE_OVERHEAD_TOKENS
+
+    if isinstance(content, str):
+        return tokens + estimate_text_tokens(content)
+
+    for part in content or []:
+        if part.get("type") == "text":
+            tokens += estimate_text_tokens(part.get("text"))
+        elif part.get("type") == "image_url":
+            detail = part["image_url"].get("detail", "auto")
+            if detail == "low":
+                tokens += DEFAULT_IMAGE_TOKENS["low"]
+            else:
+                tokens += image_tokens or DEFAULT_IMAGE_TOKENS[detail]
+    return tokens
+
+
+def estimate_messages_tokens(messages: list, image_tokens: int = None) -> int:
+    """Приблизительное число токенов всего запроса"""
+    return sum(estimate_message_tokens(message, image_tokens) for message in messages)
+
+
+def estimate_image_tokens(messages: list, image_tokens: int = None) -> int:
+    """Приблизительное число токенов картинок в запросе"""
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            continue
+        for part in content or []:
+            if part.get("type") == "image_url":
+                detail = part["image_url"].get("detail", "auto")
+                tokens += DEFAULT_IMAGE_TOKENS["low"] if detail == "low" else image_tokens or DEFAULT_IMAGE_TOKENS[detail]
+    return tokens
@@ -0,0 +1,366 @@
+# benchmarks/load_test.py
+"""Нагрузочный тест сценария анализа фото.
+
+N виртуальных пользователей проходят через настоящий диспетчер из app/bot.py:
+фото -> "📊 Калорийность" -> уточнения -> "🔄 Новое фото". OpenAI и Telegram
+заменены локальными мок-серверами из tests/mocks, БД - хранилищем в памяти.
+
+    python -m benchmarks.load_test --users 50 --output results/main.json
+    python -m benchmarks.load_test --users 50 --compare results/main.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from tests.mocks.database import InMemoryDatabase
+from tests.mocks.openai_server import MockOpenAIServer, MockOpenAIConfig
+from tests.mocks.telegram_server import MockTelegramServer, MockTelegramConfig
+
+TOKEN = "123456:benchmark"
+FIRST_USER_ID = 100000
+RESULTS_DIR = Path(__file__).parent / "results"
+
+REFINEMENTS = [
+    "добавь ложку сахара",
+    "там еще стакан молока",
+    "соус сливочный, порция большая",
+    "30г сыра",
+    "это была индейка, а не курица",
+]
+
+# Метрики для сравнения прогонов: (путь в отчете, больше - лучше)
+COMPARED_METRICS = [
+    ("latency.all.p50", False),
+    ("latency.all.p95", False),
+    ("latency.all.p99", False),
+    ("throughput", True),
+    ("loop_lag.p99", False),
+    ("peak_rss_mb", False),
+]
+
+
+@dataclass
+class LoadProfile:
+    """Параметры прогона; одинаковый профиль и seed дают одинаковую нагрузку"""
+    users: int = 20
+    photos_per_user: int = 2
+    refinements: int = 2
+    think_time: float = 0.2
+    ramp_up: float = 1.0
+    subscription_type: str = "free"
+    seed: int = 42
+    openai_latency: float = 0.5
+    openai_jitter: float = 0.1
+    openai_error_rate: float = 0.0
+    telegram_latency: float = 0.02
+    db_latency: float = 0.002
+    # 1 - упреждающий анализ при получении фото (SPECULATIVE_PREFETCH)
+    speculative_prefetch: int = 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(values: List[float]) -> dict:
+    """p50/p95/p99/max в миллисекундах"""
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 0.50) * 1000, 2),
+        "p95": round(percentile(values, 0.95) * 1000, 2),
+        "p99": round(percentile(values, 0.99) * 1000, 2),
+        "max": round(max(values) * 1000, 2) if values else 0.0
+    }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LoopLagMonitor:
+    """Измеряет задержку event loop: насколько позже просыпается короткий sleep"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class LoadTest:
+    """Прогон профиля нагрузки через диспетчер бота"""
+
+    def __init__(self, profile: LoadProfile):
+        self.profile = profile
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors = 0
+        self.bot = None
+        self.dp = None
+        # Свои file_id в каждом прогоне: кэш путей getFile не переживает прогон
+        self.run_id = uuid.uuid4().hex[:8]
+
+    async def run(self) -> dict:
+        profile = self.profile
+        openai_server = MockOpenAIServer(MockOpenAIConfig(
+            latency=profile.openai_latency,
+            jitter=profile.openai_jitter,
+            error_rate=profile.openai_error_rate,
+            seed=profile.seed
+        ))
+        telegram_server = MockTelegramServer(MockTelegramConfig(
+            latency=profile.telegram_latency,
+            jitter=profile.telegram_latency / 2,
+            seed=profile.seed
+        ))
+        await openai_server.start()
+        await telegram_server.start()
+
+        # Импорт после запуска серверов: бот и анализатор направляются на моки
+        from app.bot import create_dispatcher
+        from app.handlers import photo_handler
+        from app.models.user import User
+        from app.services import UserService
+        from app.services.speculative_prefetch import speculative_prefetcher
+        from app.services.photo_spool import PhotoSpool
+        from app.services import gpt_analyzer as gpt_analyzer_module
+        from app.services.analysis_cache import AnalysisCache
+        from app.services.photo_hash import NearDuplicateIndex
+
+        analyzer = photo_handler.gpt_analyzer
+        original_client = analyzer.client
+        analyzer.client = original_client.with_options(api_key="mock", base_url=openai_server.base_url)
+        # Пустое хранилище фото: каждый прогон скачивает фото заново
+        spool_dir = tempfile.TemporaryDirectory(prefix="foodlens_bench_")
+        original_spool = photo_handler.photo_spool
+        photo_handler.photo_spool = PhotoSpool(spool_dir.name)
+        # Пустые кэши анализов: прогоны сравнимы между собой
+        original_cache = gpt_analyzer_module.analysis_cache
+        original_index = gpt_analyzer_module.near_duplicate_index
+        gpt_analyzer_module.analysis_cache = AnalysisCache()
+        gpt_analyzer_module.near_duplicate_index = NearDuplicateIndex()
+
+        self.bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_server.base_url)))
+        self.bot.user_service = UserService(InMemoryDatabase(latency=profile.db_latency))
+        for index in range(profile.users):
+            await self.bot.user_service.save_user(User(
+                user_id=FIRST_USER_ID + index,
+                subscription_type=profile.subscription_type
+            ))
+        self.dp = create_dispatcher()
+        speculative_prefetcher.enabled = bool(profile.speculative_prefetch)
+
+        monitor = LoopLagMonitor()
+        monitor.start()
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(self._user(index) for index in range(profile.users)))
+        finally:
+            duration = time.perf_counter() - started
+            await monitor.stop()
+            analyzer.client = original_client
+            photo_handler.photo_spool = original_spool
+            gpt_analyzer_module.analysis_cache = original_cache
+            gpt_analyzer_module.near_duplicate_index = original_index
+            spool_dir.cleanup()
+            await self.bot.session.close()
+            await openai_server.stop()
+            await telegram_server.stop()
+
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        return {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "profile": asdict(profile)
+            },
+            "updates": len(all_latencies),
+            "errors": self.errors,
+            "duration": round(duration, 3),
+            "throughput": round(len(all_latencies) / duration, 2) if duration else 0.0,
+            "latency": {
+                "all": summarize(all_latencies),
+                **{step: summarize(values) for step, values in self.latencies.items()}
+            },
+            "loop_lag": summarize(monitor.samples),
+            "peak_rss_mb": peak_rss_mb(),
+            "openai": {key: openai_server.stats[key] for key in ("requests", "streamed", "errors", "prompt_tokens", "completion_tokens")},
+            "telegram": {**telegram_server.stats, "calls": dict(telegram_server.calls)},
+            "speculative": speculative_prefetcher.get_stats()
+        }
+
+    async def _user(self, index: int):
+        from app.core.i18n import get_localization
+        i18n = get_localization()
+        profile = self.profile
+        rng = random.Random(f"{profile.seed}:{index}")
+        user_id = FIRST_USER_ID + index
+
+        await asyncio.sleep(profile.ramp_up * index / max(1, profile.users))
+        for photo in range(profile.photos_per_user):
+            await self._send(user_id, "photo", photo_id=f"bench_{self.run_id}_{index}_{photo}")
+            await self._think(rng)
+            await self._send(user_id, "nutrition", text=i18n.get_button_text("nutrition"))
+            for _ in range(profile.refinements):
+                await self._think(rng)
+                await self._send(user_id, "refinement", text=rng.choice(REFINEMENTS))
+            await self._think(rng)
+            await self._send(user_id, "new_photo", text=i18n.get_button_text("new_photo"))
+
+    async def _think(self, rng: random.Random):
+        if self.profile.think_time:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * self.profile.think_time)
+
+    async def _send(self, user_id: int, step: str, text: str = None, photo_id: str = None):
+        message = {
+            "message_id": int(time.time() * 1000) % 1_000_000_000,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+        }
+        if photo_id:
+            message["photo"] = [{
+                "file_id": photo_id,
+                "file_unique_id": f"u_{photo_id}",
+                "width": 1280,
+                "height": 960
+            }]
+        else:
+            message["text"] = text
+        update = Update.model_validate({"update_id": 0, "message": message}, context={"bot": self.bot})
+
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            logging.getLogger(__name__).warning(f"Ошибка обработки {step}: {e}")
+        self.latencies.setdefault(step, []).append(time.perf_counter() - started)
+
+
+def get_metric(report: dict, path: str) -> Optional[float]:
+    value = report
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.2) -> List[dict]:
+    """Сравнение с базовым прогоном; regression - ухудшение больше threshold"""
+    rows = []
+    for path, higher_is_better in COMPARED_METRICS:
+        new, old = get_metric(current, path), get_metric(baseline, path)
+        if new is None or old is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        rows.append({
+            "metric": path,
+            "baseline": old,
+            "current": new,
+            "change": round(change, 4),
+            "regression": worse > threshold
+        })
+    return rows
+
+
+def print_report(report: dict):
+    latency = report["latency"]["all"]
+    print(f"📦 Обновлений: {report['updates']}, ошибок: {report['errors']}, {report['duration']} сек")
+    print(f"⚡ Пропускная способность: {report['throughput']} обн/сек")
+    print(f"⏱️ Задержка: p50 {latency['p50']} мс, p95 {latency['p95']} мс, p99 {latency['p99']} мс")
+    for step, stats in report["latency"].items():
+        if step != "all":
+            print(f"   {step:<12} p50 {stats['p50']:>8} мс  p95 {stats['p95']:>8} мс  ({stats['count']})")
+    print(f"🔁 Задержка event loop: p99 {report['loop_lag']['p99']} мс, max {report['loop_lag']['max']} мс")
+    print(f"🧠 Пиковая память: {report['peak_rss_mb']} МБ")
+    print(f"🤖 Запросов к OpenAI: {report['openai']['requests']}")
+
+
+def print_comparison(rows: List[dict]):
+    print("\n📊 Сравнение с базовым прогоном:")
+    for row in rows:
+        mark = "❌" if row["regression"] else "✅"
+        print(f"{mark} {row['metric']:<18} {row['baseline']:>10} -> {row['current']:>10} ({row['change']:+.1%})")
+
+
+def main():
+    defaults = LoadProfile()
+    parser = argparse.ArgumentParser(description="Нагрузочный тест анализа фото на мок-серверах")
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--output", help="Куда сохранить отчет (по умолчанию benchmarks/results/)")
+    parser.add_argument("--compare", help="Отчет базового прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое ухудшение метрик")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(name)s - %(message)s")
+    profile = LoadProfile(**{name: getattr(args, name) for name in asdict(defaults)})
+    report = asyncio.run(LoadTest(profile).run())
+    print_report(report)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['meta']['revision'] or 'local'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"💾 Отчет сохранен: {output}")
+
+    if args.compare:
+        rows = compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.threshold)
+        print_comparison(rows)
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
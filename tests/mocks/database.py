@@ -0,0 +1,34 @@
+# tests/mocks/database.py
+import asyncio
+import copy
+from typing import Dict, Optional
+
+
+class InMemoryDatabase:
+    """Замена Database для нагрузочных тестов: пользователи хранятся в памяти.
+
+    Реализует только методы, которые нужны UserService. Задержка latency
+    имитирует сетевой запрос к Postgres.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.users: Dict[int, dict] = {}
+        self.queries = 0
+
+    async def _query(self):
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def init_db(self):
+        pass
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        await self._query()
+        user = self.users.get(user_id)
+        return copy.copy(user) if user else None
+
+    async def save_user(self, user_data: dict):
+        await self._query()
+        self.users[user_data['user_id']] = copy.copy(user_data)
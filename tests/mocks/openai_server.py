@@ -0,0 +1,243 @@
+# tests/mocks/openai_server.py
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+
+from aiohttp import web
+
+from app.utils.tokens import estimate_messages_tokens
+
+DEFAULT_TEXT_ANSWER = (
+    "🔥 500 Ккал\n"
+    "🍗 Б: 30г  🥑 Ж: 20г  🍚 У: 60г\n\n"
+    "🍽️ Паста с курицей\n"
+    "- 🔥 Калории: 500 ккал\n"
+    "- ⚖️ Вес: 350г\n"
+    "- 🍗 Белки: 30г\n"
+    "- 🥑 Жиры: 20г\n"
+    "- 🍚 Углеводы: 60г"
+)
+
+DEFAULT_JSON_ANSWER = {
+    "status": "ok",
+    "dishes": [{
+        "name": "Паста с курицей", "weight_g": 350, "weight_note": "", "kcal": 500,
+        "protein": 30, "fat": 20, "carbs": 60, "is_drink": False
+    }],
+    "questions": [],
+    "confidence": 0.9
+}
+
+
+@dataclass
+class MockOpenAIConfig:
+    """Поведение мок-сервера; меняется на лету через POST /_config"""
+    # Задержка до первого байта ответа и ее разброс, сек
+    latency: float = 0.5
+    jitter: float = 0.1
+    # Пауза между фрагментами потокового ответа, сек
+    stream_chunk_delay: float = 0.02
+    stream_chunk_chars: int = 20
+    # Доля ответов с ошибкой и ее HTTP-статус (429 - с retry-after)
+    error_rate: float = 0.0
+    error_status: int = 500
+    # None - оценка по запросу
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Доля входных токенов "из кэша" для промтов длиннее 1024 токенов
+    cached_ratio: float = 0.0
+    text_answer: str = DEFAULT_TEXT_ANSWER
+    json_answer: dict = field(default_factory=lambda: dict(DEFAULT_JSON_ANSWER))
+    rpm_limit: int = 500
+    tpm_limit: int = 200000
+    seed: Optional[int] = None
+
+
+class MockOpenAIServer:
+    """Локальная замена OpenAI chat completions для нагрузочных тестов.
+
+    Поддерживает обычные и потоковые (SSE) ответы, response_format json_schema,
+    usage с cached_tokens и заголовки x-ratelimit-*. GPTAnalyzer направляется
+    сюда через OPENAI_BASE_URL=http://host:port/v1.
+    """
+
+    def __init__(self, config: MockOpenAIConfig = None):
+        self.config = config or MockOpenAIConfig()
+        self._random = random.Random(self.config.seed)
+        self._runner = None
+        self.base_url = None
+        self.stats = {
+            "requests": 0,
+            "streamed": 0,
+            "errors": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "models": {}
+        }
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        app.router.add_get("/_stats", self._get_stats)
+        app.router.add_post("/_config", self._set_config)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер; возвращает base URL для клиента OpenAI"""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _latency(self) -> float:
+        return max(0.0, self.config.latency + self._random.uniform(-self.config.jitter, self.config.jitter))
+
+    def _headers(self) -> dict:
+        return {
+            "x-ratelimit-limit-requests": str(self.config.rpm_limit),
+            "x-ratelimit-remaining-requests": str(max(0, self.config.rpm_limit - 1)),
+            "x-ratelimit-limit-tokens": str(self.config.tpm_limit),
+            "x-ratelimit-remaining-tokens": str(self.config.tpm_limit),
+            "x-request-id": uuid.uuid4().hex
+        }
+
+    def _usage(self, body: dict, content: str) -> dict:
+        prompt_tokens = self.config.prompt_tokens or estimate_messages_tokens(body.get("messages", []))
+        completion_tokens = self.config.completion_tokens or max(1, len(content) // 3)
+        cached_tokens = int(prompt_tokens * self.config.cached_ratio) if prompt_tokens >= 1024 else 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+    def _error_response(self) -> web.Response:
+        self.stats["errors"] += 1
+        headers = self._headers()
+        if self.config.error_status == 429:
+            headers["retry-after-ms"] = "200"
+        return web.json_response(
+            {"error": {"message": "Mock error", "type": "server_error", "code": None}},
+            status=self.config.error_status,
+            headers=headers
+        )
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "gpt-4o-mini")
+        self.stats["requests"] += 1
+        self.stats["models"][model] = self.stats["models"].get(model, 0) + 1
+
+        await asyncio.sleep(self._latency())
+        if self._random.random() < self.config.error_rate:
+            return self._error_response()
+
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = json.dumps(self.config.json_answer, ensure_ascii=False)
+        else:
+            content = self.config.text_answer
+
+        usage = self._usage(body, content)
+        self.stats["prompt_tokens"] += usage["prompt_tokens"]
+        self.stats["completion_tokens"] += usage["completion_tokens"]
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        if body.get("stream"):
+            return await self._stream(request, body, completion_id, created, model, content, usage)
+
+        return web.json_response({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }, headers=self._headers())
+
+    async def _stream(self, request, body, completion_id, created, model, content, usage) -> web.StreamResponse:
+        self.stats["streamed"] += 1
+        response = web.StreamResponse(headers={**self._headers(), "Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(choices, chunk_usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                "usage": chunk_usage
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        await send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        step = max(1, self.config.stream_chunk_chars)
+        for start in range(0, len(content), step):
+            await send([{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}])
+            await asyncio.sleep(self.config.stream_chunk_delay)
+        await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send([], usage)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "config": asdict(self.config)})
+
+    async def _set_config(self, request: web.Request) -> web.Response:
+        for key, value in (await request.json()).items():
+            if hasattr(self.config, key):
+                setattr(self.config, key, value)
+        return web.json_response(asdict(self.config))
+
+
+async def _serve(args):
+    server = MockOpenAIServer(MockOpenAIConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        cached_ratio=args.cached_ratio,
+        seed=args.seed
+    ))
+    print(f"🤖 Мок OpenAI: OPENAI_BASE_URL={await server.start(args.host, args.port)}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Мок-сервер OpenAI chat completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--cached-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    asyncio.run(_serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
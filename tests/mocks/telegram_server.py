@@ -0,0 +1,250 @@
+# tests/mocks/telegram_server.py
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+from aiohttp import web
+from PIL import Image
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "FoodLens", "username": "foodlens_mock_bot"}
+
+# Методы, которые в Bot API возвращают True
+TRUE_METHODS = {
+    "deletewebhook", "setmycommands", "sendchataction", "answercallbackquery",
+    "deletemessage", "setwebhook", "close", "logout"
+}
+
+
+@dataclass
+class MockTelegramConfig:
+    """Поведение мок-сервера Bot API; меняется на лету через POST /_config"""
+    latency: float = 0.05
+    jitter: float = 0.02
+    error_rate: float = 0.0
+    # Правок одного чата в секунду до ответа 429 (0 - без ограничения)
+    edits_per_second: float = 0.0
+    # Размер фото, которое отдается при скачивании незарегистрированного файла
+    photo_width: int = 1280
+    photo_height: int = 960
+    seed: Optional[int] = None
+
+
+class MockTelegramServer:
+    """Локальная замена Telegram Bot API для нагрузочных тестов.
+
+    Отвечает на методы, которые использует бот (getMe, sendMessage,
+    editMessageText, getFile...), отдает файлы по /file/bot<token>/<path>
+    и раздает обновления через getUpdates. Бот направляется сюда
+    через TELEGRAM_API_URL=http://host:port.
+    """
+
+    def __init__(self, config: MockTelegramConfig = None):
+        self.config = config or MockTelegramConfig()
+        self._random = random.Random(self.config.seed)
+        self._runner = None
+        self._files: Dict[str, bytes] = {}
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._update_id = 0
+        self._message_id = 0
+        self._last_edit: Dict[int, float] = {}
+        self.base_url = None
+        self.calls = defaultdict(int)
+        self.messages = defaultdict(list)
+        self.stats = {"requests": 0, "errors": 0, "flood_limited": 0, "downloads": 0}
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._api_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._download)
+        app.router.add_get("/_stats", self._get_stats)
+        app.router.add_post("/_config", self._set_config)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер; возвращает base URL для TELEGRAM_API_URL"""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_file(self, file_id: str, data: bytes):
+        """Регистрирует содержимое файла для getFile и скачивания"""
+        self._files[file_id] = data
+
+    def push_update(self, update: dict) -> int:
+        """Ставит обновление в очередь getUpdates; возвращает его update_id"""
+        self._update_id += 1
+        self._updates.put_nowait({**update, "update_id": self._update_id})
+        return self._update_id
+
+    def next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    def _photo_bytes(self, file_id: str) -> bytes:
+        if file_id not in self._files:
+            # Детерминированная картинка из хэша file_id: крупные цветные блоки,
+            # чтобы у разных файлов отличались и перцептивные хэши
+            pixels = random.Random(hashlib.md5(file_id.encode()).digest()).randbytes(16 * 12 * 3)
+            image = Image.frombytes("RGB", (16, 12), pixels).resize(
+                (self.config.photo_width, self.config.photo_height), Image.NEAREST
+            )
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=85)
+            self._files[file_id] = buffer.getvalue()
+        return self._files[file_id]
+
+    def _message(self, chat_id: int, text: str = None, message_id: int = None) -> dict:
+        return {
+            "message_id": message_id or self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text
+        }
+
+    @staticmethod
+    async def _params(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, str) and value[:1] in "[{":
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params
+
+    async def _api_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        name = method.lower()
+        params = await self._params(request)
+        self.stats["requests"] += 1
+        self.calls[method] += 1
+
+        await asyncio.sleep(max(0.0, self.config.latency + self._random.uniform(-self.config.jitter, self.config.jitter)))
+        if name != "getupdates" and self._random.random() < self.config.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"}, status=500)
+
+        if name == "getme":
+            return self._ok(BOT_USER)
+        if name == "getupdates":
+            return self._ok(await self._get_updates(params))
+        if name in TRUE_METHODS:
+            return self._ok(True)
+
+        chat_id = int(params.get("chat_id", 0) or 0)
+        if name == "sendmessage":
+            message = self._message(chat_id, params.get("text"))
+            self.messages[chat_id].append(message["text"])
+            return self._ok(message)
+        if name == "editmessagetext":
+            retry_after = self._flood_wait(chat_id)
+            if retry_after:
+                self.stats["flood_limited"] += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after}
+                }, status=429)
+            self.messages[chat_id].append(params.get("text"))
+            return self._ok(self._message(chat_id, params.get("text"), int(params.get("message_id", 0))))
+        if name == "getfile":
+            file_id = params["file_id"]
+            data = self._photo_bytes(file_id)
+            return self._ok({
+                "file_id": file_id,
+                "file_unique_id": f"u_{file_id}",
+                "file_size": len(data),
+                "file_path": f"photos/{file_id}.jpg"
+            })
+
+        return self._ok(True)
+
+    def _flood_wait(self, chat_id: int) -> int:
+        if not self.config.edits_per_second:
+            return 0
+        now = time.monotonic()
+        last = self._last_edit.get(chat_id)
+        min_interval = 1 / self.config.edits_per_second
+        if last is not None and now - last < min_interval:
+            return max(1, int(min_interval - (now - last) + 0.999))
+        self._last_edit[chat_id] = now
+        return 0
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset", 0) or 0)
+        timeout = float(params.get("timeout", 0) or 0)
+        updates = []
+        try:
+            update = await asyncio.wait_for(self._updates.get(), timeout=timeout or 0.01)
+            updates.append(update)
+            while not self._updates.empty():
+                updates.append(self._updates.get_nowait())
+        except asyncio.TimeoutError:
+            pass
+        return [update for update in updates if update["update_id"] >= offset]
+
+    async def _download(self, request: web.Request) -> web.Response:
+        self.stats["downloads"] += 1
+        path = request.match_info["path"]
+        file_id = path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        return web.Response(body=self._photo_bytes(file_id), content_type="image/jpeg")
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "calls": dict(self.calls), "config": asdict(self.config)})
+
+    async def _set_config(self, request: web.Request) -> web.Response:
+        for key, value in (await request.json()).items():
+            if hasattr(self.config, key):
+                setattr(self.config, key, value)
+        return web.json_response(asdict(self.config))
+
+
+async def _serve(args):
+    server = MockTelegramServer(MockTelegramConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        edits_per_second=args.edits_per_second,
+        seed=args.seed
+    ))
+    print(f"📨 Мок Telegram Bot API: TELEGRAM_API_URL={await server.start(args.host, args.port)}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Мок-сервер Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--edits-per-second", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    asyncio.run(_serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,7 +20,7 @@ async def quick_test():
     
     try:
         # Простой текстовый запрос
-        response = analyzer.client.chat.completions.create(
+        response = await analyzer.client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": "Скажи 'привет'"}],
             max_tokens=10
@@ -0,0 +1,52 @@
+# tests/test_album_middleware.py
+import asyncio
+import pytest
+from aiogram.types import Message
+from app.middlewares.album_middleware import AlbumMiddleware
+
+
+def make_message(message_id: int, media_group_id: str = None, caption: str = None) -> Message:
+    return Message.model_validate({
+        "message_id": message_id,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "User"},
+        "media_group_id": media_group_id,
+        "caption": caption,
+        "photo": [{"file_id": f"f{message_id}", "file_unique_id": f"u{message_id}", "width": 1280, "height": 960}]
+    })
+
+
+class TestAlbumMiddleware:
+    """Тесты сборки альбома в одно событие"""
+
+    @pytest.fixture
+    def middleware(self, monkeypatch):
+        monkeypatch.setenv('ALBUM_COLLECT_WINDOW', '0.05')
+        monkeypatch.setenv('ALBUM_MAX_PHOTOS', '3')
+        return AlbumMiddleware()
+
+    @pytest.mark.asyncio
+    async def test_album_handled_once(self, middleware):
+        """Фото альбома доходят до обработчика одним вызовом, по порядку и не больше лимита"""
+        calls = []
+
+        async def handler(event, data):
+            calls.append((event.message_id, [message.message_id for message in data.get('album', [])]))
+
+        messages = [make_message(message_id, "album-1") for message_id in (12, 11, 13, 14)]
+        await asyncio.gather(*(middleware(handler, message, {}) for message in messages))
+
+        assert calls == [(11, [11, 12, 13])]
+        assert middleware._albums == {}
+
+    @pytest.mark.asyncio
+    async def test_single_photo_passes_through(self, middleware):
+        """Фото без media_group_id обрабатывается сразу, без альбома"""
+        calls = []
+
+        async def handler(event, data):
+            calls.append(data.get('album'))
+
+        await middleware(handler, make_message(1), {})
+        assert calls == [None]
@@ -0,0 +1,96 @@
+# tests/test_analysis_cache.py
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, Mock
+from app.services.analysis_cache import AnalysisCache
+
+
+class TestAnalysisCache:
+    """Тесты кэша результатов анализа"""
+
+    def test_key_normalization(self):
+        """Регистр, пробелы и ё не влияют на ключ"""
+        key1 = AnalysisCache.make_key("uniq1", "nutrition", ["  Гречка  с  курицей "])
+        key2 = AnalysisCache.make_key("uniq1", "nutrition", ["гречка с курицей"])
+        key3 = AnalysisCache.make_key("uniq1", "recipe", ["гречка с курицей"])
+
+        assert key1 == key2
+        assert key1 != key3
+
+    def test_key_depends_on_route(self):
+        """Ответы разных цепочек моделей не смешиваются"""
+        fast = AnalysisCache.make_key("uniq1", "nutrition", [], "gpt-4o-mini")
+        strong = AnalysisCache.make_key("uniq1", "nutrition", [], "gpt-4o")
+        escalating = AnalysisCache.make_key("uniq1", "nutrition", [], "gpt-4o-mini>gpt-4o")
+
+        assert len({fast, strong, escalating}) == 3
+        assert AnalysisCache.route_key([Mock(model="gpt-4o-mini"), Mock(model="gpt-4o")]) == "gpt-4o-mini>gpt-4o"
+
+    @pytest.mark.asyncio
+    async def test_memory_lru(self):
+        """LRU вытесняет самые старые записи"""
+        cache = AnalysisCache()
+        cache.max_entries = 2
+
+        await cache.set("a", "nutrition", "A")
+        await cache.set("b", "nutrition", "B")
+        assert await cache.get("a") == "A"
+        await cache.set("c", "nutrition", "C")
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "A"
+        assert cache.stats["memory_hits"] == 2
+        assert cache.stats["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_miss(self):
+        """Истекшая запись не отдается"""
+        cache = AnalysisCache()
+        cache.ttl = -1
+
+        await cache.set("a", "nutrition", "A")
+        assert await cache.get("a") is None
+
+    @pytest.mark.asyncio
+    async def test_database_level(self):
+        """Промах в памяти проверяется в БД, результат поднимается в память"""
+        database = Mock()
+        database.get_cached_analysis = AsyncMock(return_value={
+            'content': "из БД",
+            'expires_at': datetime.now(timezone.utc) + timedelta(hours=1)
+        })
+        cache = AnalysisCache(database)
+
+        assert await cache.get("key") == "из БД"
+        assert await cache.get("key") == "из БД"
+        assert cache.stats["db_hits"] == 1
+        assert cache.stats["memory_hits"] == 1
+        database.get_cached_analysis.assert_awaited_once_with("key")
+
+    @pytest.mark.asyncio
+    async def test_purge(self):
+        """Очистка затрагивает оба уровня"""
+        database = Mock()
+        database.save_cached_analysis = AsyncMock()
+        database.purge_analysis_cache = AsyncMock(return_value=5)
+        database.purge_expired_analysis_cache = AsyncMock(return_value=0)
+        cache = AnalysisCache(database)
+
+        await cache.set("a", "nutrition", "A")
+        assert await cache.purge() == 5
+        assert cache.get_stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_expired_rows_purged_on_write(self):
+        """Запись удаляет истекшие строки из БД, но не чаще purge_interval"""
+        database = Mock()
+        database.save_cached_analysis = AsyncMock()
+        database.purge_expired_analysis_cache = AsyncMock(return_value=3)
+        cache = AnalysisCache(database)
+        cache.purge_interval = 3600
+
+        await cache.set("a", "nutrition", "A")
+        await cache.set("b", "nutrition", "B")
+
+        database.purge_expired_analysis_cache.assert_awaited_once()
+        assert cache.get_stats()["expired_purged"] == 3
@@ -0,0 +1,115 @@
+# tests/test_analyzer_session.py
+import asyncio
+import io
+import random
+import uuid
+import pytest
+import pytest_asyncio
+from PIL import Image
+from app.services.gpt_analyzer import GPTAnalyzer
+from tests.mocks.openai_server import MockOpenAIServer, MockOpenAIConfig
+
+
+def make_photo() -> io.BytesIO:
+    """Уникальная картинка, чтобы не попасть в кэш и индекс похожих фото"""
+    pixels = random.Random(uuid.uuid4().hex).randbytes(16 * 12 * 3)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (16, 12), pixels).resize((640, 480), Image.NEAREST).save(buffer, "JPEG")
+    buffer.seek(0)
+    return buffer
+
+
+class TestAnalyzerSession:
+    """Тесты сессии анализа на мок-сервере OpenAI"""
+
+    @pytest_asyncio.fixture
+    async def server(self):
+        server = MockOpenAIServer(MockOpenAIConfig(latency=0, jitter=0, stream_chunk_delay=0, seed=1))
+        await server.start()
+        yield server
+        await server.stop()
+
+    @pytest.fixture
+    def analyzer(self, server, monkeypatch):
+        monkeypatch.setenv('OPENAI_API_KEY', 'mock')
+        analyzer = GPTAnalyzer()
+        analyzer.client = analyzer.client.with_options(base_url=server.base_url)
+        return analyzer
+
+    @pytest.mark.asyncio
+    async def test_repeated_buttons_memoized(self, server, analyzer):
+        """Повторные кнопки без новой информации не ходят в OpenAI и не тратят сообщения"""
+        user_id = random.randint(1, 10 ** 9)
+        photo = make_photo()
+        first = await analyzer.analyze_food_image(user_id, photo, "nutrition", file_unique_id=uuid.uuid4().hex)
+        again = await analyzer.analyze_food_image(user_id, photo, "nutrition")
+        assert server.stats["requests"] == 1
+        assert again["analysis"] == first["analysis"]
+        assert again["messages_left"] == first["messages_left"]
+
+        recipe = await analyzer.analyze_food_image(user_id, photo, "recipe")
+        await analyzer.analyze_food_image(user_id, photo, "nutrition")
+        recipe_again = await analyzer.analyze_food_image(user_id, photo, "recipe")
+        assert server.stats["requests"] == 2
+        assert recipe_again["messages_left"] == recipe["messages_left"] == first["messages_left"] - 1
+
+    @pytest.mark.asyncio
+    async def test_refinement_invalidates_memo(self, server, analyzer):
+        """Уточнение - новая информация: следующий ответ запрашивается заново"""
+        user_id = random.randint(1, 10 ** 9)
+        photo = make_photo()
+        await analyzer.analyze_food_image(user_id, photo, "recipe", file_unique_id=uuid.uuid4().hex)
+        refined = await analyzer.analyze_food_image(user_id, None, "nutrition", "соус сливочный, порция большая")
+        await analyzer.analyze_food_image(user_id, photo, "recipe")
+        assert server.stats["requests"] == 3
+
+        again = await analyzer.analyze_food_image(user_id, photo, "nutrition")
+        assert server.stats["requests"] == 3
+        assert again["analysis"] == refined["analysis"]
+
+    @pytest.mark.asyncio
+    async def test_end_session_cancels_analysis(self, server, analyzer):
+        """Новое фото или отмена прерывают выполняющийся запрос"""
+        server.config.latency = 1
+        user_id = random.randint(1, 10 ** 9)
+        analysis = asyncio.create_task(
+            analyzer.analyze_food_image(user_id, make_photo(), "nutrition", file_unique_id=uuid.uuid4().hex)
+        )
+        while server.stats["requests"] == 0:
+            await asyncio.sleep(0.01)
+
+        analyzer.end_session(user_id)
+        assert await asyncio.wait_for(analysis, timeout=1) == {"error": "cancelled"}
+        assert not analyzer.has_active_session(user_id)
+        assert not analyzer._tasks
+
+    @pytest.mark.asyncio
+    async def test_deadline_keeps_message(self, server, analyzer):
+        """Превышение срока не тратит сообщение сессии - уточнение можно повторить"""
+        user_id = random.randint(1, 10 ** 9)
+        photo = make_photo()
+        first = await analyzer.analyze_food_image(user_id, photo, "nutrition", file_unique_id=uuid.uuid4().hex)
+
+        server.config.latency = 1
+        analyzer.analysis_deadline = 0.2
+        assert await analyzer.analyze_food_image(user_id, None, "nutrition", "соус сливочный") == {"error": "timeout"}
+
+        server.config.latency = 0
+        retried = await analyzer.analyze_food_image(user_id, None, "nutrition", "соус сливочный")
+        assert retried["messages_left"] == first["messages_left"] - 1
+
+    @pytest.mark.asyncio
+    async def test_album_single_request(self, server, analyzer):
+        """Альбом - одна сессия и один запрос со всеми фото"""
+        user_id = random.randint(1, 10 ** 9)
+        photos = [make_photo().getvalue() for _ in range(3)]
+        file_unique_ids = [uuid.uuid4().hex for _ in photos]
+        result = await analyzer.analyze_food_image(user_id, photos, "nutrition", file_unique_id=file_unique_ids)
+
+        assert server.stats["requests"] == 1
+        assert result["messages_left"] == 4
+        session = analyzer.user_sessions[user_id]
+        images = [part for part in session["messages"][1]["content"] if part["type"] == "image_url"]
+        assert len(images) == 3
+        assert session["file_unique_id"] == "+".join(file_unique_ids)
+        assert session["image_hash"] is None
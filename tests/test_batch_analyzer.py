@@ -0,0 +1,109 @@
+# tests/test_batch_analyzer.py
+import io
+import json
+import openai
+import pytest
+import pytest_asyncio
+from PIL import Image
+from app.services.analysis_cache import AnalysisCache
+from app.services import batch_analyzer
+from app.services.batch_analyzer import BatchAnalyzer, LocalBatchClient, collect_items, write_batch_file
+from app.services.model_router import model_router
+from app.services.photo_spool import PhotoSpool
+from tests.mocks.openai_server import MockOpenAIServer, MockOpenAIConfig
+
+
+class TestBatchAnalyzer:
+    """Тесты пакетного анализа на локальной замене Batch API"""
+
+    @pytest_asyncio.fixture
+    async def photos(self, tmp_path):
+        """Хранилище фото бота: файлы по sha256, file_unique_id - в ручках"""
+        spool = PhotoSpool(str(tmp_path / "photos"))
+        for handle, color in (("uniq_a", (200, 100, 50)), ("uniq_b", (20, 150, 90))):
+            buffer = io.BytesIO()
+            Image.new("RGB", (640, 480), color).save(buffer, "JPEG")
+            await spool.put(handle, buffer.getvalue())
+        return spool.directory
+
+    @pytest.fixture
+    def cache(self, monkeypatch):
+        cache = AnalysisCache()
+        monkeypatch.setattr(batch_analyzer, "analysis_cache", cache)
+        return cache
+
+    def test_write_batch_file(self, photos, tmp_path, cache):
+        """Строки пакета в формате Batch API"""
+        path = tmp_path / "batch.jsonl"
+        count = write_batch_file(collect_items(str(photos), "nutrition"), str(path))
+
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        assert count == 2
+        assert lines[0]["url"] == "/v1/chat/completions"
+        assert lines[0]["body"]["response_format"]["type"] == "json_schema"
+        assert lines[0]["body"]["messages"][0]["role"] == "system"
+        assert lines[0]["custom_id"].startswith("nutrition:")
+
+    @pytest.mark.asyncio
+    async def test_run_and_ingest(self, photos, tmp_path, cache):
+        """Отправка, ожидание и сохранение ответов в кэш анализов"""
+        calls = []
+
+        async def responder(body):
+            calls.append(body)
+            if len(calls) == 2:
+                raise RuntimeError("boom")
+            return {
+                "choices": [{"message": {"role": "assistant", "content": '{"status": "ok"}'}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}
+            }
+
+        path = tmp_path / "batch.jsonl"
+        write_batch_file(collect_items(str(photos), "nutrition"), str(path))
+        analyzer = BatchAnalyzer(LocalBatchClient(responder, str(tmp_path / "storage")))
+        results = await analyzer.run(str(path), interval=0.01, timeout=5)
+
+        ok = [result for result in results if result.content]
+        assert len(results) == 2
+        assert len(ok) == 1
+        assert ok[0].usage["total_tokens"] == 110
+        assert await cache.get(ok[0].cache_key) == '{"status": "ok"}'
+        # Тот же ключ, что бот строит для первого хода по этому фото
+        route_key = AnalysisCache.route_key(model_router.route("nutrition"))
+        bot_keys = {AnalysisCache.make_key(handle, "nutrition_json", [], route_key) for handle in ("uniq_a", "uniq_b")}
+        assert {result.cache_key for result in results} == bot_keys
+
+    @pytest.mark.asyncio
+    async def test_default_responder_reuses_client(self, photos, tmp_path, cache, monkeypatch):
+        """Все строки пакета идут через один клиент OpenAI, после пакета он закрыт"""
+        server = MockOpenAIServer(MockOpenAIConfig(latency=0, jitter=0, stream_chunk_delay=0, seed=1))
+        monkeypatch.setenv('OPENAI_API_KEY', 'mock')
+        monkeypatch.setenv('OPENAI_BASE_URL', await server.start())
+        created = []
+        original_client = openai.AsyncOpenAI
+
+        def counting_client(*args, **kwargs):
+            created.append(original_client(*args, **kwargs))
+            return created[-1]
+        monkeypatch.setattr(openai, "AsyncOpenAI", counting_client)
+
+        try:
+            path = tmp_path / "batch.jsonl"
+            write_batch_file(collect_items(str(photos), "nutrition"), str(path))
+            client = LocalBatchClient(storage_dir=str(tmp_path / "storage"))
+            results = await BatchAnalyzer(client).run(str(path), interval=0.01, timeout=5)
+        finally:
+            await server.stop()
+
+        assert len([result for result in results if result.content]) == 2
+        assert server.stats["requests"] == 2
+        assert len(created) == 1
+        assert created[0].is_closed()
+        assert client._client is None
+
+    def test_collect_items_from_spool(self, photos):
+        """Пакет берет file_unique_id из ручек хранилища, а не из имен файлов"""
+        items = collect_items(str(photos), "nutrition")
+
+        assert sorted(item.file_unique_id for item in items) == ["uniq_a", "uniq_b"]
+        assert all(item.image_path.startswith(str(photos / "blobs")) for item in items)
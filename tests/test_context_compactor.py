@@ -0,0 +1,87 @@
+# tests/test_context_compactor.py
+import pytest
+from app.services.context_compactor import ContextCompactor, SUMMARY_PREFIX, summarize_answer
+
+ANSWER = """🔥 500 Ккал
+🍗 Б: 30г  🥑 Ж: 20г  🍚 У: 120г
+
+🍽️ Яйца с творогом
+- 🔥 Калории: 500 ккал
+- ⚖️ Вес: 420г
+- 🍗 Белки: 30г
+- 🥑 Жиры: 20г
+- 🍚 Углеводы: 120г"""
+
+
+def make_session(turns: int) -> dict:
+    """Сессия с фото и несколькими ходами диалога"""
+    messages = [
+        {"role": "system", "content": "системный промт"},
+        {"role": "user", "content": [
+            {"type": "text", "text": "Проанализируй это фото еды:"},
+            {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,FULL", "detail": "high"}}
+        ]}
+    ]
+    for turn in range(turns):
+        messages.append({"role": "assistant", "content": ANSWER})
+        messages.append({"role": "user", "content": f"уточнение {turn}"})
+    return {"messages": messages, "low_detail_base64": "LOW", "image_tokens": 765}
+
+
+class TestContextCompactor:
+    """Тесты сокращения контекста уточнений"""
+
+    @pytest.fixture
+    def compactor(self):
+        compactor = ContextCompactor()
+        compactor.image_policy = "low"
+        compactor.token_budget = 3000
+        return compactor
+
+    def test_first_request_unchanged(self, compactor):
+        """До первого ответа контекст не меняется"""
+        session = make_session(0)
+        assert compactor.build_request(session) == session["messages"]
+
+    def test_image_downgraded_after_answer(self, compactor):
+        """После первого ответа фото уходит уменьшенной копией"""
+        request = compactor.build_request(make_session(1))
+        image_part = request[1]["content"][1]
+
+        assert image_part["image_url"] == {"url": "data:image/jpeg;base64,LOW", "detail": "low"}
+
+    def test_image_dropped(self, compactor):
+        """Политика drop заменяет фото текстом"""
+        compactor.image_policy = "drop"
+        request = compactor.build_request(make_session(1))
+
+        assert all(part["type"] == "text" for part in request[1]["content"])
+
+    def test_old_answers_summarized(self, compactor):
+        """Все ответы, кроме последнего, заменяются резюме"""
+        request = compactor.build_request(make_session(3))
+        answers = [m["content"] for m in request if m["role"] == "assistant"]
+
+        assert all(answer.startswith(SUMMARY_PREFIX) for answer in answers[:-1])
+        assert answers[-1] == ANSWER
+        # Исходная история не изменяется
+        assert make_session(3)["messages"][2]["content"] == ANSWER
+
+    def test_token_budget_drops_old_turns(self, compactor):
+        """При нехватке бюджета выбрасываются самые старые ходы"""
+        compactor.token_budget = 250
+        session = make_session(4)
+        request = compactor.build_request(session)
+
+        assert request[-1] == {"role": "user", "content": "уточнение 3"}
+        assert request[-2]["content"] == ANSWER
+        assert len(request) < len(session["messages"])
+        assert request[0]["role"] == "system"
+
+    def test_summary_keeps_totals(self):
+        """Резюме сохраняет итоговую калорийность и название блюда"""
+        summary = summarize_answer(ANSWER)
+
+        assert "500 Ккал" in summary
+        assert "Яйца с творогом" in summary
+        assert "Белки" not in summary
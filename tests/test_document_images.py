@@ -0,0 +1,90 @@
+# tests/test_document_images.py
+import io
+import pytest
+from types import SimpleNamespace
+from PIL import Image
+from app.services.document_images import DocumentImageLoader, is_image_document, MAX_DOCUMENT_SIZE
+
+
+def make_image(width: int, height: int, image_format: str = "JPEG", orientation: int = None, mode: str = "RGB") -> bytes:
+    image = Image.new(mode, (width, height))
+    options = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        options["exif"] = exif.tobytes()
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+class FakeBot:
+    """Бот, который пишет файл в destination кусками, как aiogram"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=f"documents/{file_id}")
+
+    async def download_file(self, file_path, destination=None, seek=True):
+        for start in range(0, len(self.data), 65536):
+            destination.write(self.data[start:start + 65536])
+        if seek:
+            destination.seek(0)
+        return destination
+
+
+class TestDocumentImages:
+    """Тесты загрузки фото, отправленных файлом"""
+
+    @pytest.fixture
+    def loader(self, monkeypatch):
+        monkeypatch.setenv('DOCUMENT_SPOOL_MEMORY_MB', '0.1')
+        monkeypatch.setenv('DOCUMENT_MAX_MEGAPIXELS', '10')
+        return DocumentImageLoader()
+
+    @pytest.mark.asyncio
+    async def test_large_jpeg_downscaled(self, loader):
+        """Большой JPEG уменьшается до сетки тайлов модели"""
+        data = make_image(6000, 4000)
+        result = await loader.download(FakeBot(data), "doc-1")
+
+        assert Image.open(io.BytesIO(result)).size == (1152, 768)
+        assert loader.stats["downloaded_bytes"] == len(data)
+        assert loader.stats["documents"] == 1
+
+    def test_exif_orientation_applied(self, loader):
+        """Поворот из EXIF применяется после уменьшения"""
+        result = loader.downscale(io.BytesIO(make_image(4000, 3000, orientation=6)))
+        assert Image.open(io.BytesIO(result)).size == (768, 1024)
+
+    @pytest.mark.parametrize("image_format, mode", [("JPEG", "CMYK"), ("PNG", "RGBA"), ("PNG", "P")])
+    def test_exif_orientation_before_mode_conversion(self, loader, image_format, mode):
+        """Поворот не теряется при переводе CMYK/RGBA/P в RGB"""
+        result = loader.downscale(io.BytesIO(make_image(2000, 1500, image_format, orientation=6, mode=mode)))
+        assert Image.open(io.BytesIO(result)).size == (768, 1024)
+
+    def test_png_limits(self, loader):
+        """PNG уменьшается, слишком большой (без draft) отклоняется"""
+        result = loader.downscale(io.BytesIO(make_image(2000, 1000, "PNG")))
+        assert Image.open(io.BytesIO(result)).format == "JPEG"
+
+        with pytest.raises(ValueError):
+            loader.downscale(io.BytesIO(make_image(4000, 3000, "PNG")))
+        assert loader.stats["rejected"] == 1
+
+    def test_is_image_document(self):
+        """Обрабатываются только картинки, которые Bot API даст скачать"""
+        def message(mime_type, file_size):
+            return SimpleNamespace(document=SimpleNamespace(mime_type=mime_type, file_size=file_size))
+
+        assert is_image_document(message("image/jpeg", 5 * 1024 * 1024))
+        assert not is_image_document(message("image/png", MAX_DOCUMENT_SIZE + 1))
+        assert not is_image_document(message("application/pdf", 1000))
+        # Pillow их не откроет - лимит за такие файлы списываться не должен
+        assert not is_image_document(message("image/heic", 1000))
+        assert not is_image_document(message("image/svg+xml", 1000))
+        assert not is_image_document(message("image/tiff", 1000))
+        assert is_image_document(message("image/webp", 1000))
+        assert not is_image_document(SimpleNamespace(document=None))
@@ -22,7 +22,7 @@ class TestGPTAnalyzer:
     async def test_openai_connection(self, analyzer):
         """Тест подключения к OpenAI API"""
         # Простой текстовый запрос для проверки соединения
-        response = analyzer.client.chat.completions.create(
+        response = await analyzer.client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": "Ответь 'тест пройден'"}],
             max_tokens=10
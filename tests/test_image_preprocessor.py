@@ -0,0 +1,73 @@
+# tests/test_image_preprocessor.py
+import io
+import pytest
+from PIL import Image
+from app.services.image_preprocessor import (
+    ImagePreprocessor,
+    estimate_image_tokens,
+    fit_to_tile_grid
+)
+
+
+def make_jpeg(width: int, height: int, orientation: int = None) -> bytes:
+    """Создает JPEG нужного размера, при необходимости с EXIF-ориентацией"""
+    image = Image.new("RGB", (width, height), (200, 120, 40))
+    output = io.BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(output, format="JPEG", exif=exif)
+    else:
+        image.save(output, format="JPEG")
+    return output.getvalue()
+
+
+class TestImagePreprocessor:
+    """Тесты подготовки изображений"""
+
+    @pytest.fixture
+    def preprocessor(self):
+        return ImagePreprocessor()
+
+    def test_large_photo_fits_tile_grid(self, preprocessor):
+        """Большое фото уменьшается: короткая сторона не больше 768"""
+        prepared = preprocessor.prepare(make_jpeg(4000, 3000))
+
+        assert prepared.detail == "high"
+        assert min(prepared.width, prepared.height) <= 768
+        assert prepared.estimated_tokens == estimate_image_tokens(prepared.width, prepared.height, "high")
+        assert len(prepared.data) < prepared.original_size
+
+    def test_small_photo_uses_low_detail(self, preprocessor):
+        """Маленькое фото отправляется в low-режиме"""
+        prepared = preprocessor.prepare(make_jpeg(400, 300))
+
+        assert prepared.detail == "low"
+        assert prepared.estimated_tokens == 85
+
+    def test_orientation_applied_and_exif_stripped(self, preprocessor):
+        """EXIF-поворот применяется, метаданные не сохраняются"""
+        prepared = preprocessor.prepare(make_jpeg(1200, 800, orientation=6))
+
+        assert prepared.height > prepared.width
+        result = Image.open(io.BytesIO(prepared.data))
+        assert not result.getexif()
+
+    def test_tile_snapping(self):
+        """Сторона чуть больше границы тайла подгоняется к границе"""
+        width, height = fit_to_tile_grid(1060, 700)
+        assert width == 1024
+        assert estimate_image_tokens(width, height, "high") == 85 + 170 * 4
+
+    def test_invalid_data_passed_through(self, preprocessor):
+        """Нераспознанные данные отправляются как есть"""
+        prepared = preprocessor.prepare(b"not an image")
+
+        assert prepared.data == b"not an image"
+        assert prepared.detail == "auto"
+
+    @pytest.mark.asyncio
+    async def test_prepare_async(self, preprocessor):
+        """Асинхронная подготовка выполняется в пуле потоков"""
+        prepared = await preprocessor.prepare_async(make_jpeg(1600, 1200))
+        assert prepared.width <= 1024
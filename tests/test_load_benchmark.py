@@ -0,0 +1,50 @@
+# tests/test_load_benchmark.py
+import pytest
+from benchmarks.load_test import LoadProfile, LoadTest, compare
+
+
+class TestLoadBenchmark:
+    """Тесты нагрузочного прогона на мок-серверах"""
+
+    @pytest.mark.asyncio
+    async def test_run_reports_metrics(self):
+        """Короткий прогон проходит весь сценарий без ошибок"""
+        profile = LoadProfile(
+            users=2, photos_per_user=1, refinements=1, think_time=0, ramp_up=0,
+            openai_latency=0, openai_jitter=0, telegram_latency=0, db_latency=0
+        )
+        report = await LoadTest(profile).run()
+
+        # фото, калорийность, уточнение, новое фото
+        assert report["updates"] == 8
+        assert report["errors"] == 0
+        assert set(report["latency"]) == {"all", "photo", "nutrition", "refinement", "new_photo"}
+        assert report["openai"]["requests"] >= 2
+        assert report["telegram"]["downloads"] == 2
+        assert report["peak_rss_mb"] > 0
+
+    @pytest.mark.asyncio
+    async def test_repeated_runs(self):
+        """Прогоны можно повторять в одном процессе: свой диспетчер и холодные кэши"""
+        profile = LoadProfile(
+            users=1, photos_per_user=1, refinements=0, think_time=0, ramp_up=0,
+            openai_latency=0, openai_jitter=0, telegram_latency=0, db_latency=0
+        )
+        reports = [await LoadTest(profile).run() for _ in range(2)]
+        for report in reports:
+            assert report["errors"] == 0
+            assert report["telegram"]["downloads"] == 1
+        # Второй прогон не берет анализ из кэша первого
+        assert reports[0]["openai"]["requests"] == reports[1]["openai"]["requests"]
+        assert reports[0]["telegram"]["calls"]["getFile"] == reports[1]["telegram"]["calls"]["getFile"]
+
+    def test_compare_flags_regressions(self):
+        """Рост задержки и падение пропускной способности выше порога - регрессия"""
+        baseline = {"latency": {"all": {"p50": 100, "p95": 200, "p99": 300}}, "throughput": 10.0}
+        current = {"latency": {"all": {"p50": 105, "p95": 300, "p99": 300}}, "throughput": 7.0}
+
+        rows = {row["metric"]: row for row in compare(current, baseline, threshold=0.2)}
+        assert not rows["latency.all.p50"]["regression"]
+        assert rows["latency.all.p95"]["regression"]
+        assert rows["throughput"]["regression"]
+        assert "peak_rss_mb" not in rows
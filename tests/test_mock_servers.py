@@ -0,0 +1,125 @@
+# tests/test_mock_servers.py
+import json
+import pytest
+import pytest_asyncio
+from openai import AsyncOpenAI, InternalServerError
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from tests.mocks.openai_server import MockOpenAIServer, MockOpenAIConfig
+from tests.mocks.telegram_server import MockTelegramServer, MockTelegramConfig
+
+TOKEN = "123456:mock-token"
+
+
+class TestMockOpenAIServer:
+    """Тесты мок-сервера OpenAI через настоящий клиент"""
+
+    @pytest_asyncio.fixture
+    async def server(self):
+        server = MockOpenAIServer(MockOpenAIConfig(latency=0, jitter=0, stream_chunk_delay=0, seed=1))
+        await server.start()
+        yield server
+        await server.stop()
+
+    @pytest.fixture
+    def client(self, server):
+        return AsyncOpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+
+    @pytest.mark.asyncio
+    async def test_completion_with_usage(self, server, client):
+        """Обычный ответ с usage и заголовками лимитов"""
+        raw = await client.chat.completions.with_raw_response.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "Проанализируй"}]
+        )
+        response = raw.parse()
+
+        assert "Ккал" in response.choices[0].message.content
+        assert response.usage.prompt_tokens > 0
+        assert raw.headers["x-ratelimit-limit-requests"] == "500"
+        assert server.stats["models"] == {"gpt-4o-mini": 1}
+
+    @pytest.mark.asyncio
+    async def test_stream_and_json_schema(self, server, client):
+        """Потоковый ответ собирается целиком, json_schema возвращает JSON"""
+        stream = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "Проанализируй"}],
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parts, usage = [], None
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            usage = chunk.usage or usage
+        assert "".join(parts) == server.config.text_answer
+        assert usage.completion_tokens > 0
+
+        response = await client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": "Проанализируй"}],
+            response_format={"type": "json_schema", "json_schema": {"name": "nutrition", "schema": {}}}
+        )
+        assert json.loads(response.choices[0].message.content)["status"] == "ok"
+        assert server.stats["streamed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_error_rate(self, server, client):
+        """Ошибки отдаются с заданной долей и статусом"""
+        server.config.error_rate = 1.0
+        with pytest.raises(InternalServerError):
+            await client.chat.completions.create(model="gpt-4o-mini", messages=[])
+        assert server.stats["errors"] == 1
+
+
+class TestMockTelegramServer:
+    """Тесты мок-сервера Bot API через aiogram"""
+
+    @pytest_asyncio.fixture
+    async def server(self):
+        server = MockTelegramServer(MockTelegramConfig(latency=0, jitter=0, seed=1))
+        await server.start()
+        yield server
+        await server.stop()
+
+    @pytest_asyncio.fixture
+    async def bot(self, server):
+        bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(server.base_url)))
+        yield bot
+        await bot.session.close()
+
+    @pytest.mark.asyncio
+    async def test_messages(self, server, bot):
+        """getMe, sendMessage и editMessageText"""
+        me = await bot.get_me()
+        message = await bot.send_message(42, "⏳ Анализирую...")
+        await bot.edit_message_text("🔥 500 Ккал", chat_id=42, message_id=message.message_id)
+
+        assert me.username == "foodlens_mock_bot"
+        assert server.messages[42] == ["⏳ Анализирую...", "🔥 500 Ккал"]
+        assert server.calls["editMessageText"] == 1
+
+    @pytest.mark.asyncio
+    async def test_file_download(self, server, bot):
+        """getFile и скачивание: зарегистрированные байты и сгенерированное фото"""
+        server.add_file("photo_1", b"jpeg-bytes")
+        file = await bot.get_file("photo_1")
+        data = await bot.download_file(file.file_path)
+        assert data.read() == b"jpeg-bytes"
+
+        generated = await bot.download_file((await bot.get_file("photo_2")).file_path)
+        assert generated.read()[:2] == b"\xff\xd8"
+        assert server.stats["downloads"] == 2
+
+    @pytest.mark.asyncio
+    async def test_edit_flood_limit(self, server, bot):
+        """Частые правки одного чата получают 429 с retry_after"""
+        server.config.edits_per_second = 1
+        message = await bot.send_message(7, "a")
+        await bot.edit_message_text("b", chat_id=7, message_id=message.message_id)
+        with pytest.raises(TelegramRetryAfter):
+            await bot.edit_message_text("c", chat_id=7, message_id=message.message_id)
+        assert server.stats["flood_limited"] == 1
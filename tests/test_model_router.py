@@ -0,0 +1,58 @@
+# tests/test_model_router.py
+import json
+import pytest
+from app.services.model_router import ModelRouter
+
+
+class TestModelRouter:
+    """Тесты выбора модели и эскалации"""
+
+    @pytest.fixture
+    def router(self, monkeypatch):
+        monkeypatch.setenv('MODEL_TIERS', json.dumps({
+            "premium": {"model": "gpt-4o", "max_tokens": 1500}
+        }))
+        monkeypatch.setenv('MODEL_ROUTING', json.dumps({
+            "recipe": ["fast"],
+            "*:premium_month": ["premium"],
+            "nutrition:premium_month": ["strong"],
+            "broken": ["missing"]
+        }))
+        return ModelRouter()
+
+    def test_route_lookup_order(self, router):
+        """Точный ключ важнее типа анализа, подписки и маршрута по умолчанию"""
+        assert [t.name for t in router.route("nutrition", "premium_month")] == ["strong"]
+        assert [t.name for t in router.route("recipe", "premium_month")] == ["fast"]
+        assert [t.name for t in router.route("other", "premium_month")] == ["premium"]
+        assert [t.name for t in router.route("nutrition", None)] == ["fast", "strong"]
+        assert router.route("other")[0].max_tokens == 1200
+        assert router.tiers["premium"].max_tokens == 1500
+        assert "broken" not in router.routes
+
+    def test_needs_escalation(self, router):
+        """Нераспознанное блюдо и много вопросов - повод спросить сильную модель"""
+        assert router.needs_escalation("❌ Не могу определить блюдо. Пожалуйста, опишите...")
+        assert router.needs_escalation("⁉️ a\n⁉️ b\n⁉️ c")
+        assert router.needs_escalation("")
+        assert not router.needs_escalation("🍽 Паста - 350 ккал\n⁉️ Сливочный соус?")
+
+    def test_record_cost_and_latency(self, router):
+        """Стоимость считается по ценам уровня за 1M токенов"""
+        fast = router.tiers["fast"]
+        cost = router.record(fast, 1.0, prompt_tokens=1_000_000, completion_tokens=0)
+        router.record(fast, 3.0)
+        router.record_escalation(fast)
+
+        stats = router.get_stats()["fast"]
+        assert cost == pytest.approx(fast.input_price)
+        assert stats["requests"] == 2
+        assert stats["escalated"] == 1
+        assert stats["avg_latency"] == pytest.approx(2.0)
+        assert stats["p95_latency"] == pytest.approx(3.0)
+
+    def test_structured_escalation(self, router):
+        """Структурированный ответ эскалируется по статусу и уверенности"""
+        assert router.needs_escalation('{"status": "not_recognized", "dishes": [], "questions": [], "confidence": 0.9}')
+        assert router.needs_escalation('{"status": "ok", "dishes": [], "questions": [], "confidence": 0.2}')
+        assert not router.needs_escalation('{"status": "ok", "dishes": [], "questions": [], "confidence": 0.9}')
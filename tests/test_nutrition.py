@@ -0,0 +1,57 @@
+# tests/test_nutrition.py
+import json
+from app.core.i18n import get_localization
+from app.services.context_compactor import summarize_answer, SUMMARY_PREFIX
+from app.services.nutrition import NutritionResult, render_answer, render_nutrition, STATUS_NOT_RECOGNIZED
+
+ANSWER = json.dumps({
+    "status": "ok",
+    "dishes": [
+        {"name": "Яйца с творогом", "weight_g": 420, "weight_note": "творог ~200г", "kcal": 500.4,
+         "protein": 30, "fat": 20, "carbs": 120, "is_drink": False},
+        {"name": "Кока-кола Zero", "weight_g": 330, "weight_note": "", "kcal": 0,
+         "protein": 0, "fat": 0, "carbs": 0, "is_drink": True}
+    ],
+    "questions": ["Это сливочный соус?"],
+    "confidence": 0.9
+}, ensure_ascii=False)
+
+
+class TestNutrition:
+    """Тесты структурированного результата калорийности"""
+
+    def test_parse_and_totals(self):
+        """Итоги считаются локально по блюдам"""
+        result = NutritionResult.parse(ANSWER)
+        assert len(result.dishes) == 2
+        assert result.dishes[1].is_drink
+        assert result.totals.kcal == 500.4
+        assert result.totals.weight_g == 750
+
+    def test_parse_plain_text(self):
+        """Обычный текст и битый JSON - не структурированный ответ"""
+        assert NutritionResult.parse("🔥 500 Ккал") is None
+        assert NutritionResult.parse("{broken") is None
+
+    def test_render(self):
+        """Сообщение собирается через локализацию"""
+        text = render_answer(ANSWER, get_localization())
+        assert text.startswith("🔥 500 Ккал")
+        assert "🍽️ Яйца с творогом" in text
+        assert "(творог ~200г)" in text
+        assert "330мл" in text
+        assert "⁉️ Это сливочный соус?" in text
+        assert render_answer("просто текст", get_localization()) == "просто текст"
+
+    def test_render_not_recognized(self):
+        """Нераспознанное фото - стандартное сообщение"""
+        result = NutritionResult(status=STATUS_NOT_RECOGNIZED)
+        assert "Не могу определить блюдо" in render_nutrition(result, get_localization())
+
+    def test_compact_summary(self):
+        """Резюме структурированного ответа - JSON без вопросов и пояснений"""
+        summary = summarize_answer(ANSWER)
+        compact = NutritionResult.parse(summary[len(SUMMARY_PREFIX):])
+        assert compact.questions == []
+        assert compact.dishes[0].weight_note == ""
+        assert compact.dishes[0].kcal == 500.4
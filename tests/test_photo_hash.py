@@ -0,0 +1,68 @@
+# tests/test_photo_hash.py
+import io
+import random
+from PIL import Image, ImageDraw
+from app.services.photo_hash import BKTree, NearDuplicateIndex, dhash, hamming_distance
+
+
+def make_plate(seed: int) -> Image.Image:
+    """Рисует "тарелку" со случайными фигурами"""
+    rnd = random.Random(seed)
+    image = Image.new("RGB", (640, 480), (240, 240, 230))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rnd.randint(0, 560), rnd.randint(0, 400)
+        color = tuple(rnd.randint(0, 255) for _ in range(3))
+        draw.ellipse((x, y, x + rnd.randint(30, 120), y + rnd.randint(30, 120)), fill=color)
+    return image
+
+
+class TestPhotoHash:
+    """Тесты перцептивного хэша и BK-дерева"""
+
+    def test_recompressed_and_cropped_photo_is_close(self):
+        """Пережатое и слегка обрезанное фото остается рядом"""
+        original = make_plate(1)
+
+        output = io.BytesIO()
+        original.crop((8, 6, 632, 474)).resize((320, 240)).save(output, format="JPEG", quality=60)
+        variant = Image.open(io.BytesIO(output.getvalue()))
+
+        assert hamming_distance(dhash(original), dhash(variant)) <= 5
+        assert hamming_distance(dhash(original), dhash(make_plate(2))) > 10
+
+    def test_bk_tree_matches_brute_force(self):
+        """Поиск в BK-дереве совпадает с полным перебором"""
+        rnd = random.Random(42)
+        hashes = [rnd.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for index, value in enumerate(hashes):
+            tree.add(value, index)
+
+        query = hashes[10] ^ 0b1011
+        expected = {i for i, value in enumerate(hashes) if hamming_distance(query, value) <= 8}
+        found = {item for _, item in tree.search(query, 8)}
+
+        assert found == expected
+        assert 10 in found
+
+    def test_index_reuses_analysis(self):
+        """Индекс отдает анализ того же типа и с теми же уточнениями"""
+        index = NearDuplicateIndex()
+        index.add(0b1111, "nutrition", "", "🔥 500 Ккал")
+
+        assert index.find(0b1110, "nutrition", "") == "🔥 500 Ккал"
+        assert index.find(0b1110, "recipe", "") is None
+        assert index.find(0b1110, "nutrition", "без сахара") is None
+        assert index.stats["saved_calls"] == 1
+
+    def test_index_rebuild_keeps_recent(self):
+        """При переполнении остаются свежие записи"""
+        index = NearDuplicateIndex()
+        index.max_entries = 8
+        index.max_distance = 0
+        for value in range(20):
+            index.add(value << 20, "nutrition", "", f"анализ {value}")
+
+        assert index.find(19 << 20, "nutrition", "") == "анализ 19"
+        assert index.find(0, "nutrition", "") is None
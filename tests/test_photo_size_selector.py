@@ -0,0 +1,53 @@
+# tests/test_photo_size_selector.py
+import pytest
+from aiogram.types import PhotoSize
+from app.services.photo_size_selector import PhotoSizeSelector
+
+
+def make_sizes(*dimensions) -> list:
+    """Варианты фото, как их присылает Telegram: от меньшего к большему"""
+    return [
+        PhotoSize(file_id=f"f{width}", file_unique_id=f"u{width}", width=width, height=height, file_size=width * height // 8)
+        for width, height in dimensions
+    ]
+
+
+class TestPhotoSizeSelector:
+    """Тесты выбора варианта PhotoSize"""
+
+    @pytest.fixture
+    def selector(self, monkeypatch):
+        monkeypatch.setenv('IMAGE_DETAIL', 'auto')
+        return PhotoSizeSelector()
+
+    def test_smallest_size_with_full_resolution(self, selector):
+        """Из 2560x1920 модель видит 1024x768 - хватает варианта 1280x960"""
+        sizes = make_sizes((90, 68), (320, 240), (800, 600), (1280, 960), (2560, 1920))
+        assert selector.select(sizes).width == 1280
+
+        stats = selector.get_stats(seconds_per_byte=0.001)
+        assert stats["downsized"] == 1
+        assert stats["saved_bytes"] == (2560 * 1920 - 1280 * 960) // 8
+        assert stats["saved_seconds"] == pytest.approx(stats["saved_bytes"] * 0.001)
+
+    def test_largest_when_smaller_loses_resolution(self, selector):
+        """Если меньший вариант беднее того, что увидит модель, берем самый большой"""
+        sizes = make_sizes((90, 68), (320, 240), (800, 600), (1280, 960))
+        assert selector.select(sizes).width == 1280
+        assert selector.get_stats()["full_size"] == 1
+
+    def test_low_detail_target(self, monkeypatch):
+        """При detail=low достаточно 512 по длинной стороне"""
+        monkeypatch.setenv('IMAGE_DETAIL', 'low')
+        sizes = make_sizes((90, 68), (320, 240), (800, 600), (1280, 960))
+        assert PhotoSizeSelector().select(sizes).width == 800
+
+    def test_premium_and_ambiguous_fallback(self, selector):
+        """Премиум (по настройке) и обрезанные варианты - самый большой размер"""
+        sizes = make_sizes((320, 240), (1280, 960), (2560, 1920))
+        selector.premium_full_size = True
+        assert selector.select(sizes, "premium_month").width == 2560
+        assert selector.select(sizes, "free").width == 1280
+
+        cropped = make_sizes((1280, 1280), (2560, 1920))
+        assert selector.select(cropped).width == 2560
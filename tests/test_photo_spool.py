@@ -0,0 +1,113 @@
+# tests/test_photo_spool.py
+import asyncio
+import io
+import os
+import time
+import pytest
+from types import SimpleNamespace
+from app.services.photo_spool import PhotoSpool
+
+
+class FakeBot:
+    """Бот, который отдает фото по file_path и считает скачивания"""
+
+    def __init__(self, files: dict):
+        self.files = files
+        self.downloads = 0
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=f"photos/{file_id}.jpg")
+
+    async def download_file(self, file_path, destination=None, seek=True):
+        self.downloads += 1
+        return io.BytesIO(self.files[file_path])
+
+
+class TestPhotoSpool:
+    """Тесты хранилища фото"""
+
+    @pytest.fixture
+    def spool(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('PHOTO_SPOOL_MEMORY_MB', '0.01')
+        return PhotoSpool(str(tmp_path))
+
+    @pytest.mark.asyncio
+    async def test_memory_then_disk(self, spool):
+        """Вытесненное из памяти фото читается с диска"""
+        first, second = os.urandom(6000), os.urandom(6000)
+        await spool.put("a", first)
+        assert await spool.get("a") == first
+        assert spool.stats["memory_hits"] == 1
+
+        await spool.put("b", second)
+        assert await spool.get("a") == first
+        assert spool.stats["disk_hits"] == 1
+        assert await spool.get("missing") is None
+
+    @pytest.mark.asyncio
+    async def test_same_content_stored_once(self, spool):
+        """Одинаковые байты под разными ручками - один файл"""
+        data = os.urandom(1000)
+        assert await spool.put("a", data) == await spool.put("b", data)
+        assert spool.stats["stored"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cleanup_by_age_and_size(self, spool):
+        """Очистка удаляет старые файлы, затем самые давние сверх лимита"""
+        for handle in ("old", "a", "b", "c"):
+            await spool.put(handle, os.urandom(1000))
+        now = time.time()
+        for age, handle in ((spool.max_age + 10, "old"), (30, "a"), (20, "b"), (10, "c")):
+            os.utime(spool._path(spool._handles[handle]), (now - age, now - age))
+        old_path = spool._path(spool._handles["old"])
+
+        assert await spool.cleanup() == 1
+        assert not old_path.exists()
+
+        spool.disk_limit = 2000
+        assert await spool.cleanup() == 1
+        spool._memory.clear()
+        spool._memory_bytes = 0
+        assert await spool.get("a") is None
+        assert await spool.get("b") is not None
+
+    @pytest.mark.asyncio
+    async def test_load_downloads_once(self, spool):
+        """Фото скачивается из Telegram один раз, дальше отдается из хранилища"""
+        data = os.urandom(2000)
+        bot = FakeBot({"photos/file-1.jpg": data})
+        assert await spool.load(bot, "file-1", "unique-1") == data
+        assert await spool.load(bot, "file-1", "unique-1") == data
+        assert bot.downloads == 1
+
+    @pytest.mark.asyncio
+    async def test_survives_restart(self, spool, tmp_path):
+        """После перезапуска фото по file_unique_id читается с диска, без скачивания"""
+        data = os.urandom(2000)
+        bot = FakeBot({"photos/file-1.jpg": data})
+        await spool.load(bot, "file-1", "unique-1")
+
+        restarted = PhotoSpool(str(tmp_path))
+        assert await restarted.load(bot, "file-1", "unique-1") == data
+        assert bot.downloads == 1
+        assert restarted.stats["disk_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cleanup_removes_stale_handles(self, spool, tmp_path):
+        """Вместе с фото удаляется и ссылка на него"""
+        await spool.put("a", os.urandom(1000))
+        spool.max_age = -1
+        assert await spool.cleanup() == 1
+        assert await PhotoSpool(str(tmp_path)).get("a") is None
+        assert list((tmp_path / "handles").iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_concurrent_puts_same_content(self, spool):
+        """Одновременная запись одинаковых байт под разными ручками не падает"""
+        data = os.urandom(50000)
+        digests = await asyncio.gather(*(spool.put(f"handle-{index}", data) for index in range(8)))
+        assert len(set(digests)) == 1
+        assert not list(spool.directory.glob("**/*.tmp"))
+        spool._memory.clear()
+        spool._memory_bytes = 0
+        assert await spool.get("handle-7") == data
@@ -0,0 +1,84 @@
+# tests/test_progressive_edit.py
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from app.utils.progressive_edit import ProgressiveMessageEditor, TYPING_CURSOR
+
+
+class TestProgressiveMessageEditor:
+    """Тесты постепенного обновления сообщения"""
+
+    @pytest.fixture
+    def wait_msg(self):
+        message = Mock()
+        message.edit_text = AsyncMock()
+        return message
+
+    @pytest.mark.asyncio
+    async def test_updates_are_throttled(self, wait_msg):
+        """Частые обновления не превращаются в частые правки"""
+        editor = ProgressiveMessageEditor(wait_msg, min_interval=60, min_chars=10)
+        # Первая пауза уже прошла
+        editor._next_edit_at = 0
+
+        await editor.update("🔥 500 Ккал и еще немного")
+        await asyncio.sleep(0.01)
+        await editor.update("🔥 500 Ккал и еще немного.")
+        await editor.update("🔥 500 Ккал и еще немного текста для правки")
+        await asyncio.sleep(0.01)
+        await editor.close()
+
+        assert wait_msg.edit_text.await_count == 1
+        wait_msg.edit_text.assert_awaited_with("🔥 500 Ккал и еще немного" + TYPING_CURSOR)
+
+    @pytest.mark.asyncio
+    async def test_updates_do_not_wait_for_telegram(self, wait_msg):
+        """update() сразу возвращается, а правка берет самый свежий текст"""
+        editor = ProgressiveMessageEditor(wait_msg, min_interval=0, min_chars=1)
+
+        await editor.update("первый")
+        await editor.update("первый и второй")
+        assert wait_msg.edit_text.await_count == 0
+
+        await asyncio.sleep(0.01)
+        await editor.close()
+        wait_msg.edit_text.assert_awaited_once_with("первый и второй" + TYPING_CURSOR)
+
+    @pytest.mark.asyncio
+    async def test_update_errors_are_swallowed(self, wait_msg):
+        """Ошибка промежуточной правки не прерывает ответ, но finish() ее выбрасывает"""
+        wait_msg.edit_text.side_effect = TelegramBadRequest(method=Mock(), message="message to edit not found")
+        editor = ProgressiveMessageEditor(wait_msg, min_interval=0, min_chars=1)
+
+        await editor.update("фрагмент")
+        await asyncio.sleep(0.01)
+        await editor.update("фрагмент побольше")
+        await asyncio.sleep(0.01)
+        assert wait_msg.edit_text.await_count == 1
+
+        with pytest.raises(TelegramBadRequest):
+            await editor.finish("готово")
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_updates(self, wait_msg):
+        """RetryAfter от Telegram откладывает следующие правки"""
+        wait_msg.edit_text.side_effect = TelegramRetryAfter(method=Mock(), message="flood", retry_after=30)
+        editor = ProgressiveMessageEditor(wait_msg, min_interval=0, min_chars=1)
+
+        await editor.update("первый фрагмент")
+        await asyncio.sleep(0.01)
+        await editor.update("первый фрагмент и второй")
+        await asyncio.sleep(0.01)
+        await editor.close()
+
+        assert wait_msg.edit_text.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_finish_ignores_not_modified(self, wait_msg):
+        """Финальная правка с тем же текстом не считается ошибкой"""
+        wait_msg.edit_text.side_effect = TelegramBadRequest(method=Mock(), message="message is not modified")
+        editor = ProgressiveMessageEditor(wait_msg)
+
+        await editor.finish("готово")
+        wait_msg.edit_text.assert_awaited_once_with("готово")
@@ -0,0 +1,25 @@
+# tests/test_prompts.py
+from app.prompts import get_system_prompt, get_compiled_prompt
+from app.utils.tokens import estimate_text_tokens
+
+
+class TestPrompts:
+    """Тесты системных промтов"""
+
+    def test_prompt_is_static(self):
+        """Промт не содержит подстановок и одинаков при каждом вызове"""
+        for analysis_type in ("nutrition", "recipe"):
+            prompt = get_system_prompt(analysis_type)
+            assert "{" not in prompt
+            assert prompt is get_system_prompt(analysis_type)
+
+    def test_precomputed_tokens(self):
+        """Размер промта в токенах посчитан заранее"""
+        compiled = get_compiled_prompt("recipe", "ru")
+        assert compiled.tokens == estimate_text_tokens(compiled.text)
+        assert compiled.analysis_type == "recipe"
+
+    def test_fallback(self):
+        """Неизвестный тип анализа и язык - промт калорийности на русском"""
+        assert get_compiled_prompt("unknown", "xx") is get_compiled_prompt("nutrition", "ru")
+        assert get_compiled_prompt("recipe", "xx") is get_compiled_prompt("recipe", "ru")
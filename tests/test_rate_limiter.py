@@ -0,0 +1,87 @@
+# tests/test_rate_limiter.py
+import pytest
+from app.services.rate_limiter import OpenAIRateLimiter, ModelRateLimiters, RateLimitWaitTimeout, parse_reset_duration
+
+
+class TestRateLimiter:
+    """Тесты клиентского лимитера OpenAI"""
+
+    @pytest.fixture
+    def limiter(self):
+        limiter = OpenAIRateLimiter()
+        limiter.max_wait = 0.2
+        return limiter
+
+    def test_parse_reset_duration(self):
+        """Форматы длительности из заголовков OpenAI"""
+        assert parse_reset_duration("1s") == 1
+        assert parse_reset_duration("6m0s") == 360
+        assert parse_reset_duration("20ms") == pytest.approx(0.02)
+        assert parse_reset_duration("1h2m3.5s") == pytest.approx(3723.5)
+        assert parse_reset_duration("2") == 2
+        assert parse_reset_duration(None) is None
+
+    @pytest.mark.asyncio
+    async def test_acquire_within_limits(self, limiter):
+        """При достаточной квоте запрос проходит сразу"""
+        await limiter.acquire(1000)
+        assert limiter.stats["acquired"] == 1
+        assert limiter.stats["waited"] == 0
+
+    @pytest.mark.asyncio
+    async def test_waits_for_request_quota(self, limiter):
+        """Без свободных запросов ждем пополнения"""
+        limiter.update_from_headers({
+            'x-ratelimit-limit-requests': '600',
+            'x-ratelimit-remaining-requests': '0'
+        })
+        # 600 RPM = 10 запросов в секунду, ждать ~0.1 сек
+        await limiter.acquire(10)
+        assert limiter.stats["waited"] == 1
+
+    @pytest.mark.asyncio
+    async def test_rejects_long_wait(self, limiter):
+        """Слишком долгое ожидание превращается в ошибку без запроса к API"""
+        limiter.update_from_headers({
+            'x-ratelimit-limit-tokens': '60000',
+            'x-ratelimit-remaining-tokens': '0'
+        })
+        with pytest.raises(RateLimitWaitTimeout):
+            await limiter.acquire(5000)
+        assert limiter.stats["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_penalize_blocks_requests(self, limiter):
+        """После 429 запросы ждут retry-after"""
+        limiter.penalize({'retry-after': '5'})
+        with pytest.raises(RateLimitWaitTimeout):
+            await limiter.acquire(10)
+
+    def test_headers_update_limits(self, limiter):
+        """Лимиты подстраиваются под заголовки ответа"""
+        limiter.update_from_headers({
+            'x-ratelimit-limit-requests': '30',
+            'x-ratelimit-remaining-requests': '12',
+            'x-ratelimit-limit-tokens': '150000',
+            'x-ratelimit-remaining-tokens': '149000'
+        })
+        stats = limiter.get_stats()
+
+        assert stats["rpm_limit"] == 30
+        assert stats["requests_available"] == 12
+        assert stats["tpm_limit"] == 150000
+
+    @pytest.mark.asyncio
+    async def test_limits_are_per_model(self, monkeypatch):
+        """Заголовки и 429 одной модели не трогают лимиты другой"""
+        monkeypatch.setenv('OPENAI_TPM_LIMIT_GPT_4O_MINI', '1000000')
+        limiters = ModelRateLimiters()
+        fast, strong = limiters.for_model("gpt-4o-mini"), limiters.for_model("gpt-4o")
+        assert limiters.for_model("gpt-4o") is strong
+        assert fast.tokens.capacity == 1000000
+
+        strong.update_from_headers({'x-ratelimit-limit-requests': '30'})
+        strong.penalize({'retry-after': '5'})
+        assert fast.requests.capacity != 30
+        await fast.acquire(10)
+        assert set(limiters.get_stats()) == {"gpt-4o-mini", "gpt-4o"}
@@ -0,0 +1,64 @@
+# tests/test_refinement_engine.py
+import pytest
+from app.services.nutrition import Dish, NutritionResult
+from app.services.refinement_engine import RefinementEngine
+
+
+class TestRefinementEngine:
+    """Тесты локального пересчета уточнений"""
+
+    @pytest.fixture
+    def engine(self):
+        return RefinementEngine()
+
+    @pytest.fixture
+    def previous(self):
+        return NutritionResult(dishes=[
+            Dish("Овсянка", weight_g=250, kcal=200, protein=7, fat=4, carbs=35),
+            Dish("Чай", weight_g=200, kcal=0, is_drink=True)
+        ])
+
+    @pytest.mark.parametrize("text, name, grams", [
+        ("добавь ложку сахара", "сахар", 18),
+        ("Там ещё стакан молока", "молоко", 250),
+        ("плюс 2 чайные ложки мёда", "мед", 16),
+        ("и 30г сыра", "сыр", 30),
+        ("полложки сахара", "сахар", 9),
+        ("ложку сахара с горкой", "сахар", 28),
+        ("кусок масла", "сливочное масло", 25),
+        ("стакан муки", "мука", 200),
+    ])
+    def test_parse(self, engine, text, name, grams):
+        """Бытовые мерки переводятся в граммы"""
+        items = engine.parse(text)
+        assert [(ingredient.name, amount) for ingredient, amount in items] == [(name, grams)]
+
+    @pytest.mark.parametrize("text", [
+        "добавь сахара", "это была курица", "сделай рецепт", "",
+        "кусок медовика", "кусочек сырника", "2 куска сырников"
+    ])
+    def test_unparsed_text(self, engine, text):
+        """Без мерки или с незнакомым текстом - в GPT"""
+        assert engine.parse(text) is None
+
+    def test_apply_adds_to_main_dish(self, engine, previous):
+        """Добавка входит в основное блюдо, исходный результат не меняется"""
+        result = engine.apply(previous, "добавь чайную ложку сахара, щепотку соли")
+        oatmeal = result.dishes[0]
+        assert len(result.dishes) == 2
+        assert oatmeal.weight_g == pytest.approx(257.5)
+        assert oatmeal.kcal == pytest.approx(200 + 387 * 0.06)
+        assert oatmeal.weight_note == "сахар ~6г, соль ~1.5г"
+        assert previous.dishes[0].kcal == 200
+        assert engine.stats["handled"] == 1
+
+    def test_apply_drink_is_separate(self, engine, previous):
+        """Напиток становится отдельной позицией"""
+        result = engine.apply(previous, "ещё стакан молока")
+        assert result.dishes[-1].name == "Молоко"
+        assert result.dishes[-1].is_drink
+        assert result.totals.kcal == pytest.approx(200 + 52 * 2.5)
+
+    def test_apply_without_structured_result(self, engine):
+        """Без предыдущего структурированного ответа считать нечего"""
+        assert engine.apply(None, "добавь ложку сахара") is None
@@ -0,0 +1,94 @@
+# tests/test_resilience.py
+import httpx
+import pytest
+from openai import APITimeoutError, BadRequestError
+from app.services.resilience import CircuitBreaker, CircuitOpenError, call_with_retry, is_retryable_error
+
+
+def timeout_error():
+    return APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def bad_request_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(400, request=request)
+    return BadRequestError("bad request", response=response, body=None)
+
+
+class TestResilience:
+    """Тесты повторов и предохранителя для OpenAI"""
+
+    @pytest.fixture
+    def breaker(self):
+        return CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+
+    def test_retryable_errors(self):
+        """Повторяются только временные ошибки"""
+        assert is_retryable_error(timeout_error())
+        assert not is_retryable_error(bad_request_error())
+        assert not is_retryable_error(ValueError("boom"))
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_error(self, breaker):
+        """Таймаут повторяется, успешная попытка сбрасывает счетчик ошибок"""
+        calls = []
+
+        async def func():
+            calls.append(1)
+            if len(calls) == 1:
+                raise timeout_error()
+            return "ok"
+
+        result = await call_with_retry(func, breaker, max_attempts=3, base_delay=0)
+        assert result == "ok"
+        assert len(calls) == 2
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.consecutive_failures == 0
+
+    @pytest.mark.asyncio
+    async def test_non_retryable_error_passes_through(self, breaker):
+        """Ошибка запроса не повторяется и не влияет на предохранитель"""
+        calls = []
+
+        async def func():
+            calls.append(1)
+            raise bad_request_error()
+
+        with pytest.raises(BadRequestError):
+            await call_with_retry(func, breaker, max_attempts=3, base_delay=0)
+        assert len(calls) == 1
+        assert breaker.stats["failures"] == 0
+
+    @pytest.mark.asyncio
+    async def test_breaker_opens_and_rejects(self, breaker):
+        """После серии ошибок запросы отклоняются без обращения к сервису"""
+        calls = []
+
+        async def func():
+            calls.append(1)
+            raise timeout_error()
+
+        with pytest.raises(APITimeoutError):
+            await call_with_retry(func, breaker, max_attempts=2, base_delay=0)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError):
+            await call_with_retry(func, breaker, max_attempts=2, base_delay=0)
+        assert len(calls) == 2
+        assert breaker.stats["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_half_open_trial(self, breaker):
+        """После паузы пропускается один пробный запрос, успех замыкает предохранитель"""
+        breaker.record_failure(timeout_error())
+        breaker.record_failure(timeout_error())
+        assert breaker.state == CircuitBreaker.OPEN
+
+        breaker.opened_at -= breaker.recovery_timeout
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,99 @@
+# tests/test_single_flight.py
+import asyncio
+import pytest
+from app.services.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    """Тесты схлопывания одинаковых запросов"""
+
+    @pytest.mark.asyncio
+    async def test_duplicates_share_result(self):
+        """Одновременные вызовы с одним ключом выполняются один раз"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def analyze():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"analysis": "🔥 500 Ккал"}
+
+        results = await asyncio.gather(*[
+            flight.do((1, "nutrition", ""), analyze) for _ in range(3)
+        ])
+
+        assert calls == 1
+        assert all(result is results[0] for result in results)
+        assert flight.stats == {"calls": 1, "coalesced": 2}
+        assert not flight.is_in_flight((1, "nutrition", ""))
+
+    @pytest.mark.asyncio
+    async def test_different_keys_run_separately(self):
+        """Разные ключи не схлопываются"""
+        flight = SingleFlight()
+
+        async def analyze(value):
+            await asyncio.sleep(0)
+            return value
+
+        results = await asyncio.gather(
+            flight.do((1, "nutrition", ""), lambda: analyze("n")),
+            flight.do((1, "recipe", ""), lambda: analyze("r"))
+        )
+
+        assert results == ["n", "r"]
+
+    @pytest.mark.asyncio
+    async def test_error_delivered_to_all(self):
+        """Ошибка общего вызова получают все ожидающие"""
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream")
+
+        results = await asyncio.gather(
+            flight.do("key", fail), flight.do("key", fail),
+            return_exceptions=True
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_does_not_cancel_followers(self):
+        """Отмена первого вызова не отменяет общий вызов для остальных"""
+        flight = SingleFlight()
+
+        async def analyze():
+            await asyncio.sleep(0.05)
+            return "🔥 500 Ккал"
+
+        leader = asyncio.ensure_future(flight.do("key", analyze))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", analyze))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == "🔥 500 Ккал"
+        assert leader.cancelled()
+        assert flight.stats == {"calls": 1, "coalesced": 1}
+
+    @pytest.mark.asyncio
+    async def test_call_cancelled_when_last_waiter_leaves(self):
+        """Общий вызов отменяется, когда его больше никто не ждет"""
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def analyze():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flight.do("key", analyze), timeout=0.01)
+
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert not flight.is_in_flight("key")
@@ -0,0 +1,109 @@
+# tests/test_speculative_prefetch.py
+import random
+import uuid
+import pytest
+import pytest_asyncio
+from app.services.gpt_analyzer import GPTAnalyzer
+from app.services.speculative_prefetch import SpeculativePrefetcher
+from tests.mocks.openai_server import MockOpenAIServer, MockOpenAIConfig
+from tests.test_analyzer_session import make_photo
+
+
+def loader(photo):
+    """Загрузчик фото, как photo_spool.load в обработчике"""
+    async def load():
+        return photo.getvalue()
+    return load
+
+
+class TestSpeculativePrefetch:
+    """Тесты упреждающего анализа на мок-сервере OpenAI"""
+
+    @pytest_asyncio.fixture
+    async def server(self):
+        server = MockOpenAIServer(MockOpenAIConfig(latency=0.05, jitter=0, stream_chunk_delay=0, seed=1))
+        await server.start()
+        yield server
+        await server.stop()
+
+    @pytest.fixture
+    def prefetcher(self, server, monkeypatch):
+        monkeypatch.setenv('OPENAI_API_KEY', 'mock')
+        monkeypatch.setenv('SPECULATIVE_PREFETCH', '1')
+        monkeypatch.setenv('SPECULATIVE_MIN_HISTORY', '2')
+        analyzer = GPTAnalyzer()
+        analyzer.client = analyzer.client.with_options(base_url=server.base_url)
+        return SpeculativePrefetcher(analyzer)
+
+    @pytest.mark.asyncio
+    async def test_button_uses_prefetched_answer(self, server, prefetcher):
+        """Нажатие кнопки забирает уже запущенный анализ, второго запроса нет"""
+        user_id = random.randint(1, 10 ** 9)
+        photo, file_unique_id = make_photo(), uuid.uuid4().hex
+        prefetcher.on_photo(user_id, loader(photo), file_unique_id, caption="паста")
+
+        prefetcher.record_choice(user_id, "nutrition")
+        result = await prefetcher.analyzer.analyze_food_image(user_id, photo, "nutrition", "паста", file_unique_id=file_unique_id)
+        prefetcher.resolve(user_id)
+
+        assert server.stats["requests"] == 1
+        assert result["messages_left"] == 4
+        assert prefetcher.get_stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_unused_prefetch_counted_as_waste(self, server, prefetcher):
+        """Выбран рецепт - упреждающий анализ впустую, а частые рецепты выключают его"""
+        user_id = random.randint(1, 10 ** 9)
+        for _ in range(2):
+            photo, file_unique_id = make_photo(), uuid.uuid4().hex
+            prefetcher.on_photo(user_id, loader(photo), file_unique_id)
+            prefetcher.record_choice(user_id, "recipe")
+            await prefetcher.analyzer.analyze_food_image(user_id, photo, "recipe", file_unique_id=file_unique_id)
+            prefetcher.resolve(user_id)
+            prefetcher.analyzer.end_session(user_id)
+
+        stats = prefetcher.get_stats()
+        assert stats["wasted"] == 2
+        assert stats["waste_ratio"] == 1.0
+        assert prefetcher.choice_rate(user_id) == 0.0
+
+        prefetcher.on_photo(user_id, loader(make_photo()), uuid.uuid4().hex)
+        assert prefetcher.get_stats()["skipped"] == 1
+        assert prefetcher.get_stats()["preprocessed"] == 3
+
+    @pytest.mark.asyncio
+    async def test_failed_prefetch_counted_as_waste(self, server, prefetcher, monkeypatch):
+        """Неудачный упреждающий анализ - не попадание: кнопка делает обычный запрос"""
+        async def failed_analysis(*args):
+            return None
+        monkeypatch.setattr(prefetcher.analyzer, "_speculative_analysis", failed_analysis)
+
+        user_id = random.randint(1, 10 ** 9)
+        photo, file_unique_id = make_photo(), uuid.uuid4().hex
+        prefetcher.on_photo(user_id, loader(photo), file_unique_id)
+        prefetcher.record_choice(user_id, "nutrition")
+        await prefetcher.analyzer.analyze_food_image(user_id, photo, "nutrition", file_unique_id=file_unique_id)
+        prefetcher.resolve(user_id)
+
+        assert server.stats["requests"] == 1
+        stats = prefetcher.get_stats()
+        assert stats["hits"] == 0
+        assert stats["wasted"] == 1
+
+    @pytest.mark.asyncio
+    async def test_abandoned_photos_expire(self, server, prefetcher):
+        """Фото без нажатия кнопки через ttl закрываются: анализ отменен, словари пусты"""
+        prefetcher.ttl = 0
+        user_ids = [random.randint(1, 10 ** 9) for _ in range(3)]
+        for user_id in user_ids:
+            prefetcher.on_photo(user_id, loader(make_photo()), uuid.uuid4().hex)
+        prefetcher.max_users = 2
+
+        prefetcher.expire(force=True)
+
+        stats = prefetcher.get_stats()
+        assert stats["wasted"] == 3
+        assert stats["pending"] == 0
+        assert stats["tracked_users"] == 2
+        assert not prefetcher._awaiting_choice
+        assert not prefetcher.analyzer._speculative
@@ -0,0 +1,63 @@
+# tests/test_telegram_files.py
+import asyncio
+import io
+import pytest
+from types import SimpleNamespace
+from aiohttp import ClientResponseError
+from app.services.telegram_files import TelegramFiles
+
+
+class FakeBot:
+    """Бот с версионными путями файлов: старый путь можно "просрочить" """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.version = 0
+        self.get_file_calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def get_file(self, file_id):
+        self.get_file_calls += 1
+        return SimpleNamespace(file_path=f"photos/{file_id}_{self.version}.jpg")
+
+    async def download_file(self, file_path, destination=None, seek=True):
+        if not file_path.endswith(f"_{self.version}.jpg"):
+            raise ClientResponseError(None, (), status=404)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        destination = destination or io.BytesIO()
+        destination.write(file_path.encode())
+        return destination
+
+
+class TestTelegramFiles:
+    """Тесты скачивания файлов из Telegram"""
+
+    @pytest.mark.asyncio
+    async def test_file_path_cached_and_refreshed(self, monkeypatch):
+        """Путь запрашивается один раз, устаревший - заново"""
+        files = TelegramFiles()
+        bot = FakeBot()
+        await files.download(bot, "file-1")
+        await files.download(bot, "file-1")
+        assert bot.get_file_calls == 1
+        assert files.stats["path_hits"] == 1
+
+        bot.version = 1
+        result = await files.download(bot, "file-1")
+        assert result.getvalue() == b"photos/file-1_1.jpg"
+        assert bot.get_file_calls == 2
+        assert files.stats["path_expired"] == 1
+
+    @pytest.mark.asyncio
+    async def test_shared_download_limit(self, monkeypatch):
+        """Одновременных скачиваний не больше лимита"""
+        monkeypatch.setenv('TELEGRAM_MAX_CONCURRENT_DOWNLOADS', '2')
+        files = TelegramFiles()
+        bot = FakeBot(delay=0.02)
+        await asyncio.gather(*(files.download(bot, f"file-{index}") for index in range(6)))
+        assert bot.max_active == 2
+        assert files.stats["downloads"] == 6
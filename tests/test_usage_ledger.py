@@ -0,0 +1,127 @@
+# tests/test_usage_ledger.py
+import pytest
+from app.services.usage_ledger import UsageLedger, USAGE_COLUMNS
+from app.utils.tokens import estimate_image_tokens
+
+
+class FakeDatabase:
+    """Таблица usage_ledger в памяти"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+
+    async def insert_usage_records(self, records):
+        if self.fail:
+            raise ConnectionError("БД недоступна")
+        self.batches.append(records)
+
+
+def record(ledger, **overrides):
+    values = dict(
+        user_id=1, analysis_type="nutrition", turn=1, model="gpt-4o-mini", tier="fast",
+        prompt_tokens=1000, completion_tokens=200, cached_tokens=0, image_tokens=765,
+        latency=1.5, cost=0.001
+    )
+    values.update(overrides)
+    ledger.record(**values)
+
+
+class TestUsageLedger:
+    """Тесты журнала расхода токенов"""
+
+    @pytest.mark.asyncio
+    async def test_summary_in_memory(self):
+        """Без БД агрегаты считаются по записям в памяти"""
+        ledger = UsageLedger()
+        record(ledger)
+        record(ledger, turn=2, image_tokens=85, latency=0.5, cost=0.0005)
+        record(ledger, analysis_type="recipe", cost=0.002)
+
+        rows = await ledger.summary("analysis_type")
+        assert [row["key"] for row in rows] == ["recipe", "nutrition"]
+        nutrition = rows[1]
+        assert nutrition["requests"] == 2
+        assert nutrition["image_tokens"] == 850
+        assert nutrition["cost"] == pytest.approx(0.0015)
+        assert nutrition["avg_latency_ms"] == pytest.approx(1000)
+
+        with pytest.raises(ValueError):
+            await ledger.summary("cost")
+
+    @pytest.mark.asyncio
+    async def test_batched_flush(self, monkeypatch):
+        """Записи уходят в БД пачкой, при ошибке остаются в буфере"""
+        monkeypatch.setenv('USAGE_LEDGER_BATCH_SIZE', '100')
+        database = FakeDatabase(fail=True)
+        ledger = UsageLedger(database)
+        record(ledger)
+        record(ledger, turn=2)
+
+        assert await ledger.flush() == 0
+        assert ledger.get_stats()["pending"] == 2
+
+        database.fail = False
+        assert await ledger.flush() == 2
+        assert len(database.batches) == 1
+        row = dict(zip(USAGE_COLUMNS, database.batches[0][1]))
+        assert row["turn"] == 2
+        assert row["latency_ms"] == 1500
+        assert ledger.get_stats()["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_backs_off(self, monkeypatch):
+        """После ошибки БД новые записи не запускают запись до конца паузы"""
+        monkeypatch.setenv('USAGE_LEDGER_BATCH_SIZE', '1')
+        database = FakeDatabase(fail=True)
+        ledger = UsageLedger(database)
+
+        record(ledger)
+        await ledger._flush_task
+        assert ledger.stats["flush_errors"] == 1
+
+        for turn in range(2, 6):
+            record(ledger, turn=turn)
+            assert not ledger._flushing()
+        assert ledger.stats["flush_errors"] == 1
+        assert ledger.get_stats()["pending"] == 5
+
+        # Пауза растет с каждой неудачей
+        first_backoff = ledger._backoff
+        assert await ledger.flush() == 0
+        assert ledger._backoff == 2 * first_backoff
+
+    @pytest.mark.asyncio
+    async def test_flush_keeps_records_added_during_write(self, monkeypatch):
+        """Удаляются ровно записанные записи, даже если буфер переполнялся во время записи"""
+        monkeypatch.setenv('USAGE_LEDGER_MAX_BUFFER', '2')
+        ledger = UsageLedger()
+
+        class SlowDatabase(FakeDatabase):
+            async def insert_usage_records(self, records):
+                # Во время записи приходят новые вызовы
+                record(ledger, turn=3)
+                record(ledger, turn=4)
+                record(ledger, turn=5)
+                await super().insert_usage_records(records)
+
+        database = SlowDatabase()
+        ledger.database = database
+        record(ledger, turn=1)
+        record(ledger, turn=2)
+
+        assert await ledger.flush() == 2
+        assert [row[3] for row in database.batches[0]] == [1, 2]
+        assert [entry.turn for entry in ledger._buffer] == [4, 5]
+
+    def test_estimate_image_tokens(self):
+        """Картинки в запросе: low - 85 токенов, high - по оценке предобработки"""
+        messages = [
+            {"role": "system", "content": "промт"},
+            {"role": "user", "content": [
+                {"type": "text", "text": "фото"},
+                {"type": "image_url", "image_url": {"url": "data:", "detail": "high"}}
+            ]},
+            {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "data:", "detail": "low"}}]}
+        ]
+        assert estimate_image_tokens(messages, image_tokens=425) == 510